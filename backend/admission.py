@@ -0,0 +1,360 @@
+"""
+Per-instance admission control for upstream Gemini generations
+At most UPSTREAM_MAX_CONCURRENCY generations run at once on an instance. Further
+ones wait in a bounded priority queue - interactive streams ahead of the JSON
+endpoints, batch and background work last - for up to ADMISSION_MAX_WAIT_SECONDS,
+and are refused with Overloaded (a 429 with Retry-After at the endpoints) once
+the queue is full or the wait runs out
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Upstream generations allowed in flight per instance (0 = unlimited)
+UPSTREAM_MAX_CONCURRENCY = int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', '16'))
+# Generations allowed to wait for a slot, and how long each may wait
+ADMISSION_QUEUE_MAX = int(os.environ.get('ADMISSION_QUEUE_MAX', '64'))
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get('ADMISSION_MAX_WAIT_SECONDS', '10'))
+# Slots batch work may never take, so a watchlist run or scan cannot fill the instance
+ADMISSION_INTERACTIVE_RESERVE = int(os.environ.get('ADMISSION_INTERACTIVE_RESERVE', '2'))
+# Assumed generation time for Retry-After until generations have finished on this instance
+ADMISSION_DEFAULT_HOLD_SECONDS = float(os.environ.get('ADMISSION_DEFAULT_HOLD_SECONDS', '8'))
+
+RETRY_AFTER_MAX_SECONDS = 60
+# Weight of each finished generation in the hold-time average
+HOLD_ALPHA = 0.2
+
+INTERACTIVE, STANDARD, BATCH = 0, 1, 2
+PRIORITY_NAMES = ('interactive', 'standard', 'batch')
+
+# Endpoints a user is watching stream in; the rest default to STANDARD
+INTERACTIVE_ENDPOINTS = frozenset(('search_stream', 'trends_stream'))
+
+_local = threading.local()
+
+
+class Overloaded(Exception):
+    """The instance has no upstream slot for this generation; retry_after is in whole seconds"""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(f"Instance at its upstream concurrency limit ({reason}); retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Run the upstream generations this thread starts at level (e.g. BATCH for watchlist queries)"""
+    previous = getattr(_local, 'priority', None)
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def priority_for(endpoint):
+    """This thread's priority if one is set, otherwise the endpoint's default"""
+    level = getattr(_local, 'priority', None)
+    if level is not None:
+        return level
+    return INTERACTIVE if endpoint in INTERACTIVE_ENDPOINTS else STANDARD
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    """One queued generation: a threading.Event, or a future on the caller's event loop"""
+
+    __slots__ = ('level', 'seq', 'state', 'event', 'loop', 'future')
+
+    def __init__(self, level, seq, loop=None):
+        self.level = level
+        self.seq = seq
+        # None while queued, then 'admitted' or the reason it was refused
+        self.state = None
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def __lt__(self, other):
+        return (self.level, self.seq) < (other.level, other.seq)
+
+    def wake(self, state):
+        self.state = state
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+class Limiter:
+    """
+    Counting semaphore over upstream generations with a bounded priority queue.
+    Waiters are admitted strictly by priority, first come first served within one;
+    a full queue makes room for a new waiter by refusing its lowest-priority one.
+    """
+
+    def __init__(self, capacity=UPSTREAM_MAX_CONCURRENCY, queue_max=ADMISSION_QUEUE_MAX,
+                 max_wait=ADMISSION_MAX_WAIT_SECONDS, reserve=ADMISSION_INTERACTIVE_RESERVE):
+        self.capacity = capacity
+        self.queue_max = queue_max
+        self.max_wait = max_wait
+        self.reserve = min(reserve, capacity - 1)
+        self.in_flight = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._hold = ADMISSION_DEFAULT_HOLD_SECONDS
+        self._admitted = [0] * len(PRIORITY_NAMES)
+        self._rejected = [0] * len(PRIORITY_NAMES)
+        self._lock = threading.Lock()
+
+    def _fits(self, level):
+        return self.in_flight < self.capacity - (self.reserve if level == BATCH else 0)
+
+    def _retry_after(self):
+        waves = (len(self._queue) + 1) / self.capacity
+        return min(RETRY_AFTER_MAX_SECONDS, max(1, math.ceil(self._hold * waves)))
+
+    def _enter(self, level, loop=None):
+        """Take a slot (returns None) or queue a waiter (returns it); raises Overloaded when there is no room"""
+        with self._lock:
+            # Queue behind waiters of the same or higher priority
+            if self._fits(level) and not (self._queue and self._queue[0].level <= level):
+                self.in_flight += 1
+                self._record_admitted(level, 0.0)
+                return None
+            if len(self._queue) >= self.queue_max:
+                lowest = max(self._queue) if self._queue else None
+                if lowest is None or lowest.level <= level:
+                    raise self._refuse(level, 'queue_full')
+                self._remove(lowest)
+                self._refuse(lowest.level, 'displaced')
+                lowest.wake('displaced')
+            waiter = _Waiter(level, next(self._seq), loop)
+            heapq.heappush(self._queue, waiter)
+            self._record_depth()
+            return waiter
+
+    def _settle(self, waiter, waited):
+        """After a wait ends: return normally once admitted, raise Overloaded when refused or timed out"""
+        with self._lock:
+            if waiter.state == 'admitted':
+                self._record_admitted(waiter.level, waited)
+                return
+            if waiter.state is None:
+                self._remove(waiter)
+                waiter.state = 'timeout'
+                raise self._refuse(waiter.level, 'timeout')
+            # Displaced waiters were counted when they were refused
+            raise Overloaded(self._retry_after(), waiter.state)
+
+    def _remove(self, waiter):
+        self._queue.remove(waiter)
+        heapq.heapify(self._queue)
+        self._record_depth()
+
+    def _dispatch(self):
+        """Admit queued waiters in priority order while slots are free (lock held)"""
+        while self._queue and self._fits(self._queue[0].level):
+            waiter = heapq.heappop(self._queue)
+            self.in_flight += 1
+            waiter.wake('admitted')
+        self._record_depth()
+
+    def _timeout(self, deadline):
+        timeout = self.max_wait
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        return max(0.0, timeout)
+
+    def acquire(self, level, deadline=None):
+        """Block until a slot is free, waiting at most max_wait (or until deadline, a time.monotonic() value)"""
+        waiter = self._enter(level)
+        if waiter is None:
+            return
+        started = time.monotonic()
+        waiter.event.wait(self._timeout(deadline))
+        self._settle(waiter, time.monotonic() - started)
+
+    async def aacquire(self, level, deadline=None):
+        """Async counterpart of acquire; the event loop keeps running while this waits"""
+        waiter = self._enter(level, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self._timeout(deadline))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.state == 'admitted':
+                    self._release(0.0)
+                elif waiter.state is None:
+                    self._remove(waiter)
+                    waiter.state = 'cancelled'
+            raise
+        self._settle(waiter, time.monotonic() - started)
+
+    def release(self, held):
+        """Give back a slot held for held seconds and admit the next waiter"""
+        with self._lock:
+            self._release(held)
+
+    def _release(self, held):
+        self.in_flight -= 1
+        if held > 0:
+            self._hold += HOLD_ALPHA * (held - self._hold)
+        self._dispatch()
+
+    @contextlib.contextmanager
+    def slot(self, level, deadline=None):
+        self.acquire(level, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, level, deadline=None):
+        await self.aacquire(level, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def rejection(self, level):
+        """Retry-After seconds if a generation at level would be refused outright right now, else None"""
+        with self._lock:
+            if self._fits(level) and not (self._queue and self._queue[0].level <= level):
+                return None
+            if len(self._queue) < self.queue_max or (self._queue and max(self._queue).level > level):
+                return None
+            return self._retry_after()
+
+    def _refuse(self, level, reason):
+        self._rejected[level] += 1
+        if metrics.METRICS_ENABLED:
+            metrics.registry.inc('fda_admission_rejected_total', help_text='Upstream generations refused a slot',
+                                 priority=PRIORITY_NAMES[level], reason=reason)
+        return Overloaded(self._retry_after(), reason)
+
+    def _record_admitted(self, level, waited):
+        self._admitted[level] += 1
+        if metrics.METRICS_ENABLED:
+            metrics.registry.inc('fda_admission_admitted_total', help_text='Upstream generations given a slot',
+                                 priority=PRIORITY_NAMES[level])
+            metrics.registry.observe('fda_admission_wait_seconds', waited, help_text='Seconds waited for an upstream slot',
+                                     priority=PRIORITY_NAMES[level])
+            metrics.registry.set('fda_admission_in_flight', self.in_flight, help_text='Upstream generations in flight')
+
+    def _record_depth(self):
+        if not metrics.METRICS_ENABLED:
+            return
+        metrics.registry.set('fda_admission_in_flight', self.in_flight, help_text='Upstream generations in flight')
+        depth = [0] * len(PRIORITY_NAMES)
+        for waiter in self._queue:
+            depth[waiter.level] += 1
+        for level, name in enumerate(PRIORITY_NAMES):
+            metrics.registry.set('fda_admission_queue_depth', depth[level], help_text='Generations waiting for an upstream slot',
+                                 priority=name)
+
+    def stats(self):
+        with self._lock:
+            queued = [0] * len(PRIORITY_NAMES)
+            for waiter in self._queue:
+                queued[waiter.level] += 1
+            return {
+                'capacity': self.capacity,
+                'in_flight': self.in_flight,
+                'hold_seconds': round(self._hold, 3),
+                **{field: dict(zip(PRIORITY_NAMES, values))
+                   for field, values in (('queued', queued), ('admitted', self._admitted), ('rejected', self._rejected))},
+            }
+
+
+class NullLimiter:
+    """Admission control switched off (UPSTREAM_MAX_CONCURRENCY=0): every generation runs at once"""
+
+    @contextlib.contextmanager
+    def slot(self, level, deadline=None):
+        yield
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, level, deadline=None):
+        yield
+
+    def rejection(self, level):
+        return None
+
+    def stats(self):
+        return {'capacity': None}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """Return the process-wide limiter shared by every endpoint"""
+    global _limiter
+
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = Limiter() if UPSTREAM_MAX_CONCURRENCY > 0 else NullLimiter()
+    return _limiter
+
+
+def set_limiter(limiter):
+    """Swap the process-wide limiter (e.g. for one with a different capacity)"""
+    global _limiter
+    _limiter = limiter
+
+
+def slot(endpoint, deadline=None):
+    """Context manager holding an upstream slot for one generation on endpoint, at this thread's priority"""
+    return get_limiter().slot(priority_for(endpoint), deadline)
+
+
+def aslot(endpoint, deadline=None):
+    """Async counterpart of slot"""
+    return get_limiter().aslot(priority_for(endpoint), deadline)
+
+
+def rejection(endpoint):
+    """Retry-After seconds if a new generation on endpoint would be refused outright, else None"""
+    return get_limiter().rejection(priority_for(endpoint))
+
+
+def retry_after(error):
+    """
+    Seconds a client should wait before retrying after error: set when this instance
+    refused the generation or the upstream quota is exhausted (HTTP 429), else None
+    """
+    if isinstance(error, Overloaded):
+        return error.retry_after
+    # Only loaded once a live generation has run - see hedge.is_retriable
+    genai_errors = sys.modules.get('google.genai.errors')
+    if genai_errors is not None and isinstance(error, genai_errors.APIError) and error.code == 429:
+        # Vertex AI quotas are per minute
+        return RETRY_AFTER_MAX_SECONDS // 2
+    return None
@@ -0,0 +1,225 @@
+"""
+Server-side aggregation of result/trend events
+Folds parsed records in vectorized NumPy batches into totals, per-severity counts,
+per-state rollups and a weighted hotspot grid, for periodic `aggregate` SSE
+snapshots and the aggregateEvents batch endpoint
+"""
+
+import math
+import os
+
+import numpy as np
+
+from gazetteer import STATE_CODES, US_LAT_RANGE, US_LNG_RANGE, normalize_state
+
+# Hotspot grid resolution in degrees
+AGGREGATE_CELL_DEGREES = float(os.environ.get('AGGREGATE_CELL_DEGREES', '1.0'))
+
+# Emit an aggregate snapshot after this many streamed events
+AGGREGATE_SNAPSHOT_EVERY = int(os.environ.get('AGGREGATE_SNAPSHOT_EVERY', '10'))
+
+# Records buffered before they are folded into the NumPy accumulators
+FOLD_BATCH_SIZE = 256
+
+# Most severe first, so the minimum code in a cell is its worst severity
+SEVERITIES = ('critical', 'high', 'medium', 'low', 'unknown')
+SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITIES)}
+UNKNOWN_SEVERITY = SEVERITY_CODES['unknown']
+
+STATES = tuple(sorted(set(STATE_CODES.values()))) + ('unknown',)
+STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+UNKNOWN_STATE = STATE_INDEX['unknown']
+
+EVENT_TYPES = ('result', 'trend')
+EVENT_TYPE_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+
+
+def _number(value):
+    kind = type(value)
+    if kind is int or kind is float:
+        return value if math.isfinite(value) else 0.0
+    if kind is bool:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else 0.0
+    if isinstance(value, str):
+        try:
+            return float(value.replace(',', '').strip())
+        except ValueError:
+            return 0.0
+    return 0.0
+
+
+def event_record(event):
+    """(event type, record) for an SSE event payload or a bare result/trend record"""
+    if isinstance(event.get('data'), dict):
+        return event.get('type', 'result'), event['data']
+    return ('trend' if 'dma_code' in event or 'query_volume' in event else 'result'), event
+
+
+def record_values(event_type, record):
+    """
+    (event type code, severity code, state code, affected, weight, lat, lng) for a
+    result/trend record - the weight is the map intensity, NaN coordinates when missing
+    """
+    location = record.get('location')
+    if not isinstance(location, dict):
+        location = {}
+    affected = _number(record.get('affected'))
+    if event_type == 'trend':
+        severity = record.get('risk')
+        weight = _number(record.get('query_volume'))
+    else:
+        severity = record.get('severity')
+        # Same default intensity the map uses for incidents without a count
+        weight = affected or 100.0
+    lat, lng = _number(location.get('lat')), _number(location.get('lng'))
+    if not (lat or lng):
+        lat = lng = math.nan
+
+    # Exact matches are the common case; normalize only on a miss
+    severity_code = SEVERITY_CODES.get(severity) if isinstance(severity, str) else None
+    if severity_code is None:
+        severity_code = SEVERITY_CODES.get(str(severity).strip().lower(), UNKNOWN_SEVERITY)
+    state = location.get('state')
+    state_code = STATE_INDEX.get(state) if isinstance(state, str) else None
+    if state_code is None:
+        state_code = STATE_INDEX.get(normalize_state(state), UNKNOWN_STATE)
+
+    return EVENT_TYPE_CODES.get(event_type, 0), severity_code, state_code, affected, weight, lat, lng
+
+
+class StreamAggregator:
+    """
+    Incremental aggregate over result (incident) and trend records.
+    add() only buffers plain Python values; the buffer is folded into the
+    NumPy accumulators every FOLD_BATCH_SIZE records and before each snapshot.
+    """
+
+    def __init__(self, cell_degrees=AGGREGATE_CELL_DEGREES, snapshot_every=AGGREGATE_SNAPSHOT_EVERY):
+        self.cell_degrees = cell_degrees
+        self.snapshot_every = snapshot_every
+        self.rows = math.ceil((US_LAT_RANGE[1] - US_LAT_RANGE[0]) / cell_degrees)
+        self.cols = math.ceil((US_LNG_RANGE[1] - US_LNG_RANGE[0]) / cell_degrees)
+        cells = self.rows * self.cols
+
+        self.total = 0
+        self.by_type = np.zeros(len(EVENT_TYPES), dtype=np.int64)
+        self.by_severity = np.zeros(len(SEVERITIES), dtype=np.int64)
+        self.state_counts = np.zeros(len(STATES), dtype=np.int64)
+        self.state_affected = np.zeros(len(STATES), dtype=np.float64)
+        self.affected = 0.0
+        self.cell_weight = np.zeros(cells, dtype=np.float64)
+        self.cell_count = np.zeros(cells, dtype=np.int64)
+        # Weight-scaled coordinate sums for each cell's weighted centroid
+        self.cell_lat = np.zeros(cells, dtype=np.float64)
+        self.cell_lng = np.zeros(cells, dtype=np.float64)
+        self.cell_centroid_weight = np.zeros(cells, dtype=np.float64)
+        self.cell_severity = np.full(cells, UNKNOWN_SEVERITY, dtype=np.int8)
+
+        self._pending = []
+        self._since_snapshot = 0
+
+    def add(self, event_type, record):
+        """Buffer one parsed result/trend record"""
+        self._pending.append(record_values(event_type, record))
+        self._since_snapshot += 1
+        if len(self._pending) >= FOLD_BATCH_SIZE:
+            self.fold()
+
+    def add_event(self, event):
+        """Buffer an SSE event payload ({'type': 'result'|'trend', 'data': {...}}) or a bare record"""
+        self.add(*event_record(event))
+
+    def fold(self):
+        """Fold buffered records into the accumulators in one vectorized pass"""
+        if not self._pending:
+            return
+        batch = np.array(self._pending, dtype=np.float64)
+        self._pending = []
+
+        types = batch[:, 0].astype(np.intp)
+        severities = batch[:, 1].astype(np.intp)
+        states = batch[:, 2].astype(np.intp)
+        affected, weight, lat, lng = batch[:, 3], batch[:, 4], batch[:, 5], batch[:, 6]
+
+        self.total += len(batch)
+        self.affected += float(affected.sum())
+        self.by_type += np.bincount(types, minlength=len(EVENT_TYPES))
+        self.by_severity += np.bincount(severities, minlength=len(SEVERITIES))
+        self.state_counts += np.bincount(states, minlength=len(STATES))
+        self.state_affected += np.bincount(states, weights=affected, minlength=len(STATES))
+
+        # Hotspot grid over the US bounding box; records without coordinates are skipped
+        rows = np.floor((lat - US_LAT_RANGE[0]) / self.cell_degrees)
+        cols = np.floor((lng - US_LNG_RANGE[0]) / self.cell_degrees)
+        on_grid = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        if not on_grid.any():
+            return
+        cells = rows[on_grid].astype(np.intp) * self.cols + cols[on_grid].astype(np.intp)
+        w = weight[on_grid]
+        size = self.cell_weight.size
+        self.cell_weight += np.bincount(cells, weights=w, minlength=size)
+        self.cell_count += np.bincount(cells, minlength=size)
+        # Centroids are weighted by intensity, falling back to plain means for zero-weight records
+        centroid_w = np.where(w > 0, w, 1e-9)
+        self.cell_lat += np.bincount(cells, weights=lat[on_grid] * centroid_w, minlength=size)
+        self.cell_lng += np.bincount(cells, weights=lng[on_grid] * centroid_w, minlength=size)
+        self.cell_centroid_weight += np.bincount(cells, weights=centroid_w, minlength=size)
+        np.minimum.at(self.cell_severity, cells, severities[on_grid].astype(np.int8))
+
+    def snapshot_due(self):
+        """Whether snapshot_every events have been added since the last snapshot"""
+        return self.snapshot_every > 0 and self._since_snapshot >= self.snapshot_every
+
+    def snapshot(self, top_hotspots=25):
+        """Current aggregate as a JSON-ready dict, with the top_hotspots heaviest cells"""
+        if top_hotspots < 0:
+            # argpartition would wrap a negative count around instead of failing
+            raise ValueError("top_hotspots must be a non-negative integer")
+        self.fold()
+        self._since_snapshot = 0
+
+        states = np.flatnonzero(self.state_counts)
+        states = states[np.argsort(-self.state_affected[states], kind='stable')]
+
+        hotspots = []
+        occupied = np.flatnonzero(self.cell_count)
+        if occupied.size:
+            if occupied.size > top_hotspots:
+                top = np.argpartition(-self.cell_weight[occupied], top_hotspots - 1)[:top_hotspots]
+                occupied = occupied[top]
+            occupied = occupied[np.argsort(-self.cell_weight[occupied], kind='stable')]
+            centroid_weight = self.cell_centroid_weight[occupied]
+            lats = self.cell_lat[occupied] / centroid_weight
+            lngs = self.cell_lng[occupied] / centroid_weight
+            for cell, lat, lng in zip(occupied.tolist(), lats.tolist(), lngs.tolist()):
+                hotspots.append({
+                    'lat': round(lat, 4),
+                    'lng': round(lng, 4),
+                    'weight': round(float(self.cell_weight[cell]), 2),
+                    'count': int(self.cell_count[cell]),
+                    'severity': SEVERITIES[self.cell_severity[cell]],
+                })
+
+        return {
+            'total': self.total,
+            'by_type': {name: int(count) for name, count in zip(EVENT_TYPES, self.by_type)},
+            'affected': int(self.affected),
+            'by_severity': {name: int(count) for name, count in zip(SEVERITIES, self.by_severity)},
+            'by_state': [
+                {'state': STATES[i], 'count': int(self.state_counts[i]), 'affected': int(self.state_affected[i])}
+                for i in states.tolist()
+            ],
+            'hotspots': hotspots,
+            'cell_degrees': self.cell_degrees,
+        }
+
+
+def aggregate_events(events, cell_degrees=AGGREGATE_CELL_DEGREES, top_hotspots=25):
+    """Aggregate a list of SSE event payloads or bare records in one pass"""
+    aggregator = StreamAggregator(cell_degrees=cell_degrees, snapshot_every=0)
+    for event in events:
+        if isinstance(event, dict):
+            aggregator.add_event(event)
+    return aggregator.snapshot(top_hotspots=top_hotspots)
@@ -0,0 +1,141 @@
+"""
+ASGI entry point for the async streaming endpoints
+Serves many open SSE streams from one event loop, e.g.:
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+import admission
+import metrics
+import sse
+from async_stream import asse_stream
+from cache import get_query_cache
+
+logger = logging.getLogger(__name__)
+
+# path -> (stream endpoint, SSE event type, default query)
+ROUTES = {
+    '/searchHealthTrendsStream': ('search_stream', 'result', 'dangerous health trends 2025'),
+    '/getHealthTrendsStream': ('trends_stream', 'trend', 'dangerous health trends'),
+}
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+]
+
+PREFLIGHT_HEADERS = CORS_HEADERS + [
+    (b'access-control-allow-methods', b'POST, GET, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-max-age', b'3600'),
+]
+
+SSE_HEADERS = CORS_HEADERS + [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _read_request(scope, receive, default):
+    """
+    Read the query from a JSON body, falling back to the ?query= parameter,
+    plus the opt-in metrics/aggregate flags, the dedup_session and the
+    max_results/deadline_ms limits from either place (ValueError when malformed)
+    """
+    request_json = None
+    if scope['method'] == 'POST':
+        try:
+            request_json = json.loads(await _read_body(receive) or b'null')
+        except ValueError:
+            request_json = None
+    if not isinstance(request_json, dict):
+        request_json = {}
+
+    params = parse_qs(scope.get('query_string', b'').decode('utf-8'))
+    query = request_json.get('query') or params.get('query', [default])[0] or default
+    flags = {
+        name: bool(request_json.get(name)) or params.get(name, [''])[0] in ('1', 'true')
+        for name in ('metrics', 'aggregate')
+    }
+    flags['dedup_session'] = str(request_json.get('dedup_session') or params.get('dedup_session', [''])[0]) or None
+    for name in ('max_results', 'deadline_ms'):
+        value = request_json.get(name) or params.get(name, [''])[0]
+        flags[name] = int(value) if value else None
+        if flags[name] is not None and flags[name] <= 0:
+            raise ValueError(f"{name} must be a positive integer")
+    return query, flags
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    route = ROUTES.get(scope['path'].rstrip('/'))
+    if route is None:
+        await send({'type': 'http.response.start', 'status': 404, 'headers': CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    # Handle CORS
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': PREFLIGHT_HEADERS})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    endpoint, event_type, default_query = route
+    try:
+        query, flags = await _read_request(scope, receive, default_query)
+    except ValueError as e:
+        await send({'type': 'http.response.start', 'status': 400,
+                    'headers': CORS_HEADERS + [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps({'error': str(e)}).encode('utf-8')})
+        return
+    deadline = time.monotonic() + flags['deadline_ms'] / 1000 if flags['deadline_ms'] else None
+
+    # Refuse up front, before the 200, when a new generation could not even queue for a slot
+    retry_after = admission.rejection(endpoint)
+    if retry_after is not None and get_query_cache().lookup(endpoint, query)[0] is None:
+        await send({'type': 'http.response.start', 'status': 429,
+                    'headers': CORS_HEADERS + [(b'content-type', b'application/json'),
+                                               (b'retry-after', str(retry_after).encode('ascii'))]})
+        await send({'type': 'http.response.body',
+                    'body': json.dumps({'error': 'Too many requests in flight - retry later', 'retry_after': retry_after}).encode('utf-8')})
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+    events = asse_stream(endpoint, event_type, query, metrics.METRICS_ENABLED and flags['metrics'], flags['aggregate'],
+                         flags['dedup_session'], flags['max_results'], deadline)
+    try:
+        async for event in events:
+            await send({'type': 'http.response.body', 'body': sse.frame(event).encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    except OSError as e:
+        logger.info(f"Client disconnected from {scope['path']}: {e}")
+    finally:
+        await events.aclose()
@@ -0,0 +1,216 @@
+"""
+Asyncio-native streaming pipeline for the SSE endpoints
+Upstream chunks from the async genai client -> incremental JSON parse -> SSE frames,
+without holding a thread per open stream. Unlike the sync path, identical
+concurrent queries are not coalesced (the single-flight registry runs producers
+on threads): each stream makes its own upstream call until the first one is cached.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from datetime import datetime
+
+import admission
+import dedup
+import gemini_client
+import hotspots
+import metrics
+import prompts
+import sse
+from aggregate import StreamAggregator
+from cache import get_query_cache
+from coalesce import STOP_POLL_SECONDS
+from event_store import get_event_store
+from gazetteer import resolve_locations
+from json_stream import JsonObjectExtractor
+from timeseries import get_series_store
+
+logger = logging.getLogger(__name__)
+
+# Upstream Gemini streams allowed to run at once per event loop; extra streams wait for a slot
+ASYNC_MAX_STREAMS = int(os.environ.get('ASYNC_MAX_STREAMS', '256'))
+
+_stream_slots = weakref.WeakKeyDictionary()
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_stream_slots():
+    """Semaphore bounding upstream streams, one per running event loop"""
+    loop = asyncio.get_running_loop()
+    slots = _stream_slots.get(loop)
+    if slots is None:
+        slots = _stream_slots[loop] = asyncio.Semaphore(ASYNC_MAX_STREAMS)
+    return slots
+
+
+async def astream_objects(endpoint, query, trace=metrics.NULL_TRACE, deadline=None):
+    """
+    Yield each JSON object parsed from an async Gemini stream, as soon as it closes;
+    deadline (time.monotonic()) bounds the wait for a slot and the upstream call
+    """
+    extractor = JsonObjectExtractor()
+    event_store = get_event_store()
+    series_store = get_series_store()
+    try:
+        async with _get_stream_slots(), admission.aslot(endpoint, deadline):
+            trace.mark('slot_acquired')
+            response_stream = gemini_client.agenerate_content_stream(endpoint, prompts.build_prompt(endpoint, query),
+                                                                     deadline)
+            async for chunk in response_stream:
+                texts = gemini_client.chunk_text(chunk)
+                trace.chunk(chunk, texts)
+                for text in texts:
+                    for obj in extractor.feed(text):
+                        obj = resolve_locations(obj)
+                        hotspots.observe(endpoint, query, obj)
+                        event_store.record(endpoint, query, obj)
+                        series_store.observe(endpoint, query, obj)
+                        yield obj
+    finally:
+        trace.parse_failures = extractor.decode_errors
+
+
+async def acached_stream_objects(endpoint, query, trace=metrics.NULL_TRACE, deadline=None):
+    """Async counterpart of the cached object stream used by the sync endpoints"""
+    query_cache = get_query_cache()
+    cached_objects, fresh = query_cache.lookup(endpoint, query)
+    if cached_objects is not None:
+        trace.source = 'cache'
+        if not fresh:
+            query_cache.refresh_async(endpoint, query, lambda: list(iterate_sync(astream_objects(endpoint, query))))
+        for obj in cached_objects:
+            yield obj
+        return
+
+    collected = []
+    async for obj in astream_objects(endpoint, query, trace, deadline):
+        collected.append(obj)
+        yield obj
+
+    if collected:
+        query_cache.set(endpoint, query, collected)
+
+
+def _aggregate_event(aggregator, final=False):
+    return {'type': 'aggregate', 'final': final, 'data': aggregator.snapshot(), 'timestamp': datetime.now().isoformat()}
+
+
+async def asse_stream(endpoint, event_type, query, include_metrics=False, include_aggregate=False, dedup_session=None,
+                      max_results=None, deadline=None):
+    """
+    Async generator of SSE events (dicts) in the same format as the sync streaming endpoints,
+    stopping after max_results events or at deadline (a time.monotonic() value)
+    """
+    trace = metrics.start_trace(endpoint)
+    aggregator = StreamAggregator() if include_aggregate else None
+    index = dedup.get_index(dedup_session)
+    objects = acached_stream_objects(endpoint, query, trace, deadline)
+    try:
+        # Send initial connection event
+        yield {'type': 'connected', 'timestamp': datetime.now().isoformat()}
+
+        result_count = 0
+        duplicates = 0
+        stopped = None
+        while True:
+            try:
+                if deadline is None:
+                    result = await objects.__anext__()
+                else:
+                    result = await asyncio.wait_for(objects.__anext__(), max(0.0, deadline - time.monotonic()))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                stopped = 'deadline'
+                break
+            trace.object()
+            if index is not None and index.add(event_type, result) is not None:
+                duplicates += 1
+                continue
+            result_count += 1
+            event_data = {
+                'type': event_type,
+                'index': result_count,
+                'data': result,
+                'timestamp': datetime.now().isoformat()
+            }
+            yield event_data
+
+            if aggregator is not None:
+                aggregator.add(event_type, result)
+                if aggregator.snapshot_due():
+                    yield _aggregate_event(aggregator)
+
+            if max_results is not None and result_count >= max_results:
+                stopped = 'max_results'
+                break
+
+        # Stop the upstream stream before the closing frames
+        await objects.aclose()
+
+        if aggregator is not None:
+            yield _aggregate_event(aggregator, final=True)
+
+        # Send completion event
+        yield {'type': 'complete', 'total': result_count, 'duplicates': duplicates, 'stopped': stopped, 'timestamp': datetime.now().isoformat()}
+
+        trace.duplicates = duplicates
+        trace.finish()
+        if include_metrics:
+            yield {'type': 'metrics', 'metrics': trace.summary()}
+
+    except Exception as e:
+        logger.error(f"Error in async {endpoint} streaming: {e}")
+        trace.finish(e)
+        yield sse.error_event(e)
+    finally:
+        # Closing on disconnect cancels the upstream request outright
+        await objects.aclose()
+        trace.finish()
+
+
+def get_loop():
+    """Return the shared background event loop used by the sync adapters, starting it on first use"""
+    global _loop
+
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-stream-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def iterate_sync(agen, stop=None):
+    """
+    Drive an async generator on the shared loop from synchronous code (e.g. a Flask response),
+    ending early - without waiting for its next item - once the stop event is set
+    """
+    loop = get_loop()
+    try:
+        while True:
+            step = asyncio.run_coroutine_threadsafe(agen.__anext__(), loop)
+            while True:
+                try:
+                    item = step.result(None if stop is None else STOP_POLL_SECONDS)
+                    break
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    if step.done():
+                        # Raised by the generator itself (e.g. hedge.DeadlineExceeded), not the poll
+                        raise
+                    if stop.is_set():
+                        # Cancelling the pending step cancels the upstream request with it
+                        step.cancel()
+                        return
+            yield item
+    finally:
+        # Closing the async generator also closes the upstream Gemini stream
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop)
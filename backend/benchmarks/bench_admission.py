@@ -0,0 +1,128 @@
+"""
+Upstream admission control under a burst: latency, refusals and upstream load
+
+A batch of --batch background generations (a watchlist run) lands at once, then
+--interactive stream requests arrive over the next --spread-ms. The synthetic
+upstream slows down once more than --knee streams run at once, as a shared
+quota does. The burst runs once with no limit and once through a Limiter
+(--capacity slots, --queue waiters, --max-wait-ms). Reports per priority class
+the time to first chunk and to completion, how many were refused, and the peak
+number of upstream streams. Hedging is off so each generation is one call.
+
+Usage:
+    python benchmarks/bench_admission.py --batch 64 --interactive 64 --capacity 16
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import admission
+import gemini_client
+import hedge
+from model_backend import SyntheticBackend, make_chunk
+
+
+class CongestedBackend(SyntheticBackend):
+    """Synthetic upstream whose chunks slow down in proportion to the streams running beyond knee"""
+
+    def __init__(self, knee, **kwargs):
+        super().__init__(**kwargs)
+        self.knee = knee
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_content_stream(self, endpoint, prompt):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            for delay, text in self._pieces(endpoint, prompt):
+                time.sleep(delay * max(1.0, self.active / self.knee))
+                yield make_chunk(text)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda p: round(values[min(len(values) - 1, int(len(values) * p / 100))], 3)
+    return {'p50': pick(50), 'p95': pick(95)}
+
+
+def call(endpoint, level, outcomes):
+    start = time.perf_counter()
+    first = None
+    try:
+        with admission.priority(level):
+            for _ in gemini_client.generate_content_stream(endpoint, 'burst'):
+                if first is None:
+                    first = time.perf_counter() - start
+        outcomes.append((level, first, time.perf_counter() - start, None))
+    except admission.Overloaded as e:
+        outcomes.append((level, None, time.perf_counter() - start, e.reason))
+
+
+def run(args, limited):
+    backend = CongestedBackend(args.knee, first_chunk_delay=args.first_chunk_ms / 1000, chunk_delay=args.chunk_ms / 1000)
+    gemini_client.set_backend(backend)
+    admission.set_limiter(admission.Limiter(args.capacity, args.queue, args.max_wait_ms / 1000) if limited
+                          else admission.NullLimiter())
+    outcomes = []
+    threads = [threading.Thread(target=call, args=('search', admission.BATCH, outcomes)) for _ in range(args.batch)]
+    for thread in threads:
+        thread.start()
+    for i in range(args.interactive):
+        time.sleep(args.spread_ms / 1000 / max(1, args.interactive))
+        thread = threading.Thread(target=call, args=('search_stream', admission.INTERACTIVE, outcomes))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    for level in (admission.INTERACTIVE, admission.BATCH):
+        mine = [outcome for outcome in outcomes if outcome[0] == level]
+        ok = [(first, total) for _, first, total, reason in mine if reason is None]
+        refused = [total for *_, total, reason in mine if reason is not None]
+        print(json.dumps({
+            'limiter': f"{args.capacity} slots" if limited else 'none',
+            'priority': admission.PRIORITY_NAMES[level],
+            'requests': len(mine),
+            'completed': len(ok),
+            'refused': len(refused),
+            'refusal_ms_p95': round(percentiles(refused)['p95'] * 1000, 1) if refused else None,
+            'first_chunk_s': percentiles([first for first, _ in ok]),
+            'complete_s': percentiles([total for _, total in ok]),
+            'peak_upstream_streams': backend.peak,
+        }), flush=True)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--interactive', type=int, default=64)
+    parser.add_argument('--spread-ms', type=float, default=500.0)
+    parser.add_argument('--capacity', type=int, default=16)
+    parser.add_argument('--queue', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5000.0)
+    parser.add_argument('--knee', type=int, default=16, help='upstream streams before every stream slows down')
+    parser.add_argument('--first-chunk-ms', type=float, default=200.0)
+    parser.add_argument('--chunk-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    hedge.HEDGE_ENABLED = False
+    for limited in (False, True):
+        run(args, limited)
+
+
+if __name__ == '__main__':
+    cli()
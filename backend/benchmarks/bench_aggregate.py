@@ -0,0 +1,107 @@
+"""
+Server-side aggregator cost against recomputing a pure-Python fold over every event
+(the shape of the client-side aggregation it replaces, which reruns on each render)
+
+Reports ingest throughput of both folds and the per-snapshot cost: the aggregator's
+snapshot over already-folded data versus a full recompute over all events.
+
+Usage:
+    python benchmarks/bench_aggregate.py --sizes 1000,100000,1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregate import StreamAggregator
+from model_backend import SEVERITIES, SYNTHETIC_CITIES
+
+
+def make_events(count, seed):
+    rng = random.Random(seed)
+    events = []
+    for i in range(count):
+        city, state, dma, lat, lng = rng.choice(SYNTHETIC_CITIES)
+        location = {'city': city, 'state': state, 'lat': lat + rng.uniform(-1, 1), 'lng': lng + rng.uniform(-1, 1)}
+        if i % 2:
+            events.append(('trend', {'dma_code': dma, 'location': location, 'query_volume': rng.randint(0, 1000),
+                                     'risk': rng.choice(SEVERITIES), 'affected': rng.randint(100, 1000000)}))
+        else:
+            events.append(('result', {'title': f"Incident {i}", 'severity': rng.choice(SEVERITIES),
+                                      'location': location, 'affected': rng.randint(1, 5000)}))
+    return events
+
+
+def python_fold(events):
+    """Dict-based fold, one event at a time"""
+    totals = {'total': 0, 'affected': 0}
+    by_severity = defaultdict(int)
+    by_state = defaultdict(lambda: [0, 0])
+    cells = defaultdict(lambda: [0.0, 0])
+    for event_type, record in events:
+        severity = record.get('severity') if event_type == 'result' else record.get('risk')
+        affected = record.get('affected') or 0
+        location = record.get('location') or {}
+        totals['total'] += 1
+        totals['affected'] += affected
+        by_severity[severity] += 1
+        by_state[location.get('state')][0] += 1
+        by_state[location.get('state')][1] += affected
+        weight = record.get('query_volume', 0) if event_type == 'trend' else (affected or 100)
+        cell = cells[(int(location['lat'] // 1), int(location['lng'] // 1))]
+        cell[0] += weight
+        cell[1] += 1
+    top = sorted(cells.items(), key=lambda item: -item[1][0])[:25]
+    return totals, by_severity, by_state, top
+
+
+def numpy_fold(events):
+    aggregator = StreamAggregator(snapshot_every=0)
+    for event_type, record in events:
+        aggregator.add(event_type, record)
+    return aggregator.snapshot()
+
+
+def timed(func, events):
+    start = time.perf_counter()
+    func(events)
+    return time.perf_counter() - start
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        events = make_events(size, args.seed)
+        python_s = timed(python_fold, events)
+        numpy_s = timed(numpy_fold, events)
+
+        # Snapshot cost after the data is folded, as paid by each periodic SSE snapshot
+        aggregator = StreamAggregator(snapshot_every=0)
+        for event_type, record in events:
+            aggregator.add(event_type, record)
+        aggregator.fold()
+        start = time.perf_counter()
+        aggregator.snapshot()
+        snapshot_ms = (time.perf_counter() - start) * 1000
+
+        print(json.dumps({
+            'events': size,
+            'python_events_per_s': round(size / python_s),
+            'aggregator_events_per_s': round(size / numpy_s),
+            'recompute_ms': round(python_s * 1000, 3),
+            'snapshot_ms': round(snapshot_ms, 3),
+        }), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,99 @@
+"""
+Per-request Gemini setup cost: fresh client + config per call vs the shared
+client and prebuilt config registry in gemini_client
+
+The stub client constructs a real genai.Client with a dummy API key (which
+sets up auth and HTTP transports without touching the network) and replaces
+the model call with an empty stream.
+
+Usage: python benchmarks/bench_client_setup.py [--requests 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google import genai
+from google.genai import types
+
+import gemini_client
+
+
+class StubModels:
+    def generate_content_stream(self, model, contents, config):
+        return iter(())
+
+
+class StubClient:
+    def __init__(self):
+        self._client = genai.Client(api_key='offline-benchmark')
+        self.models = StubModels()
+
+
+def legacy_request(prompt):
+    """Setup previously repeated inside every endpoint body"""
+    client = StubClient()
+    contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
+    tools = [types.Tool(google_search=types.GoogleSearch())]
+    config = types.GenerateContentConfig(
+        temperature=0.2,
+        top_p=0.95,
+        max_output_tokens=8192,
+        safety_settings=[
+            types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
+            types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="OFF"),
+            types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
+            types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
+        ],
+        tools=tools,
+        thinking_config=types.ThinkingConfig(thinking_budget=0, include_thoughts=False),
+    )
+    for _ in client.models.generate_content_stream(model=gemini_client.MODEL, contents=contents, config=config):
+        pass
+
+
+def pooled_request(prompt):
+    for _ in gemini_client.generate_content_stream('search_stream', prompt):
+        pass
+
+
+def measure(name, func, requests):
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        func(f"dangerous health trends {i}")
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        'name': name,
+        'requests': requests,
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    gemini_client.set_client_factory(StubClient)
+
+    # The first pooled request pays client creation once; report it separately
+    cold = measure('pooled_first_request', pooled_request, 1)
+    report = [
+        measure('per_request_setup', legacy_request, args.requests),
+        cold,
+        measure('pooled_warm', pooled_request, args.requests),
+    ]
+    for row in report:
+        print(json.dumps(row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Cold-start cost of the Cloud Functions entry module
+
+Each scenario runs in a fresh interpreter, as a new instance would: import main,
+then serve one request and report the import time, the time to the complete
+response, and whether the google-genai SDK was loaded along the way.
+  preflight  - OPTIONS /searchHealthTrends
+  cached     - POST /searchHealthTrends answered from a pre-warmed disk cache
+  uncached   - POST /searchHealthTrends through the synthetic model backend
+With --eager the child imports google.genai before main, as main used to.
+
+Usage:
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ('preflight', 'cached', 'uncached')
+
+
+def child(scenario, eager):
+    """Runs inside the fresh interpreter: print one JSON line of timings"""
+    start = time.perf_counter()
+    if eager:
+        from google import genai  # noqa: F401
+    sys.path.insert(0, BACKEND_DIR)
+    import main
+    imported = time.perf_counter()
+
+    from flask import Flask, request
+    app = Flask(__name__)
+    method = 'OPTIONS' if scenario == 'preflight' else 'POST'
+    with app.test_request_context('/', method=method, json={'query': 'cold start benchmark'}):
+        response = main.searchHealthTrends(request)
+    status = response[1] if isinstance(response, tuple) else response.status_code
+    done = time.perf_counter()
+    print(json.dumps({
+        'import_ms': (imported - start) * 1000,
+        'first_response_ms': (done - start) * 1000,
+        'status': status,
+        'google_genai_loaded': 'google.genai' in sys.modules,
+    }), flush=True)
+
+
+def spawn(scenario, eager, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', scenario] + (['--eager'] if eager else []),
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process_ms'] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--eager', action='store_true', help='import google.genai up front (the old behavior)')
+    parser.add_argument('--child', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.eager)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, MODEL_BACKEND='synthetic', CACHE_BACKEND='disk', CACHE_DIR=os.path.join(tmp, 'cache'),
+                   EVENT_STORE='off', METRICS_ENABLED='0')
+        # Fills the disk cache that the cached scenario reads
+        spawn('uncached', False, env)
+        for scenario in SCENARIOS:
+            scenario_env = env if scenario == 'cached' else dict(env, CACHE_BACKEND='off')
+            runs = [spawn(scenario, args.eager, scenario_env) for _ in range(args.runs)]
+            print(json.dumps({
+                'scenario': scenario,
+                'eager_sdk_import': args.eager,
+                'status': runs[-1]['status'],
+                'google_genai_loaded': runs[-1]['google_genai_loaded'],
+                **{f"{field}_p50": round(statistics.median(run[field] for run in runs), 1)
+                   for field in ('import_ms', 'first_response_ms', 'process_ms')},
+            }), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
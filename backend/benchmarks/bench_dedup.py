@@ -0,0 +1,121 @@
+"""
+Per-event cost, memory and accuracy of the cross-source dedup index
+
+Generates incident events in which a known share are re-reports of a recent
+incident (the same URL with tracking parameters, or a reworded headline from
+another outlet in the same city and day) and reports per-event latency, index
+memory, and precision/recall of the duplicates it suppresses.
+
+Usage:
+    python benchmarks/bench_dedup.py --sizes 10000,100000,1000000 --duplicate-rate 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dedup
+from model_backend import SEVERITIES, SYNTHETIC_CITIES
+
+PRODUCTS = (
+    'Benadryl', 'melatonin gummies', 'nitrous oxide', 'kratom', 'eye drops', 'vape cartridges',
+    'energy drinks', 'diet pills', 'tianeptine', 'delta-8 edibles', 'nasal spray', 'cough syrup',
+)
+OUTCOMES = (
+    'sends teens to ER', 'linked to hospitalizations', 'prompts poison control warning',
+    'blamed for overdoses', 'tied to cardiac events', 'leads to school lockdown',
+)
+SOURCES = ('CNN', 'AP', 'Reuters', 'NBC News', 'Local 4', 'Tribune')
+
+
+def _word(rng):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9)))
+
+
+def make_events(count, duplicate_rate, seed, window=1000):
+    """(event type, record, is_duplicate) tuples; duplicates re-report one of the last `window` incidents"""
+    rng = random.Random(seed)
+    originals = []
+    events = []
+    for i in range(count):
+        if originals and rng.random() < duplicate_rate:
+            original = rng.choice(originals[-window:])
+            record = dict(original, source=rng.choice(SOURCES), affected=rng.randint(1, 5000))
+            if rng.random() < 0.5:
+                record['url'] = original['url'].replace('https://', 'https://www.') + '?utm_source=share'
+            else:
+                words = original['title'].split()
+                words.insert(rng.randrange(len(words)), rng.choice(('report:', 'update:', 'local')))
+                record['title'] = ' '.join(words).upper() if rng.random() < 0.2 else ' '.join(words)
+                record['url'] = f"https://news{rng.randint(0, 9)}.example.com/story/{i}"
+            events.append(('result', record, True))
+            continue
+
+        city, state, _, lat, lng = rng.choice(SYNTHETIC_CITIES)
+        record = {
+            'title': f"{rng.choice(PRODUCTS).capitalize()} {_word(rng)} {_word(rng)} {_word(rng)} {rng.choice(OUTCOMES)}",
+            'source': rng.choice(SOURCES),
+            'date': f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'severity': rng.choice(SEVERITIES),
+            'location': {'city': city, 'state': state, 'lat': lat, 'lng': lng},
+            'affected': rng.randint(1, 5000),
+            'url': f"https://example.com/incident/{i}",
+        }
+        originals.append(record)
+        events.append(('result', record, False))
+    return events
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--duplicate-rate', type=float, default=0.2)
+    parser.add_argument('--capacity', type=int, default=dedup.DEDUP_MAX_EVENTS, help='events kept in the index')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        events = make_events(size, args.duplicate_rate, args.seed)
+        index = dedup.DedupIndex(max_events=args.capacity)
+
+        true_positives = false_positives = false_negatives = 0
+        start = time.perf_counter()
+        for event_type, record, is_duplicate in events:
+            flagged = index.add(event_type, record) is not None
+            if flagged and is_duplicate:
+                true_positives += 1
+            elif flagged:
+                false_positives += 1
+            elif is_duplicate:
+                false_negatives += 1
+        elapsed = time.perf_counter() - start
+
+        # Memory of a full index, measured separately so tracing does not skew the timing
+        tracemalloc.start()
+        sized = dedup.DedupIndex(max_events=args.capacity)
+        for event_type, record, _ in events[:args.capacity]:
+            sized.add(event_type, record)
+        index_kb = tracemalloc.get_traced_memory()[0] / 1024
+        tracemalloc.stop()
+
+        flagged = true_positives + false_positives
+        print(json.dumps({
+            'events': size,
+            'capacity': args.capacity,
+            'duplicates_expected': true_positives + false_negatives,
+            'duplicates_flagged': flagged,
+            'precision': round(true_positives / flagged, 4) if flagged else None,
+            'recall': round(true_positives / (true_positives + false_negatives), 4) if true_positives + false_negatives else None,
+            'per_event_us': round(elapsed / size * 1e6, 2),
+            'index_kb': round(index_kb, 1),
+        }), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
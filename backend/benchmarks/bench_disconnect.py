@@ -0,0 +1,91 @@
+"""
+Upstream work left running after a client disconnects or hits a result limit
+
+Opens searchHealthTrendsStream against a synthetic model, reads a few result
+events and closes the response (as the WSGI server does when the client goes
+away), then does the same with max_results and deadline_ms. Reports how many
+upstream chunks were produced after the stop and out of the full response.
+SSE resumption is turned off here; with it on, a disconnected stream keeps
+generating for RESUME_GRACE_SECONDS before it is closed the same way.
+
+Usage:
+    python benchmarks/bench_disconnect.py --results 50 --stop-after 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request
+
+import cache
+import event_store
+import gemini_client
+import main
+import resume
+from model_backend import SyntheticBackend
+
+
+class ProbeBackend(SyntheticBackend):
+    """Synthetic backend that counts chunks produced and notes when its iterator is closed"""
+
+    produced = 0
+    closed_at = None
+
+    def generate_content_stream(self, endpoint, prompt):
+        self.produced, self.closed_at = 0, None
+        try:
+            for chunk in super().generate_content_stream(endpoint, prompt):
+                self.produced += 1
+                yield chunk
+        finally:
+            self.closed_at = self.produced
+
+
+def stop(app, backend, query, body, stop_after=None):
+    with app.test_request_context('/', method='POST', json={'query': query, **body}):
+        response = main.searchHealthTrendsStream(request)
+    results = 0
+    start = time.perf_counter()
+    for frame in response.response:
+        results += '"type": "result"' in frame
+        if stop_after is not None and results >= stop_after:
+            break
+    produced_at_stop = backend.produced
+    response.close()
+    while backend.closed_at is None and time.perf_counter() - start < 10:
+        time.sleep(0.005)
+    return {
+        'mode': 'disconnect' if stop_after is not None else next(iter(body)),
+        'results_sent': results,
+        'chunks_at_stop': produced_at_stop,
+        'chunks_after_stop': backend.closed_at - produced_at_stop,
+        'chunks_full_response': -(-len(backend.render('search_stream', query)) // backend.chunk_size),
+    }
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--results', type=int, default=50)
+    parser.add_argument('--stop-after', type=int, default=3)
+    parser.add_argument('--chunk-ms', type=float, default=10.0)
+    args = parser.parse_args()
+
+    cache.set_query_cache(cache.NullCache())
+    event_store.set_event_store(event_store.NullEventStore())
+    resume.SSE_RESUME = False
+    backend = ProbeBackend(results=args.results, chunk_delay=args.chunk_ms / 1000)
+    gemini_client.set_backend(backend)
+    app = Flask(__name__)
+
+    print(json.dumps(stop(app, backend, 'disconnect', {}, args.stop_after)), flush=True)
+    print(json.dumps(stop(app, backend, 'max results', {'max_results': args.stop_after})), flush=True)
+    print(json.dumps(stop(app, backend, 'deadline', {'deadline_ms': int(20 * args.chunk_ms)})), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,257 @@
+"""
+End-to-end latency benchmark for the HTTP functions against a local stand-in model
+
+Runs each scenario through the Flask request path at several concurrency levels
+and reports time to `connected`, time to first result/trend event, inter-event
+gaps, total duration, events per second, peak RSS and CPU time spent parsing
+and serializing. Each scenario/concurrency runs in its own child process, so its
+peak RSS is its own. Output is one JSON object per scenario/concurrency so runs
+can be diffed between commits.
+
+Usage:
+    python benchmarks/bench_e2e.py --concurrency 1,8,32 --output before.json
+    MODEL_BACKEND=replay python benchmarks/bench_e2e.py --backend env
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request
+
+import cache
+import gemini_client
+import json_stream
+import main
+import sse
+from model_backend import SyntheticBackend
+
+# name -> (HTTP function, streaming?)
+SCENARIOS = {
+    'search_stream': (main.searchHealthTrendsStream, True),
+    'trends_stream': (main.getHealthTrendsStream, True),
+    'scan_stream': (main.healthScanStream, True),
+    'search': (main.searchHealthTrends, False),
+    'trends': (main.getHealthTrends, False),
+}
+
+# CPU seconds spent in parsing / serialization, summed over every thread (including
+# the coalescing and combined-scan worker threads)
+_cpu = {'parse': 0.0, 'serialize': 0.0}
+_cpu_lock = threading.Lock()
+
+
+def _timed(func, bucket):
+    """Wrap func so the CPU time its calling thread spends inside it accumulates in bucket"""
+    def wrapper(*args, **kwargs):
+        start = time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.thread_time() - start
+            with _cpu_lock:
+                _cpu[bucket] += elapsed
+    return wrapper
+
+
+# (owner, attribute, bucket): the extractor, the SSE encoders (default and compact)
+# and the JSON responses of the non-streaming functions. Only these module-level
+# names are patched, so json.dumps calls elsewhere (event store, cache, metrics)
+# are not counted
+CPU_PROBES = (
+    (json_stream.JsonObjectExtractor, 'feed', 'parse'),
+    (sse, 'frame', 'serialize'),
+    (sse, 'dumps', 'serialize'),
+    (main, 'jsonify', 'serialize'),
+)
+
+
+@contextlib.contextmanager
+def cpu_probes():
+    """Time parsing and serialization while the block runs, restoring the originals afterwards"""
+    originals = [(owner, name, getattr(owner, name)) for owner, name, _ in CPU_PROBES]
+    for owner, name, bucket in CPU_PROBES:
+        setattr(owner, name, _timed(getattr(owner, name), bucket))
+    try:
+        yield
+    finally:
+        for owner, name, original in originals:
+            setattr(owner, name, original)
+
+
+def build_app():
+    app = Flask(__name__)
+    for name, (func, _) in SCENARIOS.items():
+        app.add_url_rule(f"/{name}", name, lambda func=func: func(request), methods=['GET', 'POST'])
+    return app
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def run_request(client, name, streaming, query):
+    """One request; returns its timeline in seconds relative to the request start"""
+    start = time.perf_counter()
+    connected = first_event = None
+    event_times = []
+
+    if streaming:
+        response = client.get(f"/{name}", query_string={'query': query}, buffered=False)
+        for frame in response.response:
+            now = time.perf_counter() - start
+            text = frame.decode('utf-8') if isinstance(frame, bytes) else frame
+            # Frames may carry an id: line before their data: line
+            data = next((line[6:] for line in text.split('\n') if line.startswith('data: ')), None)
+            if data is None:
+                continue
+            event = json.loads(data)
+            if event['type'] == 'connected' and connected is None:
+                connected = now
+            elif event['type'] in ('result', 'trend'):
+                first_event = first_event if first_event is not None else now
+                event_times.append(now)
+        response.close()
+    else:
+        response = client.post(f"/{name}", json={'query': query})
+        now = time.perf_counter() - start
+        connected = first_event = now
+        event_times = [now] * len(response.get_json().get('results', []))
+
+    return {
+        'connected': connected,
+        'first_event': first_event,
+        'event_times': event_times,
+        'total': time.perf_counter() - start,
+    }
+
+
+def run_scenario(app, name, streaming, concurrency, requests_per_worker, same_query):
+    timelines = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        client = app.test_client()
+        for i in range(requests_per_worker):
+            query = 'benchmark query' if same_query else f"benchmark query {worker_id}-{i}"
+            timeline = run_request(client, name, streaming, query)
+            with lock:
+                timelines.append(timeline)
+
+    with _cpu_lock:
+        _cpu.update(parse=0.0, serialize=0.0)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    gaps = []
+    for timeline in timelines:
+        times = timeline['event_times']
+        gaps.extend(b - a for a, b in zip(times, times[1:]))
+    events = sum(len(t['event_times']) for t in timelines)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    connected = [t['connected'] for t in timelines if t['connected'] is not None]
+    first = [t['first_event'] for t in timelines if t['first_event'] is not None]
+    totals = [t['total'] for t in timelines]
+    return {
+        'scenario': name,
+        'concurrency': concurrency,
+        'requests': len(timelines),
+        'events': events,
+        'connected_p50_ms': ms(percentile(connected, 0.5)),
+        'first_event_p50_ms': ms(percentile(first, 0.5)),
+        'first_event_p95_ms': ms(percentile(first, 0.95)),
+        'gap_mean_ms': ms(statistics.mean(gaps)) if gaps else None,
+        'gap_p95_ms': ms(percentile(gaps, 0.95)),
+        'total_p50_ms': ms(percentile(totals, 0.5)),
+        'total_p95_ms': ms(percentile(totals, 0.95)),
+        'events_per_s': round(events / wall, 1) if wall else None,
+        'wall_s': round(wall, 3),
+        'cpu_s': round(cpu, 3),
+        'parse_cpu_ms': round(_cpu['parse'] * 1000, 2),
+        'serialize_cpu_ms': round(_cpu['serialize'] * 1000, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def spawn(name, concurrency):
+    """Run one scenario/concurrency in a child process with this run's arguments; returns its row"""
+    command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+               '--scenarios', name, '--concurrency', str(concurrency), '--child']
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=4, help='requests per worker')
+    parser.add_argument('--backend', choices=('synthetic', 'env'), default='synthetic',
+                        help='synthetic stand-in, or whatever MODEL_BACKEND selects (e.g. replay)')
+    parser.add_argument('--results', type=int, default=10, help='synthetic objects per response')
+    parser.add_argument('--first-chunk-ms', type=float, default=300.0)
+    parser.add_argument('--chunk-ms', type=float, default=5.0)
+    parser.add_argument('--same-query', action='store_true', help='send one query from every worker (exercises coalescing)')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        cache.set_query_cache(cache.NullCache())
+        if args.backend == 'synthetic':
+            gemini_client.set_backend(SyntheticBackend(
+                results=args.results,
+                first_chunk_delay=args.first_chunk_ms / 1000,
+                chunk_delay=args.chunk_ms / 1000,
+            ))
+        _, streaming = SCENARIOS[args.scenarios]
+        with cpu_probes():
+            row = run_scenario(build_app(), args.scenarios, streaming, int(args.concurrency), args.requests,
+                               args.same_query)
+        print(json.dumps(row), flush=True)
+        return
+
+    rows = []
+    for name in args.scenarios.split(','):
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            row = spawn(name, concurrency)
+            print(json.dumps(row), flush=True)
+            rows.append(row)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'commit': git_commit(), 'args': vars(args), 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,118 @@
+"""
+Early-return parsing for the non-streaming endpoints against draining the stream
+
+Records synthetic search/trends responses with trailing prose after the JSON to
+cassettes, then replays them with their recorded chunk timing through:
+  drain  - the original approach: response_text += part.text for every chunk,
+           then json.loads between the first '{' and the last '}'
+  early  - the pipeline's incremental parse, returning (and closing the
+           upstream stream) as soon as the results/trends object closes
+Reports latency, upstream chunks read and peak traced allocation per call.
+
+Usage:
+    python benchmarks/bench_early_return.py --trailing-sentences 40 --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import event_store
+import gemini_client
+import main
+import prompts
+from model_backend import RecordingBackend, ReplayBackend, SyntheticBackend
+
+
+class CountingReplay(ReplayBackend):
+    """Replay backend that counts the chunks handed out"""
+
+    chunks = 0
+
+    def generate_content_stream(self, endpoint, prompt):
+        for chunk in super().generate_content_stream(endpoint, prompt):
+            self.chunks += 1
+            yield chunk
+
+
+def drain(endpoint, query):
+    """The pre-incremental parse: concatenate every chunk, then slice out the JSON"""
+    response_text = ""
+    for chunk in gemini_client.generate_content_stream(endpoint, prompts.build_prompt(endpoint, query)):
+        if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+            for part in chunk.candidates[0].content.parts:
+                if part.text:
+                    response_text += part.text
+    json_start = response_text.find('{')
+    json_end = response_text.rfind('}') + 1
+    return json.loads(response_text[json_start:json_end])
+
+
+EARLY = {
+    'search': lambda query: main.search_with_gemini.__wrapped__(query),
+    'trends': lambda query: main.simulate_health_trends_with_gemini.__wrapped__(query),
+}
+
+
+def measure(backend, mode, endpoint, query, runs):
+    call = (lambda: drain(endpoint, query)) if mode == 'drain' else (lambda: EARLY[endpoint](query))
+    timings, chunks = [], []
+    for _ in range(runs):
+        backend.chunks = 0
+        start = time.perf_counter()
+        data = call()
+        timings.append(time.perf_counter() - start)
+        chunks.append(backend.chunks)
+    assert data, f"{mode} {endpoint} parsed nothing"
+
+    # Allocation profile of one call, without replay delays
+    latency_scale, backend.latency_scale = backend.latency_scale, 0
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    backend.latency_scale = latency_scale
+    return {
+        'endpoint': endpoint,
+        'mode': mode,
+        'latency_ms_p50': round(statistics.median(timings) * 1000, 1),
+        'upstream_chunks': max(chunks),
+        'peak_alloc_kb': round(peak / 1024, 1),
+    }
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--results', type=int, default=5)
+    parser.add_argument('--trailing-sentences', type=int, default=40)
+    parser.add_argument('--chunk-ms', type=float, default=15.0)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    cache.set_query_cache(cache.NullCache())
+    event_store.set_event_store(event_store.NullEventStore())
+    query = 'benadryl challenge'
+    with tempfile.TemporaryDirectory() as cassette_dir:
+        synthetic = SyntheticBackend(results=args.results, trailing_sentences=args.trailing_sentences,
+                                     chunk_delay=args.chunk_ms / 1000)
+        recorder = RecordingBackend(synthetic, cassette_dir)
+        for endpoint in EARLY:
+            list(recorder.generate_content_stream(endpoint, prompts.build_prompt(endpoint, query)))
+
+        backend = CountingReplay(cassette_dir, latency_scale=1.0)
+        gemini_client.set_backend(backend)
+        for endpoint in EARLY:
+            for mode in ('drain', 'early'):
+                print(json.dumps(measure(backend, mode, endpoint, query, args.runs)), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,95 @@
+"""
+Event store cost on the streaming hot path, background write throughput, and
+indexed query latency as the table grows
+
+Usage:
+    python benchmarks/bench_event_store.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_store import EventStore
+from model_backend import SEVERITIES, SYNTHETIC_CITIES
+
+QUERIES = ('benadryl challenge', 'kratom', 'nitrous oxide', 'melatonin gummies', 'eye drops')
+
+
+def make_records(count, seed):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        city, state, dma, lat, lng = rng.choice(SYNTHETIC_CITIES)
+        location = {'city': city, 'state': state, 'lat': lat, 'lng': lng}
+        if i % 2:
+            records.append(('trends_stream', rng.choice(QUERIES), {
+                'dma_code': dma, 'location': location, 'query_term': f"term {i}",
+                'query_volume': rng.randint(0, 1000), 'risk': rng.choice(SEVERITIES),
+            }))
+        else:
+            records.append(('search_stream', rng.choice(QUERIES), {
+                'title': f"Incident {i}", 'severity': rng.choice(SEVERITIES), 'location': location,
+                'date': f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                'affected': rng.randint(1, 5000), 'url': f"https://example.com/{i}",
+            }))
+    return records
+
+
+def query_ms(store, runs, **kwargs):
+    """(p50, p95) latency of a query in milliseconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        store.query(**kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return round(statistics.median(timings), 3), round(timings[int(len(timings) * 0.95) - 1], 3)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--runs', type=int, default=50, help='repetitions per query')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        records = make_records(size, args.seed)
+        with tempfile.TemporaryDirectory() as directory:
+            store = EventStore(os.path.join(directory, 'events.sqlite3'), max_pending=size)
+
+            # What a stream pays per event: the enqueue only
+            start = time.perf_counter()
+            for endpoint, query, record in records:
+                store.record(endpoint, query, record)
+            record_s = time.perf_counter() - start
+            store.flush()
+            write_s = time.perf_counter() - start
+
+            # Deep page: the cursor of a row halfway back
+            _, cursor = store.query(limit=size // 2)
+            print(json.dumps({
+                'events': size,
+                'record_us': round(record_s / size * 1e6, 3),
+                'writes_per_s': round(size / write_s),
+                'dropped': store.dropped,
+                'db_mb': round(os.path.getsize(store.path) / 1e6, 1),
+                'latest_page_ms': query_ms(store, args.runs, limit=50),
+                'state_ms': query_ms(store, args.runs, filters={'state': 'CA'}, limit=50),
+                'city_severity_ms': query_ms(store, args.runs, filters={'city': 'Chicago', 'severity': 'high'}, limit=50),
+                'query_date_range_ms': query_ms(store, args.runs, filters={
+                    'query': 'kratom', 'date_from': '2025-03-01', 'date_to': '2025-03-31'}, limit=50),
+                'deep_page_ms': query_ms(store, args.runs, filters={'state': 'TX'}, limit=50, cursor=cursor),
+            }), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
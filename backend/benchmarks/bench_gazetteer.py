@@ -0,0 +1,73 @@
+"""
+Load time, memory and lookup latency of the offline gazetteer
+
+Usage:
+    python benchmarks/bench_gazetteer.py --lookups 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gazetteer
+
+
+def per_call_us(func, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return round((time.perf_counter() - start) / len(args_list) * 1e6, 3)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    gaz = gazetteer.Gazetteer(
+        os.path.join(gazetteer.GAZETTEER_DIR, 'us_cities.csv'),
+        os.path.join(gazetteer.GAZETTEER_DIR, 'us_dmas.csv'),
+    )
+    load_ms = (time.perf_counter() - start) * 1000
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(args.seed)
+    indexes = [rng.randrange(len(gaz)) for _ in range(args.lookups)]
+    names = [(gaz.cities[i], gaz.states[i]) for i in indexes]
+    points = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(args.lookups)]
+    near_points = [(gaz.lats[i] + rng.uniform(-0.5, 0.5), gaz.lngs[i] + rng.uniform(-0.5, 0.5)) for i in indexes]
+    locations = [
+        {'city': city, 'state': state, 'lat': 'unknown', 'lng': None} for city, state in names
+    ] + [
+        {'city': city, 'state': state, 'lat': gaz.lats[i] + 3, 'lng': -gaz.lngs[i]}
+        for (city, state), i in zip(names, indexes)
+    ]
+
+    print(json.dumps({
+        'places': len(gaz),
+        'dmas': len(gaz.dmas),
+        'grid_cells': len(gaz._grid),
+        'load_ms': round(load_ms, 2),
+        'resident_kb': round(current / 1024, 1),
+        'peak_kb': round(peak / 1024, 1),
+        'find_us': per_call_us(gaz.find, names),
+        'find_without_state_us': per_call_us(gaz.find, [(city,) for city, _ in names]),
+        'nearest_us': per_call_us(gaz.nearest, points),
+        'nearest_near_place_us': per_call_us(gaz.nearest, near_points),
+        'resolve_location_us': per_call_us(lambda loc: gazetteer.resolve_location(dict(loc), gaz),
+                                           [(loc,) for loc in locations]),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,85 @@
+"""
+Tail latency of upstream calls with and without hedging
+
+Drives generate_content_stream against a synthetic model where a fraction of
+calls stall before their first chunk (and optionally fail), once with hedging
+off and once with it on. Reports p50/p95/p99 time to first chunk and to the
+last chunk, the hedge rate, hedge wins and retries.
+
+Usage:
+    python benchmarks/bench_hedge.py --calls 400 --slow-rate 0.05 --slow-ms 3000
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_client
+import hedge
+from model_backend import SyntheticBackend
+
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda p: round(values[min(len(values) - 1, int(len(values) * p / 100))], 3)
+    return {'p50': pick(50), 'p95': pick(95), 'p99': pick(99)}
+
+
+def call(endpoint, i):
+    start = time.perf_counter()
+    first = None
+    try:
+        for _ in gemini_client.generate_content_stream(endpoint, f"prompt {i}"):
+            if first is None:
+                first = time.perf_counter() - start
+    except Exception as e:
+        return None, None, type(e).__name__
+    return first, time.perf_counter() - start, None
+
+
+def run(args, hedged):
+    hedge.HEDGE_ENABLED = hedged
+    hedge.HEDGE_PERCENTILE = args.percentile
+    hedge._trackers.clear()
+    gemini_client.set_backend(SyntheticBackend(
+        first_chunk_delay=args.first_chunk_ms / 1000, chunk_delay=args.chunk_ms / 1000,
+        slow_rate=args.slow_rate, slow_delay=args.slow_ms / 1000, error_rate=args.error_rate, seed=args.seed,
+    ))
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as executor:
+        outcomes = list(executor.map(lambda i: call('search_stream', i), range(args.calls)))
+    # The first calls only teach the tracker the latency distribution
+    measured = outcomes[hedge.HEDGE_MIN_SAMPLES:]
+    ok = [(first, total) for first, total, error in measured if error is None]
+    return {
+        'hedging': hedged,
+        'first_chunk_s': percentiles([first for first, _ in ok]),
+        'complete_s': percentiles([total for _, total in ok]),
+        'errors': sum(1 for *_, error in measured if error is not None),
+        **hedge.stats()['search_stream'],
+    }
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--first-chunk-ms', type=float, default=200.0)
+    parser.add_argument('--chunk-ms', type=float, default=2.0)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--slow-ms', type=float, default=3000.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--percentile', type=float, default=hedge.HEDGE_PERCENTILE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for hedged in (False, True):
+        print(json.dumps(run(args, hedged)), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
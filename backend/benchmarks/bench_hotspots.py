@@ -0,0 +1,114 @@
+"""
+Hotspot tiles: ingest cost, bbox + zoom query latency and payload size
+
+Feeds N synthetic incidents and trends, placed at bundled gazetteer cities
+(weighted toward the first ones, with a little jitter), into a HotspotIndex, then
+queries a US view at zoom 4, a metro view at zoom 9 and a city view at zoom 12.
+Reports microseconds per ingested event, query latency, features returned and
+the JSON payload against sending the map one point per event (as App.jsx does).
+Dedup is off unless --dedup is given, so the tiling cost is measured alone.
+
+Usage:
+    python benchmarks/bench_hotspots.py --sizes 1000,100000,1000000
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import hotspots
+from aggregate import SEVERITIES
+
+VIEWS = {
+    'us_z4': ((-125.0, 24.0, -66.0, 50.0), 4),
+    'metro_z9': ((-118.9, 33.6, -117.5, 34.4), 9),
+    'city_z12': ((-118.30, 34.00, -118.20, 34.10), 12),
+}
+
+
+def load_cities():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'us_cities.csv')
+    with open(path, newline='') as f:
+        return [(row['city'], row['state'], float(row['lat']), float(row['lng'])) for row in csv.DictReader(f)]
+
+
+def synthetic_records(n, seed=7):
+    rng = np.random.default_rng(seed)
+    cities = load_cities()
+    picks = np.minimum(rng.zipf(1.3, n) - 1, len(cities) - 1)
+    jitter = rng.normal(0, 0.02, (n, 2))
+    severities = rng.integers(0, len(SEVERITIES) - 1, n)
+    volumes = rng.integers(0, 1000, n)
+    records = []
+    for i in range(n):
+        city, state, lat, lng = cities[picks[i]]
+        location = {'city': city, 'state': state, 'lat': lat + jitter[i, 0], 'lng': lng + jitter[i, 1]}
+        if i % 4 == 0:
+            records.append(('trend', {'query_term': 'q', 'location': location, 'risk': SEVERITIES[severities[i]],
+                                      'query_volume': int(volumes[i]), 'affected': int(volumes[i]) * 10}))
+        else:
+            records.append(('result', {'title': f"incident {i}", 'location': location, 'severity': SEVERITIES[severities[i]],
+                                       'affected': int(volumes[i])}))
+    return records
+
+
+def per_event_payload(records):
+    """The point list App.jsx builds today: one hotspot per located event"""
+    return [{
+        'lat': record['location']['lat'],
+        'lng': record['location']['lng'],
+        'intensity': record.get('query_volume') if event_type == 'trend' else record.get('affected') or 100,
+        'city': record['location']['city'],
+        'state': record['location']['state'],
+        'type': 'trend' if event_type == 'trend' else 'incident',
+        'severity': record.get('risk') or record.get('severity'),
+    } for event_type, record in records]
+
+
+def measure(n, use_dedup):
+    records = synthetic_records(n)
+    index = hotspots.HotspotIndex()
+    if not use_dedup:
+        index._dedup = None
+    start = time.perf_counter()
+    for event_type, record in records:
+        index.add(event_type, record)
+    index.flush()
+    ingest = time.perf_counter() - start
+
+    raw_bytes = len(json.dumps(per_event_payload(records)))
+    for view, (bbox, zoom) in VIEWS.items():
+        start = time.perf_counter()
+        result = index.query(bbox=bbox, zoom=zoom)
+        latency = time.perf_counter() - start
+        print(json.dumps({
+            'events': n,
+            'view': view,
+            'ingest_us_per_event': round(ingest / n * 1e6, 2),
+            'query_ms': round(latency * 1000, 2),
+            'features': len(result['features']),
+            'cluster_zoom': result['cluster_zoom'],
+            'events_in_view': result['events_in_view'],
+            'payload_kb': round(len(json.dumps(result)) / 1024, 1),
+            'per_event_payload_kb': round(raw_bytes / 1024, 1),
+        }), flush=True)
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--dedup', action='store_true', help='deduplicate while ingesting, as the live index does')
+    args = parser.parse_args()
+    for n in (int(size) for size in args.sizes.split(',')):
+        measure(n, args.dedup)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,141 @@
+"""
+Microbenchmark for streamed JSON object extraction
+Compares the legacy rescan-and-slice brace counter with JsonObjectExtractor
+on multi-megabyte synthetic Gemini-style streams
+
+Usage: python benchmarks/bench_json_stream.py [--size-mb 4] [--chunk 64]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_stream import JsonObjectExtractor
+
+
+def legacy_extract(chunks):
+    """The brace counter previously inlined in the SSE endpoints"""
+    buffer = ""
+    results = []
+    for text in chunks:
+        buffer += text
+        while True:
+            start_idx = buffer.find('{')
+            if start_idx == -1:
+                break
+            brace_count = 0
+            end_idx = -1
+            for i in range(start_idx, len(buffer)):
+                if buffer[i] == '{':
+                    brace_count += 1
+                elif buffer[i] == '}':
+                    brace_count -= 1
+                    if brace_count == 0:
+                        end_idx = i + 1
+                        break
+            if end_idx == -1:
+                break
+            json_str = buffer[start_idx:end_idx]
+            buffer = buffer[end_idx:]
+            try:
+                results.append(json.loads(json_str))
+            except json.JSONDecodeError:
+                continue
+    return results
+
+
+def extractor_extract(chunks):
+    extractor = JsonObjectExtractor()
+    results = []
+    for text in chunks:
+        results.extend(extractor.feed(text))
+    return results
+
+
+def make_result(rng, i, brace_rate):
+    title = f"Incident {i} reported in local ER"
+    if rng.random() < brace_rate:
+        title += " {see update}"
+    return {
+        'title': title,
+        'source': 'Local News',
+        'date': '2025-06-01',
+        'severity': rng.choice(['critical', 'high', 'medium', 'low']),
+        'summary': 'Patients presented with symptoms after a viral challenge. ' * rng.randint(1, 4),
+        'location': {'state': 'TX', 'city': 'Houston', 'lat': 29.7604, 'lng': -95.3698},
+        'affected': rng.randint(1, 5000),
+        'url': f"https://example.com/news/{i}",
+    }
+
+
+def make_stream(size_bytes, chunk_size, wrapped, brace_rate, seed=0):
+    """Build a synthetic response of roughly size_bytes split into chunk_size pieces"""
+    rng = random.Random(seed)
+    pieces = []
+    total = 0
+    i = 0
+    while total < size_bytes:
+        obj = json.dumps(make_result(rng, i, brace_rate), indent=2)
+        pieces.append(obj)
+        total += len(obj)
+        i += 1
+
+    if wrapped:
+        text = 'Here are the results:\n```json\n{"results": [' + ',\n'.join(pieces) + ']}\n```\nLet me know if you need more.'
+    else:
+        text = 'Here are the results.\n' + '\n\nNext finding:\n'.join(pieces) + '\nDone.'
+
+    return [text[j:j + chunk_size] for j in range(0, len(text), chunk_size)], i
+
+
+def run(name, func, chunks, repeat):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(func(chunks))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'name': name, 'objects': count, 'seconds': round(best, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=4.0)
+    parser.add_argument('--chunk', type=int, default=64, help='characters per streamed chunk')
+    parser.add_argument('--brace-rate', type=float, default=0.2, help='fraction of titles containing braces')
+    parser.add_argument('--legacy-max-mb', type=float, default=0.1,
+                        help='skip the legacy scanner above this size on the wrapped stream (it is quadratic)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    report = []
+    for wrapped in (False, True):
+        chunks, generated = make_stream(size, args.chunk, wrapped, args.brace_rate)
+        scenario = 'wrapped' if wrapped else 'objects'
+        mb = sum(len(c) for c in chunks) / (1024 * 1024)
+
+        row = run('extractor', extractor_extract, chunks, args.repeat)
+        row.update(scenario=scenario, mb=round(mb, 2), mb_per_s=round(mb / row['seconds'], 1))
+        report.append(row)
+
+        legacy_chunks = chunks
+        if wrapped and mb > args.legacy_max_mb:
+            legacy_chunks, _ = make_stream(int(args.legacy_max_mb * 1024 * 1024), args.chunk, wrapped, args.brace_rate)
+        legacy_mb = sum(len(c) for c in legacy_chunks) / (1024 * 1024)
+        row = run('legacy', legacy_extract, legacy_chunks, 1)
+        row.update(scenario=scenario, mb=round(legacy_mb, 2), mb_per_s=round(legacy_mb / row['seconds'], 1))
+        report.append(row)
+
+    for row in report:
+        print(json.dumps(row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+SSE wire size and serialization cost: default frames against the compact format
+
+Captures the events of a synthetic searchHealthTrendsStream / healthScanStream
+response, then renders them repeatedly as:
+  default       - one `data: {json}` frame per event (what App.jsx reads)
+  compact       - header event + batched result/trend deltas (?compact=1)
+  compact+gzip  - compact, gzip-encoded with a sync flush per frame
+Reports bytes on the wire, frames, and CPU microseconds per event.
+
+Usage:
+    python benchmarks/bench_sse_format.py --results 50 --runs 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request
+
+import cache
+import event_store
+import gemini_client
+import main
+import resume
+import sse
+from model_backend import SyntheticBackend
+
+
+def capture(app, endpoint, query):
+    """The events of one default-format response, decoded back to dicts"""
+    with app.test_request_context('/', method='POST', json={'query': query}):
+        response = endpoint(request)
+    return [json.loads(line[len('data: '):]) for frame in response.response
+            for line in frame.split('\n') if line.startswith('data: ')]
+
+
+def measure(events, mode, query, runs):
+    compact = mode != 'default'
+    cpu = 0.0
+    for _ in range(runs):
+        start = time.process_time()
+        frames = list(sse.render(iter(events), compact, query, flush_ms=10_000))
+        body = b''.join(sse.compress(frames, 'gzip')) if mode == 'compact+gzip' else ''.join(frames).encode('utf-8')
+        cpu += time.process_time() - start
+    return {
+        'mode': mode,
+        'events': len(events),
+        'frames': len(frames),
+        'bytes': len(body),
+        'bytes_per_event': round(len(body) / len(events), 1),
+        'cpu_us_per_event': round(cpu / runs / len(events) * 1e6, 1),
+    }
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--results', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    cache.set_query_cache(cache.NullCache())
+    event_store.set_event_store(event_store.NullEventStore())
+    resume.SSE_RESUME = False
+    gemini_client.set_backend(SyntheticBackend(results=args.results, chunk_delay=0))
+    app = Flask(__name__)
+    print(json.dumps({'encoder': 'orjson' if sse.orjson is not None else 'json'}), flush=True)
+    for name, endpoint in (('search_stream', main.searchHealthTrendsStream), ('scan', main.healthScanStream)):
+        query = f"sse format {name}"
+        events = capture(app, endpoint, query)
+        for mode in ('default', 'compact', 'compact+gzip'):
+            print(json.dumps({'stream': name, **measure(events, mode, query, args.runs)}), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
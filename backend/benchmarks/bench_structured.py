@@ -0,0 +1,124 @@
+"""
+Side-by-side report of legacy (JSON scraped from prose) and structured-output (response schema) modes
+
+Runs each endpoint's generation in both modes through the same parse path the
+HTTP functions use and reports prompt/output tokens, time to first parsed
+object, total latency, objects parsed and parse failures. Token counts come from
+the response usage metadata when the backend reports it (live, record) and are
+otherwise estimated at 4 characters per token.
+
+The two modes do not return the same content. Legacy mode is grounded with the
+Google Search tool. Schema mode cannot use the tool (gemini-2.5-flash rejects a
+schema combined with tools), so its answers come from the model alone. Against
+a live backend, the columns compare speed, cost and parse reliability, not
+answer quality. Each row's 'grounded' field records which mode it ran in.
+
+Usage:
+    python benchmarks/bench_structured.py                       # synthetic stand-in, offline
+    MODEL_BACKEND=live python benchmarks/bench_structured.py --backend env --runs 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import gemini_client
+import main
+import metrics
+import prompts
+from model_backend import SyntheticBackend
+
+ENDPOINTS = ('search', 'search_stream', 'trends', 'trends_stream')
+MODES = (('legacy', False), ('schema', True))
+
+
+def run_once(endpoint, query):
+    trace = metrics.Trace(endpoint)
+    if gemini_client.STRUCTURED_OUTPUT and not endpoint.endswith('_stream'):
+        objects = main._decoded_response(endpoint, query, trace)
+    else:
+        objects = main._stream_objects(endpoint, query, trace)
+    for _ in objects:
+        trace.object()
+    trace.mark('complete')
+    return trace
+
+
+def summarize(endpoint, mode, query, traces):
+    prompt = prompts.build_prompt(endpoint, query)
+    output_chars = statistics.mean(t.bytes_received for t in traces)
+    prompt_tokens = [t.tokens['prompt_token_count'] for t in traces if 'prompt_token_count' in t.tokens]
+    output_tokens = [t.tokens['candidates_token_count'] for t in traces if 'candidates_token_count' in t.tokens]
+    estimated = not prompt_tokens
+
+    def ms(values):
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values) * 1000, 1) if values else None
+
+    return {
+        'endpoint': endpoint,
+        'mode': mode,
+        'grounded': gemini_client.search_grounded(),
+        'runs': len(traces),
+        'prompt_chars': len(prompt),
+        'prompt_tokens': round(statistics.mean(prompt_tokens)) if prompt_tokens else len(prompt) // 4,
+        'output_tokens': round(statistics.mean(output_tokens)) if output_tokens else round(output_chars / 4),
+        'tokens_estimated': estimated,
+        'first_object_p50_ms': ms(t.marks.get('first_object') for t in traces),
+        'complete_p50_ms': ms(t.marks.get('complete') for t in traces),
+        'objects': round(statistics.mean(t.objects for t in traces), 1),
+        'parse_failures': sum(t.parse_failures for t in traces),
+    }
+
+
+def print_table(rows):
+    columns = ('prompt_tokens', 'output_tokens', 'first_object_p50_ms', 'complete_p50_ms', 'objects', 'parse_failures')
+    print(f"{'endpoint':<15}{'metric':<22}{'legacy':>12}{'schema':>12}")
+    for endpoint in ENDPOINTS:
+        by_mode = {row['mode']: row for row in rows if row['endpoint'] == endpoint}
+        if len(by_mode) < 2:
+            continue
+        for column in columns:
+            legacy, schema = by_mode['legacy'][column], by_mode['schema'][column]
+            print(f"{endpoint:<15}{column:<22}{str(legacy):>12}{str(schema):>12}")
+        if by_mode['legacy']['tokens_estimated']:
+            print(f"{endpoint:<15}(token counts estimated from characters)")
+    print("legacy is grounded in Google Search, schema is not: the modes return different content")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--query', default='dangerous tiktok health trends')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--backend', choices=('synthetic', 'env'), default='synthetic',
+                        help='synthetic stand-in, or whatever MODEL_BACKEND selects (live, replay)')
+    parser.add_argument('--malformed-rate', type=float, default=0.05,
+                        help='synthetic legacy-mode objects that fail to decode')
+    parser.add_argument('--output', help='also write the rows to this JSON file')
+    args = parser.parse_args()
+
+    cache.set_query_cache(cache.NullCache())
+    rows = []
+    for mode, structured in MODES:
+        gemini_client.STRUCTURED_OUTPUT = structured
+        if args.backend == 'synthetic':
+            # Schema-constrained output always decodes
+            gemini_client.set_backend(SyntheticBackend(malformed_rate=0.0 if structured else args.malformed_rate))
+        for endpoint in args.endpoints.split(','):
+            traces = [run_once(endpoint, args.query) for _ in range(args.runs)]
+            rows.append(summarize(endpoint, mode, args.query, traces))
+
+    print_table(rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
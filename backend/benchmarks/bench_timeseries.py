@@ -0,0 +1,111 @@
+"""
+DMA trend series: per-point update cost, anomaly pass latency and detection quality
+
+Fills an in-memory SeriesStore with --queries x 210 DMA series of noisy weekly
+query_volume points, with a step spike or drop injected into the last point of
+--anomaly-rate of them. Reports:
+  ingest      - microseconds per point (ring buffer write + EWMA/z/CUSUM update)
+  vectorized  - one anomalies(only_anomalies=True) pass over every series
+  full        - anomalies() returning every series with its points
+  recompute   - the same flags recomputed per series in Python from the stored points
+plus array memory and precision/recall of the flagged series.
+
+Usage:
+    python benchmarks/bench_timeseries.py --queries 10 --points 52
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import timeseries
+
+DMAS = 210
+WEEK = 7 * 24 * 3600
+
+
+def recompute(store):
+    """Flags from each series' stored points, one Python loop per series"""
+    flagged = set()
+    for row, key in enumerate(store.keys):
+        count, head = int(store.count[row]), int(store.head[row])
+        points = [float(store.values[row, (head - count + i) % store.capacity]) for i in range(count)]
+        mean, var, z, pos, neg = points[0], 0.0, 0.0, 0.0, 0.0
+        for value in points[1:]:
+            diff = value - mean
+            z = diff / max(math.sqrt(var), timeseries.ANOMALY_MIN_STD)
+            mean += store.alpha * diff
+            var = (1 - store.alpha) * (var + diff * store.alpha * diff)
+            pos = max(0.0, pos + z - timeseries.CUSUM_K)
+            neg = max(0.0, neg - z - timeseries.CUSUM_K)
+        if count >= timeseries.ANOMALY_MIN_POINTS and (abs(z) >= timeseries.ANOMALY_Z or max(pos, neg) >= timeseries.CUSUM_H):
+            flagged.add(key)
+    return flagged
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=10)
+    parser.add_argument('--points', type=int, default=52)
+    parser.add_argument('--noise', type=float, default=20.0, help='standard deviation of the weekly noise')
+    parser.add_argument('--shift', type=float, default=250.0, help='size of the injected spike/drop')
+    parser.add_argument('--anomaly-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n_series = args.queries * DMAS
+    base = rng.uniform(200, 700, n_series)
+    values = np.clip(base[:, None] + rng.normal(0, args.noise, (n_series, args.points)), 0, 1000)
+    injected = rng.random(n_series) < args.anomaly_rate
+    values[injected, -1] = np.clip(values[injected, -1] + np.where(rng.random(injected.sum()) < 0.5, 1, -1) * args.shift, 0, 1000)
+    keys = [(f"query {i // DMAS}", str(500 + i % DMAS)) for i in range(n_series)]
+
+    store = timeseries.SeriesStore(capacity=max(args.points, timeseries.TIMESERIES_CAPACITY),
+                                   max_series=n_series, min_interval=0)
+    start = time.perf_counter()
+    for week in range(args.points):
+        at = week * WEEK
+        for i, (query, dma_code) in enumerate(keys):
+            store.add(query, dma_code, float(values[i, week]), at)
+    ingest = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = store.anomalies(points=args.points, only_anomalies=True)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    store.anomalies(points=args.points)
+    full = time.perf_counter() - start
+    start = time.perf_counter()
+    recomputed = recompute(store)
+    recompute_s = time.perf_counter() - start
+
+    flagged = {(series['query'], series['dma_code']) for series in result['series']}
+    expected = {key for key, hit in zip(keys, injected) if hit}
+    true_positives = len(flagged & expected)
+    memory = store.times.nbytes + store.values.nbytes + sum(array.nbytes for array in store.stats.values())
+    print(json.dumps({
+        'series': n_series,
+        'points_per_series': args.points,
+        'ingest_us_per_point': round(ingest / (n_series * args.points) * 1e6, 2),
+        'vectorized_pass_ms': round(vectorized * 1000, 1),
+        'full_response_ms': round(full * 1000, 1),
+        'recompute_ms': round(recompute_s * 1000, 1),
+        'flags_match_recompute': flagged == recomputed,
+        'array_memory_mb': round(memory / 2 ** 20, 2),
+        'injected': len(expected),
+        'flagged': len(flagged),
+        'precision': round(true_positives / len(flagged), 3) if flagged else None,
+        'recall': round(true_positives / len(expected), 3) if expected else None,
+    }), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
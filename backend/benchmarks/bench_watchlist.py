@@ -0,0 +1,86 @@
+"""
+Batch watchlist throughput against one HTTP round trip per query
+
+Runs N distinct standing queries through the watchlistBatch endpoint at several
+concurrency limits (rate limiting off) and through sequential searchHealthTrends
+calls, against a synthetic model with a fixed time to first chunk. Reports wall
+time, time to the first NDJSON line and per-query latency.
+
+Usage:
+    python benchmarks/bench_watchlist.py --queries 100 --concurrency 1,8,32
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, request
+
+import cache
+import event_store
+import gemini_client
+import main
+import watchlist
+from model_backend import SyntheticBackend
+from ratelimit import TokenBucket
+
+
+def sequential(app, queries):
+    start = time.perf_counter()
+    for query in queries:
+        with app.test_request_context('/', method='POST', json={'query': query}):
+            main.searchHealthTrends(request)
+    return {'mode': 'sequential', 'wall_s': round(time.perf_counter() - start, 3)}
+
+
+def batch(app, queries, concurrency):
+    start = time.perf_counter()
+    first_line = None
+    elapsed = []
+    with app.test_request_context('/', method='POST', json={'queries': queries, 'concurrency': concurrency}):
+        response = main.watchlistBatch(request)
+        for text in response.response:
+            line = json.loads(text)
+            if first_line is None:
+                first_line = time.perf_counter() - start
+            if line['type'] == 'query':
+                elapsed.append(line['elapsed_s'])
+            else:
+                summary = line
+    return {
+        'mode': 'batch',
+        'concurrency': summary['concurrency'],
+        'wall_s': round(time.perf_counter() - start, 3),
+        'first_line_s': round(first_line, 3),
+        'query_p50_s': round(statistics.median(elapsed), 3),
+        'ok': summary['ok'],
+    }
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--first-chunk-ms', type=float, default=300.0)
+    args = parser.parse_args()
+
+    cache.set_query_cache(cache.NullCache())
+    event_store.set_event_store(event_store.NullEventStore())
+    gemini_client.set_backend(SyntheticBackend(first_chunk_delay=args.first_chunk_ms / 1000))
+    watchlist.upstream_bucket = TokenBucket(0)
+    watchlist.WATCHLIST_MAX_CONCURRENCY = max(int(c) for c in args.concurrency.split(','))
+    app = Flask(__name__)
+
+    queries = [f"standing query {i}" for i in range(args.queries)]
+    print(json.dumps(sequential(app, queries)), flush=True)
+    for concurrency in (int(c) for c in args.concurrency.split(',')):
+        print(json.dumps(batch(app, queries, concurrency)), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,56 @@
+"""
+Import-time profile of the Cloud Functions entry module
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and reports
+the total, the slowest modules by cumulative time, and whether the google-genai
+SDK or httpx were imported (they should only load on the first model call).
+
+Usage:
+    python benchmarks/profile_imports.py --top 15
+    python benchmarks/profile_imports.py --module async_stream
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile(module):
+    """(module, self_us, cumulative_us, depth) for every import made by importing module"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.lstrip())) // 2))
+    return rows
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    rows = profile(args.module)
+    names = {name for name, *_ in rows}
+    print(json.dumps({
+        'module': args.module,
+        'total_ms': round(next(cumulative for name, _, cumulative, _ in rows if name == args.module) / 1000, 1),
+        'modules_imported': len(rows),
+        'google_genai_loaded': 'google.genai' in names,
+        'httpx_loaded': 'httpx' in names,
+    }), flush=True)
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: -row[2])[1:args.top + 1]:
+        print(json.dumps({'import': name, 'depth': depth, 'cumulative_ms': round(cumulative_us / 1000, 1),
+                          'self_ms': round(self_us / 1000, 1)}), flush=True)
+
+
+if __name__ == '__main__':
+    cli()
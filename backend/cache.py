@@ -0,0 +1,246 @@
+"""
+Query-result cache for the Gemini-backed endpoints
+Entries are keyed by endpoint + normalized query, expire after a TTL and are
+served stale (while refreshing in the background) for a further grace window
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import admission
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')  # memory | disk | redis | off
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '900'))
+CACHE_STALE_SECONDS = float(os.environ.get('CACHE_STALE_SECONDS', '3600'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fda-horizon-cache'))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a query"""
+    return ' '.join((query or '').lower().split())
+
+
+def cache_key(endpoint, query):
+    return f"{endpoint}:{normalize_query(query)}"
+
+
+class MemoryBackend:
+    """In-process LRU store bounded to max_entries"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, expire_seconds=None):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DiskBackend:
+    """One JSON file per key under a local directory (survives instance restarts on the same disk)"""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, entry, expire_seconds=None):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    """
+    Store entries in any Redis-compatible client exposing get/set(ex=)/delete,
+    e.g. redis.Redis or a local stand-in with the same methods
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def set(self, key, entry, expire_seconds=None):
+        ex = int(expire_seconds) + 1 if expire_seconds else None
+        self.client.set(key, json.dumps(entry), ex=ex)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class QueryCache:
+    """TTL cache with stale-while-revalidate on top of a pluggable backend"""
+
+    def __init__(self, backend, ttl=CACHE_TTL_SECONDS, stale_ttl=CACHE_STALE_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def lookup(self, endpoint, query):
+        """
+        Return (value, fresh). value is None on a miss or once an entry is
+        past its stale window; fresh is False for entries past their TTL.
+        """
+        try:
+            entry = self.backend.get(cache_key(endpoint, query))
+        except Exception as e:
+            logger.warning(f"Cache read failed for {endpoint}: {e}")
+            return None, False
+
+        if not entry:
+            return None, False
+
+        age = time.time() - entry['stored_at']
+        if age < self.ttl:
+            return entry['value'], True
+        if age < self.ttl + self.stale_ttl:
+            return entry['value'], False
+        return None, False
+
+    def set(self, endpoint, query, value):
+        entry = {'value': value, 'stored_at': time.time()}
+        try:
+            self.backend.set(cache_key(endpoint, query), entry, expire_seconds=self.ttl + self.stale_ttl)
+        except Exception as e:
+            logger.warning(f"Cache write failed for {endpoint}: {e}")
+
+    def refresh_async(self, endpoint, query, compute):
+        """Recompute an entry on a background thread unless a refresh for it is already running"""
+        key = cache_key(endpoint, query)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                # The stale entry is already being served: refreshes queue behind live requests
+                with admission.priority(admission.BATCH):
+                    value = compute()
+                if value:
+                    self.set(endpoint, query, value)
+            except Exception as e:
+                logger.error(f"Background cache refresh failed for {key}: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"cache-refresh-{endpoint}", daemon=True).start()
+
+    def get_or_compute(self, endpoint, query, compute):
+        """Serve fresh or stale values from the cache, computing (and storing) on a miss"""
+        value, fresh = self.lookup(endpoint, query)
+        if value is not None:
+            if not fresh:
+                self.refresh_async(endpoint, query, compute)
+            return value
+
+        value = compute()
+        if value:
+            self.set(endpoint, query, value)
+        return value
+
+
+class NullCache(QueryCache):
+    """Cache that never stores anything (CACHE_BACKEND=off)"""
+
+    def __init__(self):
+        super().__init__(backend=None)
+
+    def lookup(self, endpoint, query):
+        return None, False
+
+    def set(self, endpoint, query, value):
+        pass
+
+
+def create_cache(backend_name=CACHE_BACKEND):
+    if backend_name == 'off':
+        return NullCache()
+    if backend_name == 'disk':
+        return QueryCache(DiskBackend())
+    if backend_name == 'redis':
+        import redis  # Optional dependency, only needed for CACHE_BACKEND=redis
+        return QueryCache(RedisBackend(redis.Redis.from_url(REDIS_URL)))
+    return QueryCache(MemoryBackend())
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """Return the process-wide query cache, creating it from the environment on first use"""
+    global _query_cache
+
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = create_cache()
+    return _query_cache
+
+
+def set_query_cache(query_cache):
+    """Swap the process-wide query cache (e.g. for a local stand-in backend)"""
+    global _query_cache
+    _query_cache = query_cache
+
+
+def cached(endpoint):
+    """Decorator caching a function of a single query argument under endpoint"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(query):
+            return get_query_cache().get_or_compute(endpoint, query, lambda: func(query))
+        return wrapper
+    return decorator
@@ -0,0 +1,146 @@
+"""
+Single-flight request coalescing for upstream Gemini streams
+Concurrent requests for the same key share one producer; late joiners first
+receive every event already published, then follow the live stream. When the
+last subscriber leaves early, the producer is told to stop.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How often a subscriber waiting for events checks its stop event
+STOP_POLL_SECONDS = 0.1
+
+
+class FlightFailed(Exception):
+    """Raised to every subscriber when the shared producer fails"""
+
+
+class FlightCancelled(Exception):
+    """The producer was stopped because every subscriber left"""
+
+
+class Flight:
+    """Events published by one producer run, readable by any number of subscribers"""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        # Set when every subscriber has left before the producer finished
+        self.cancelled = threading.Event()
+        self._cond = threading.Condition()
+
+    def publish(self, event):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def subscribe(self, deadline=None, stop=None):
+        """
+        Yield every event from the beginning, blocking for new ones until the
+        flight finishes, deadline (a time.monotonic() value) passes or the stop
+        event is set - even while the producer is stalled between events
+        """
+        with self._cond:
+            self.subscribers += 1
+        try:
+            index = 0
+            while True:
+                with self._cond:
+                    while index >= len(self.events) and not self.done:
+                        timeout = None if deadline is None else deadline - time.monotonic()
+                        if timeout is not None and timeout <= 0:
+                            return
+                        if stop is not None:
+                            if stop.is_set():
+                                return
+                            timeout = STOP_POLL_SECONDS if timeout is None else min(timeout, STOP_POLL_SECONDS)
+                        self._cond.wait(timeout)
+                    batch = self.events[index:]
+                    finished = self.done
+                    error = self.error
+
+                for event in batch:
+                    yield event
+                index += len(batch)
+
+                if finished and index >= len(self.events):
+                    if error is not None:
+                        raise FlightFailed(str(error)) from error
+                    return
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+                abandoned = self.subscribers == 0 and not self.done
+            if abandoned and not self.cancelled.is_set():
+                logger.info(f"Last subscriber left {self.key}; stopping its upstream stream")
+                self.cancelled.set()
+
+
+class SingleFlight:
+    """Registry of in-progress flights keyed by normalized request"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key, producer, deadline=None, stop=None):
+        """
+        Return an iterator over the events for key, ending early at deadline or
+        once the stop event is set.
+        The first caller becomes the leader and starts producer(cancelled) on a
+        background thread; callers arriving while it runs subscribe to the same
+        flight. cancelled is a threading.Event set once every subscriber has
+        left, which the producer should check between upstream chunks.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.cancelled.is_set():
+                flight = Flight(key)
+                self._flights[key] = flight
+                threading.Thread(
+                    target=self._run, args=(flight, producer),
+                    name=f"flight-{key}", daemon=True,
+                ).start()
+            else:
+                logger.info(f"Coalescing request onto in-flight stream for {key}")
+        return flight.subscribe(deadline, stop)
+
+    def in_flight(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            return flight is not None and not flight.cancelled.is_set()
+
+    def _run(self, flight, producer):
+        error = None
+        events = producer(flight.cancelled)
+        try:
+            for event in events:
+                flight.publish(event)
+                if flight.cancelled.is_set():
+                    break
+            if flight.cancelled.is_set():
+                # Anyone who joined during the race gets an error, not a silently short stream
+                error = FlightCancelled('Upstream stream stopped after every subscriber left')
+        except Exception as e:
+            logger.error(f"Shared upstream stream failed for {flight.key}: {e}")
+            error = e
+        finally:
+            events.close()
+            # Unregister before finishing so new requests start a fresh flight
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            flight.finish(error)
@@ -0,0 +1,334 @@
+"""
+Cross-source event deduplication
+Fingerprints each parsed event (canonical URL, MinHash over normalized title
+shingles with LSH banding, city+date) against a bounded in-memory index, so
+overlapping incidents from search, trends and repeated queries are counted once
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+from gazetteer import normalize_city, normalize_state
+
+DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', '1').lower() in ('1', 'true', 'yes')
+
+# Events remembered per index; the oldest are evicted first
+DEDUP_MAX_EVENTS = int(os.environ.get('DEDUP_MAX_EVENTS', '10000'))
+
+# Client sessions (dedup_session) whose indexes are kept between requests
+DEDUP_MAX_SESSIONS = int(os.environ.get('DEDUP_MAX_SESSIONS', '256'))
+
+# Estimated title Jaccard similarity needed for a duplicate: in general, and when
+# the city and date already match
+TITLE_THRESHOLD = 0.7
+CITY_DATE_THRESHOLD = 0.5
+
+# 32 MinHash permutations in 8 LSH bands of 4 rows (candidate threshold ~0.59)
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+# Permutations are odd multiply-add hashes modulo 2**32 (uint32 wraparound)
+_rng = np.random.default_rng(20250601)
+_PERM_A = _rng.integers(0, 2 ** 32, size=(NUM_PERM, 1), dtype=np.uint64).astype(np.uint32) | np.uint32(1)
+_PERM_B = _rng.integers(0, 2 ** 32, size=(NUM_PERM, 1), dtype=np.uint64).astype(np.uint32)
+_BAND_BYTES = ROWS * 4
+
+TRACKING_PARAMS = ('utm_', 'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ref', 'cmpid', 'smid')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def canonical_url(url):
+    """Comparable form of a URL: no scheme, www., fragment, tracking parameters or trailing slash"""
+    if not isinstance(url, str) or '://' not in url:
+        return None
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if not host:
+        return None
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    ))
+    return urlunsplit(('', host, parts.path.rstrip('/'), query, ''))
+
+
+def normalize_title(title):
+    if not isinstance(title, str):
+        return ''
+    return ' '.join(_NON_WORD.sub(' ', title.lower()).split())
+
+
+def minhash(text):
+    """MinHash signature over 4-byte shingles of text (None if text is empty)"""
+    if not text:
+        return None
+    data = text.encode('utf-8').ljust(SHINGLE_SIZE)
+    # Every 4-byte window read in place as one big-endian uint32, then hashed by all permutations at once
+    shingles = np.ndarray(shape=(len(data) - SHINGLE_SIZE + 1,), dtype='>u4', buffer=data, strides=(1,))
+    return (_PERM_A * shingles.astype(np.uint32) + _PERM_B).min(axis=1)
+
+
+def band_keys(signature):
+    """One LSH bucket key per band, hashing its rows (a collision only adds a candidate to verify)"""
+    data = signature.tobytes()
+    return tuple(hash(data[start:start + _BAND_BYTES]) for start in range(0, len(data), _BAND_BYTES))
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return float(np.count_nonzero(signature_a == signature_b)) / NUM_PERM
+
+
+def fingerprint(event_type, record):
+    """
+    Stable identity of an event across runs: market and query term for trends;
+    canonical URL for incidents, else normalized title with city and date
+    """
+    location = record.get('location') if isinstance(record.get('location'), dict) else {}
+    if event_type == 'trend':
+        market = record.get('dma_code') or normalize_city(location.get('city'))
+        return f"trend|{market}|{normalize_title(record.get('query_term'))}"
+    url = canonical_url(record.get('url'))
+    if url is not None:
+        return f"url|{url}"
+    date = str(record.get('date') or '')[:10]
+    return f"title|{normalize_title(record.get('title'))}|{normalize_city(location.get('city'))}|{date}"
+
+
+def _bucket_add(buckets, key, slot):
+    # Most buckets hold one slot, stored bare to save a list per key
+    current = buckets.get(key)
+    if current is None:
+        buckets[key] = slot
+    elif type(current) is list:
+        current.append(slot)
+    else:
+        buckets[key] = [current, slot]
+
+
+def _bucket_remove(buckets, key, slot):
+    current = buckets.get(key)
+    if type(current) is list:
+        current.remove(slot)
+        if len(current) == 1:
+            buckets[key] = current[0]
+    elif current == slot:
+        del buckets[key]
+
+
+def _bucket_slots(buckets, key):
+    current = buckets.get(key)
+    if current is None:
+        return ()
+    return current if type(current) is list else (current,)
+
+
+class _Entry:
+    __slots__ = ('record', 'url', 'signature', 'bands', 'city', 'city_date', 'trend_key')
+
+    def __init__(self, record):
+        self.record = record
+        self.url = None
+        self.signature = None
+        self.bands = ()
+        self.city = ''
+        self.city_date = None
+        self.trend_key = None
+
+
+class DedupIndex:
+    """
+    Bounded index of recently seen events. Signatures live in a fixed NumPy ring
+    buffer, so candidates from the URL, city+date and LSH band lookups are
+    verified in one vectorized comparison; the oldest event is evicted when the
+    ring wraps. add() returns the kept record an event duplicates, or None for a
+    new event. With merge=True duplicates also fold into the kept record (largest
+    affected count, other sources listed); leave it off when the kept record has
+    already been sent or is shared with the query cache.
+    """
+
+    def __init__(self, max_events=DEDUP_MAX_EVENTS, merge=False):
+        self.max_events = max_events
+        self.merge = merge
+        self.duplicates = 0
+        self._entries = []
+        # Grown by doubling up to max_events rows, so short-lived indexes stay small
+        self._signatures = np.zeros((min(max_events, 256), NUM_PERM), dtype=np.uint32)
+        self._next_id = 0
+        self._by_url = {}
+        self._by_band = {}
+        self._by_city_date = {}
+        self._by_trend = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _fingerprint(self, event_type, record):
+        entry = _Entry(record)
+        location = record.get('location') if isinstance(record.get('location'), dict) else {}
+        if event_type == 'trend':
+            # One record per market and query term
+            market = record.get('dma_code') or normalize_city(location.get('city'))
+            entry.trend_key = (str(market), normalize_title(record.get('query_term')))
+            return entry
+
+        entry.url = canonical_url(record.get('url'))
+        entry.signature = minhash(normalize_title(record.get('title')))
+        if entry.signature is not None:
+            entry.bands = band_keys(entry.signature)
+        # Interned, as the same few cities and states repeat across thousands of entries
+        entry.city = sys.intern(normalize_city(location.get('city')))
+        if entry.signature is not None and entry.city and record.get('date'):
+            entry.city_date = (entry.city, sys.intern(normalize_state(location.get('state'))), str(record['date'])[:10])
+        return entry
+
+    def _most_similar(self, signature, slots, threshold, city=''):
+        """
+        Slot of the candidate whose signature best matches, if it reaches threshold;
+        with city set, candidates from a different city are passed over
+        """
+        slots = np.fromiter(slots, dtype=np.intp, count=len(slots))
+        matches = np.count_nonzero(self._signatures[slots] == signature, axis=1)
+        if matches.max() < threshold * NUM_PERM:
+            return None
+        passing = np.flatnonzero(matches >= threshold * NUM_PERM)
+        for i in passing[np.argsort(-matches[passing], kind='stable')].tolist():
+            other = self._entries[slots[i]].city
+            if not city or not other or other == city:
+                return int(slots[i])
+        return None
+
+    def _match(self, entry):
+        if entry.trend_key is not None:
+            return self._by_trend.get(entry.trend_key)
+        if entry.url is not None and entry.url in self._by_url:
+            return self._by_url[entry.url]
+        if entry.signature is None:
+            return None
+
+        if entry.city_date is not None:
+            slots = _bucket_slots(self._by_city_date, entry.city_date)
+            if slots:
+                match = self._most_similar(entry.signature, slots, CITY_DATE_THRESHOLD)
+                if match is not None:
+                    return match
+
+        candidates = set()
+        for key in entry.bands:
+            candidates.update(_bucket_slots(self._by_band, key))
+        if not candidates:
+            return None
+        # The same headline in a different city is a separate incident
+        return self._most_similar(entry.signature, candidates, TITLE_THRESHOLD, entry.city)
+
+    def _insert(self, entry):
+        slot = self._next_id % self.max_events
+        self._next_id += 1
+        if slot < len(self._entries):
+            self._evict(slot, self._entries[slot])
+            self._entries[slot] = entry
+        else:
+            self._entries.append(entry)
+            if slot >= len(self._signatures):
+                grown = np.zeros((min(self.max_events, 2 * len(self._signatures)), NUM_PERM), dtype=np.uint32)
+                grown[:len(self._signatures)] = self._signatures
+                self._signatures = grown
+
+        if entry.trend_key is not None:
+            self._by_trend[entry.trend_key] = slot
+        if entry.url is not None:
+            self._by_url[entry.url] = slot
+        if entry.signature is not None:
+            self._signatures[slot] = entry.signature
+            entry.signature = None
+        for key in entry.bands:
+            _bucket_add(self._by_band, key, slot)
+        if entry.city_date is not None:
+            _bucket_add(self._by_city_date, entry.city_date, slot)
+
+    def _evict(self, slot, entry):
+        if entry.trend_key is not None and self._by_trend.get(entry.trend_key) == slot:
+            del self._by_trend[entry.trend_key]
+        if entry.url is not None and self._by_url.get(entry.url) == slot:
+            del self._by_url[entry.url]
+        for key in entry.bands:
+            _bucket_remove(self._by_band, key, slot)
+        if entry.city_date is not None:
+            _bucket_remove(self._by_city_date, entry.city_date, slot)
+
+    def _merge(self, kept, record):
+        kept_affected, affected = kept.get('affected'), record.get('affected')
+        if isinstance(affected, (int, float)) and (not isinstance(kept_affected, (int, float)) or affected > kept_affected):
+            kept['affected'] = affected
+        source = record.get('source')
+        if source and source != kept.get('source'):
+            also = kept.setdefault('also_reported_by', [])
+            if source not in also:
+                also.append(source)
+
+    def add(self, event_type, record):
+        """Index a parsed event; returns the kept record it duplicates, or None if it is new"""
+        if not isinstance(record, dict):
+            return None
+        entry = self._fingerprint(event_type, record)
+        with self._lock:
+            match = self._match(entry)
+            if match is None:
+                self._insert(entry)
+                return None
+
+            kept = self._entries[match].record
+            self.duplicates += 1
+            if self.merge:
+                self._merge(kept, record)
+            return kept
+
+
+def dedup_records(event_type, records):
+    """
+    Drop duplicates from a list of records, merging them into the copies that are
+    kept (the records are returned unchanged when dedup is disabled)
+    """
+    if not DEDUP_ENABLED or not isinstance(records, list):
+        return records
+    index = DedupIndex(max_events=max(DEDUP_MAX_EVENTS, len(records)), merge=True)
+    # Merging writes to the kept records, so work on copies (the originals may be cached)
+    return [
+        record for record in (dict(r) if isinstance(r, dict) else r for r in records)
+        if index.add(event_type, record) is None
+    ]
+
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def get_index(session=None):
+    """
+    Dedup index for one stream, or the one kept for a client session so repeated
+    queries from the same dashboard are deduplicated too (None when disabled)
+    """
+    if not DEDUP_ENABLED:
+        return None
+    if not session:
+        return DedupIndex()
+
+    with _sessions_lock:
+        index = _sessions.get(session)
+        if index is None:
+            index = _sessions[session] = DedupIndex()
+            while len(_sessions) > DEDUP_MAX_SESSIONS:
+                _sessions.popitem(last=False)
+        else:
+            _sessions.move_to_end(session)
+        return index
@@ -0,0 +1,323 @@
+"""
+Persistent local store of parsed events
+Every result/trend record parsed from a Gemini response is appended to an
+embedded SQLite database (WAL mode) by a background writer in batches, and
+served back by indexed, keyset-paginated queries without calling Gemini
+"""
+
+import contextlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+from cache import normalize_query
+from gazetteer import normalize_state
+
+logger = logging.getLogger(__name__)
+
+EVENT_STORE = os.environ.get('EVENT_STORE', 'sqlite')  # sqlite | off
+EVENT_STORE_PATH = os.environ.get('EVENT_STORE_PATH', os.path.join(tempfile.gettempdir(), 'fda-horizon-events.sqlite3'))
+
+# Rows per write transaction, and how long the writer waits to fill a batch
+EVENT_STORE_BATCH_SIZE = int(os.environ.get('EVENT_STORE_BATCH_SIZE', '500'))
+EVENT_STORE_FLUSH_SECONDS = float(os.environ.get('EVENT_STORE_FLUSH_SECONDS', '0.25'))
+
+# Events waiting for the writer; beyond this they are dropped rather than block a stream
+EVENT_STORE_MAX_PENDING = int(os.environ.get('EVENT_STORE_MAX_PENDING', '10000'))
+
+MAX_PAGE_SIZE = 500
+
+# Event type recorded for each Gemini endpoint
+ENDPOINT_EVENT_TYPES = {
+    'search': 'result',
+    'search_stream': 'result',
+    'search_thinking': 'result',
+    'trends': 'trend',
+    'trends_stream': 'trend',
+    'scan_search': 'result',
+    'scan_trends': 'trend',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    endpoint TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    query TEXT,
+    title TEXT,
+    city TEXT COLLATE NOCASE,
+    state TEXT,
+    severity TEXT,
+    date TEXT,
+    lat REAL,
+    lng REAL,
+    affected REAL,
+    url TEXT,
+    dma_code TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_state ON events (state, id);
+CREATE INDEX IF NOT EXISTS events_city ON events (city, id);
+CREATE INDEX IF NOT EXISTS events_severity ON events (severity, id);
+CREATE INDEX IF NOT EXISTS events_date ON events (date, id);
+CREATE INDEX IF NOT EXISTS events_query ON events (query, id);
+"""
+
+COLUMNS = ('recorded_at', 'endpoint', 'event_type', 'query', 'title', 'city', 'state', 'severity', 'date',
+           'lat', 'lng', 'affected', 'url', 'dma_code', 'data')
+INSERT = f"INSERT INTO events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})"
+
+# Query filters: request parameter -> (column, operator)
+FILTERS = {
+    'type': ('event_type', '='),
+    'state': ('state', '='),
+    'city': ('city', '='),
+    'severity': ('severity', '='),
+    'query': ('query', '='),
+    'date_from': ('date', '>='),
+    'date_to': ('date', '<='),
+}
+
+
+_paused = threading.local()
+
+
+@contextlib.contextmanager
+def paused():
+    """Skip recording on this thread (e.g. while a scan records only its deltas); pauses may nest"""
+    previous = getattr(_paused, 'active', False)
+    _paused.active = True
+    try:
+        yield
+    finally:
+        _paused.active = previous
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.replace(',', '').strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def event_row(recorded_at, endpoint, event_type, query, record):
+    """Column values for one record, with the full record kept as JSON"""
+    location = record.get('location') if isinstance(record.get('location'), dict) else {}
+    if event_type == 'trend':
+        title, severity = record.get('query_term'), record.get('risk')
+    else:
+        title, severity = record.get('title'), record.get('severity')
+    severity = _text(severity)
+    date = _text(record.get('date'))
+    return (
+        recorded_at,
+        endpoint,
+        event_type,
+        normalize_query(query),
+        _text(title),
+        _text(location.get('city')),
+        normalize_state(location.get('state')) or None,
+        severity.lower() if severity else None,
+        date[:10] if date else None,
+        _number(location.get('lat')),
+        _number(location.get('lng')),
+        _number(record.get('affected')),
+        _text(record.get('url')),
+        _text(str(record['dma_code'])) if record.get('dma_code') is not None else None,
+        json.dumps(record),
+    )
+
+
+def records_of(obj):
+    """The result/trend records in a parsed object: its results/trends list, or the object itself if it is one"""
+    if not isinstance(obj, dict):
+        return []
+    for key in ('results', 'trends'):
+        if isinstance(obj.get(key), list):
+            return [record for record in obj[key] if isinstance(record, dict)]
+    if 'title' in obj or 'query_term' in obj or 'location' in obj:
+        return [obj]
+    return []
+
+
+class EventStore:
+    """
+    Append-only SQLite event store. record() only enqueues; a daemon writer thread
+    inserts queued events in batches of up to batch_size, one transaction each.
+    Readers use their own per-thread connections, which WAL mode lets run
+    alongside the writer.
+    """
+
+    def __init__(self, path=EVENT_STORE_PATH, batch_size=EVENT_STORE_BATCH_SIZE,
+                 flush_seconds=EVENT_STORE_FLUSH_SECONDS, max_pending=EVENT_STORE_MAX_PENDING):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._readers = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        threading.Thread(target=self._write_loop, name="event-store-writer", daemon=True).start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def record(self, endpoint, query, obj):
+        """Queue the records in a parsed object for writing; never blocks"""
+        if getattr(_paused, 'active', False):
+            return
+        event_type = ENDPOINT_EVENT_TYPES.get(endpoint, 'result')
+        now = time.time()
+        for record in records_of(obj):
+            try:
+                self._pending.put_nowait((now, endpoint, event_type, query, record))
+            except queue.Full:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(f"Event store writer is behind; dropped {self.dropped} events")
+
+    def _next_batch(self):
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._pending.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            batch = self._next_batch()
+            try:
+                rows = [event_row(*item) for item in batch]
+                with connection:
+                    connection.executemany(INSERT, rows)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.error(f"Event store write of {len(batch)} events failed: {e}")
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+
+    def flush(self):
+        """Block until every queued event has been written"""
+        self._pending.join()
+
+    def _reader(self):
+        connection = getattr(self._readers, 'connection', None)
+        if connection is None:
+            connection = self._readers.connection = self._connect()
+            connection.execute('PRAGMA query_only=ON')
+        return connection
+
+    def query(self, filters=None, limit=50, cursor=None):
+        """
+        Newest-first page of stored events matching filters (see FILTERS), plus
+        the cursor for the next page (None on the last page)
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses, params = [], []
+        for name, value in (filters or {}).items():
+            if name not in FILTERS or value in (None, ''):
+                continue
+            column, operator = FILTERS[name]
+            value = str(value).strip()
+            if name == 'state':
+                value = normalize_state(value) or value
+            elif name == 'query':
+                value = normalize_query(value)
+            elif name == 'severity':
+                value = value.lower()
+            clauses.append(f"{column} {operator} ?")
+            params.append(value)
+        if cursor is not None:
+            clauses.append('id < ?')
+            params.append(int(cursor))
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._reader().execute(
+            f"SELECT id, recorded_at, endpoint, event_type, query, data FROM events {where} ORDER BY id DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+
+        events = [
+            {
+                'id': row[0],
+                'recorded_at': row[1],
+                'endpoint': row[2],
+                'type': row[3],
+                'query': row[4],
+                'data': json.loads(row[5]),
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = events[-1]['id'] if len(rows) > limit else None
+        return events, next_cursor
+
+
+class NullEventStore:
+    """Event store that records nothing (EVENT_STORE=off)"""
+
+    dropped = 0
+
+    def record(self, endpoint, query, obj):
+        pass
+
+    def flush(self):
+        pass
+
+    def query(self, filters=None, limit=50, cursor=None):
+        return [], None
+
+
+def create_event_store(backend_name=EVENT_STORE):
+    if backend_name == 'off':
+        return NullEventStore()
+    return EventStore()
+
+
+_event_store = None
+_event_store_lock = threading.Lock()
+
+
+def get_event_store():
+    """Return the process-wide event store, opening it on first use"""
+    global _event_store
+
+    if _event_store is None:
+        with _event_store_lock:
+            if _event_store is None:
+                _event_store = create_event_store()
+    return _event_store
+
+
+def set_event_store(event_store):
+    """Swap the process-wide event store (e.g. for a temporary database)"""
+    global _event_store
+    _event_store = event_store
@@ -0,0 +1,289 @@
+"""
+Offline US city / DMA gazetteer for resolving and snapping result coordinates
+Loaded lazily from data/ into flat arrays with a name index and a 1-degree grid index
+"""
+
+import csv
+import logging
+import math
+import os
+import threading
+from array import array
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_DIR = os.environ.get('GAZETTEER_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+# Model coordinates further than this from the named city are replaced by the city's
+SNAP_DISTANCE_KM = float(os.environ.get('GEO_SNAP_KM', '75'))
+
+# Latitude/longitude ranges covering the states, Alaska, Hawaii and Puerto Rico
+US_LAT_RANGE = (17.5, 71.5)
+US_LNG_RANGE = (-180.0, -64.5)
+
+GRID_DEGREES = 1.0
+MAX_RINGS = 12
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+STATE_CODES = {
+    'ALABAMA': 'AL', 'ALASKA': 'AK', 'ARIZONA': 'AZ', 'ARKANSAS': 'AR', 'CALIFORNIA': 'CA',
+    'COLORADO': 'CO', 'CONNECTICUT': 'CT', 'DELAWARE': 'DE', 'DISTRICT OF COLUMBIA': 'DC',
+    'FLORIDA': 'FL', 'GEORGIA': 'GA', 'HAWAII': 'HI', 'IDAHO': 'ID', 'ILLINOIS': 'IL',
+    'INDIANA': 'IN', 'IOWA': 'IA', 'KANSAS': 'KS', 'KENTUCKY': 'KY', 'LOUISIANA': 'LA',
+    'MAINE': 'ME', 'MARYLAND': 'MD', 'MASSACHUSETTS': 'MA', 'MICHIGAN': 'MI', 'MINNESOTA': 'MN',
+    'MISSISSIPPI': 'MS', 'MISSOURI': 'MO', 'MONTANA': 'MT', 'NEBRASKA': 'NE', 'NEVADA': 'NV',
+    'NEW HAMPSHIRE': 'NH', 'NEW JERSEY': 'NJ', 'NEW MEXICO': 'NM', 'NEW YORK': 'NY',
+    'NORTH CAROLINA': 'NC', 'NORTH DAKOTA': 'ND', 'OHIO': 'OH', 'OKLAHOMA': 'OK', 'OREGON': 'OR',
+    'PENNSYLVANIA': 'PA', 'PUERTO RICO': 'PR', 'RHODE ISLAND': 'RI', 'SOUTH CAROLINA': 'SC',
+    'SOUTH DAKOTA': 'SD', 'TENNESSEE': 'TN', 'TEXAS': 'TX', 'UTAH': 'UT', 'VERMONT': 'VT',
+    'VIRGINIA': 'VA', 'WASHINGTON': 'WA', 'WEST VIRGINIA': 'WV', 'WISCONSIN': 'WI', 'WYOMING': 'WY',
+    'WASHINGTON DC': 'DC', 'D.C.': 'DC',
+}
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def normalize_city(name):
+    """Comparable form of a city name: 'Saint Louis', 'St. Louis' and 'st louis' all match"""
+    if not isinstance(name, str):
+        return ''
+    name = ' '.join(name.lower().replace('.', ' ').replace('-', ' ').split())
+    if name.startswith('saint '):
+        name = 'st ' + name[6:]
+    elif name.startswith('ft '):
+        name = 'fort ' + name[3:]
+    return name
+
+
+def normalize_state(state):
+    """Two-letter code for a state code or name, or '' if unknown"""
+    if not isinstance(state, str):
+        return ''
+    state = state.strip().upper()
+    if len(state) == 2:
+        return state
+    return STATE_CODES.get(state, '')
+
+
+def _coordinate(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def in_us(lat, lng):
+    return US_LAT_RANGE[0] <= lat <= US_LAT_RANGE[1] and US_LNG_RANGE[0] <= lng <= US_LNG_RANGE[1]
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance (haversine)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat, lng):
+    return int(math.floor(lat / GRID_DEGREES)), int(math.floor(lng / GRID_DEGREES))
+
+
+class Gazetteer:
+    """
+    US places held in parallel arrays (float32 coordinates), with a (city, state)
+    name index, a per-city index for lookups without a state, a grid index for
+    nearest-place queries and the DMA table keyed by code
+    """
+
+    def __init__(self, cities_path, dmas_path):
+        self.cities = []
+        self.states = []
+        self.dma_codes = []
+        self.lats = array('f')
+        self.lngs = array('f')
+        self._cos_lats = array('f')
+        self._by_name = {}
+        self._by_city = {}
+        self._by_state = {}
+        self._grid = {}
+        self.dmas = {}
+
+        with open(cities_path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                self._add(row['city'], row['state'], float(row['lat']), float(row['lng']), row['dma_code'])
+
+        with open(dmas_path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                index = self.find(row['city'], row['state'])
+                if index is None:
+                    logger.warning(f"Gazetteer: DMA {row['dma_code']} city {row['city']}, {row['state']} not found")
+                    continue
+                self.dmas[row['dma_code']] = (row['dma_name'], index)
+
+        # Freeze the grid buckets into compact arrays
+        self._grid = {cell: array('H', indexes) for cell, indexes in self._grid.items()}
+
+    def _add(self, city, state, lat, lng, dma_code):
+        index = len(self.cities)
+        self.cities.append(city)
+        self.states.append(state)
+        self.dma_codes.append(dma_code or None)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+        self._cos_lats.append(math.cos(math.radians(lat)))
+
+        key = normalize_city(city)
+        self._by_name.setdefault((key, state), index)
+        self._by_city.setdefault(key, []).append(index)
+        # Cities are listed largest first within each state
+        self._by_state.setdefault(state, index)
+        self._grid.setdefault(_cell(lat, lng), []).append(index)
+
+    def __len__(self):
+        return len(self.cities)
+
+    def find(self, city, state=None):
+        """Index of the named city (the first listed one if state is not given), or None"""
+        key = normalize_city(city)
+        if not key:
+            return None
+        state = normalize_state(state)
+        if state:
+            return self._by_name.get((key, state))
+        indexes = self._by_city.get(key)
+        return indexes[0] if indexes else None
+
+    def state_index(self, state):
+        """Index of the largest listed city in a state, or None"""
+        return self._by_state.get(normalize_state(state))
+
+    def dma(self, code):
+        """(DMA name, index of its principal city) for a DMA code, or None"""
+        return self.dmas.get(str(code).strip()) if code is not None else None
+
+    def nearest(self, lat, lng, max_km=None):
+        """(index, km) of the closest place, searching outward ring by ring over the grid"""
+        row, col = _cell(lat, lng)
+        lats, lngs, cos_lats, grid = self.lats, self.lngs, self._cos_lats, self._grid
+        # Rank candidates by the small-angle haversine (squared degrees); exact distance only for the winner
+        cos_lat = math.cos(math.radians(lat))
+        best, best_d2 = None, math.inf
+        for ring in range(MAX_RINGS + 1):
+            for i in range(row - ring, row + ring + 1):
+                step = 1 if abs(i - row) == ring else 2 * ring
+                for j in range(col - ring, col + ring + 1, step or 1):
+                    for index in grid.get((i, j), ()):
+                        dlat = lats[index] - lat
+                        dlng = lngs[index] - lng
+                        d2 = dlat * dlat + cos_lat * cos_lats[index] * dlng * dlng
+                        if d2 < best_d2:
+                            best, best_d2 = index, d2
+            # Anything in the next ring is at least `ring` cells away in latitude or longitude
+            ring_degrees = ring * GRID_DEGREES * math.cos(math.radians(min(89.0, abs(lat) + ring + 1)))
+            if best is not None and best_d2 <= ring_degrees * ring_degrees:
+                break
+        if best is None:
+            return None, None
+        km = distance_km(lat, lng, lats[best], lngs[best])
+        if max_km is not None and km > max_km:
+            return None, None
+        return best, km
+
+    def location(self, index):
+        """Location dict in the shape the endpoints return"""
+        return {
+            'city': self.cities[index],
+            'state': self.states[index],
+            'lat': round(self.lats[index], 4),
+            'lng': round(self.lngs[index], 4),
+        }
+
+
+def get_gazetteer():
+    """Return the process-wide gazetteer, loading it on first use"""
+    global _gazetteer
+
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer(
+                    os.path.join(GAZETTEER_DIR, 'us_cities.csv'),
+                    os.path.join(GAZETTEER_DIR, 'us_dmas.csv'),
+                )
+    return _gazetteer
+
+
+def resolve_location(location, gazetteer=None):
+    """
+    Fill in or correct a location dict in place:
+    - coordinates missing, non-numeric or outside the US are taken from the named city
+      (or, for an unknown city, from the largest city in its state)
+    - a longitude with its sign dropped is flipped back
+    - coordinates further than SNAP_DISTANCE_KM from the named city are snapped to it
+    - a location with coordinates but no city gets the nearest known place's city/state
+    """
+    gazetteer = gazetteer or get_gazetteer()
+    lat, lng = _coordinate(location.get('lat')), _coordinate(location.get('lng'))
+    valid = lat is not None and lng is not None
+    if valid and not in_us(lat, lng):
+        valid = in_us(lat, -lng)
+        lng = -lng
+
+    index = gazetteer.find(location.get('city'), location.get('state'))
+    if index is not None:
+        named_lat, named_lng = gazetteer.lats[index], gazetteer.lngs[index]
+        if not valid or distance_km(lat, lng, named_lat, named_lng) > SNAP_DISTANCE_KM:
+            lat, lng = named_lat, named_lng
+        if not normalize_state(location.get('state')):
+            location['state'] = gazetteer.states[index]
+    elif valid:
+        if not location.get('city'):
+            nearest, _ = gazetteer.nearest(lat, lng, max_km=SNAP_DISTANCE_KM)
+            if nearest is not None:
+                location['city'] = gazetteer.cities[nearest]
+                location['state'] = gazetteer.states[nearest]
+    else:
+        index = gazetteer.state_index(location.get('state'))
+        if index is None:
+            return location
+        lat, lng = gazetteer.lats[index], gazetteer.lngs[index]
+
+    location['lat'] = round(lat, 4)
+    location['lng'] = round(lng, 4)
+    return location
+
+
+def resolve_record(record, gazetteer=None):
+    """Resolve an incident or trend record's location, using its DMA when the city is missing"""
+    gazetteer = gazetteer or get_gazetteer()
+    location = record.get('location')
+    if not isinstance(location, dict):
+        location = {}
+
+    dma = gazetteer.dma(record.get('dma_code'))
+    if dma is not None and gazetteer.find(location.get('city'), location.get('state')) is None:
+        if not location.get('city') or _coordinate(location.get('lat')) is None:
+            location.update(gazetteer.location(dma[1]))
+
+    if location:
+        record['location'] = resolve_location(location, gazetteer)
+    return record
+
+
+def resolve_locations(obj):
+    """Resolve locations on a parsed object: a single record or a results/trends wrapper"""
+    if not isinstance(obj, dict):
+        return obj
+    if 'location' in obj or 'dma_code' in obj:
+        resolve_record(obj)
+    for key in ('results', 'trends'):
+        records = obj.get(key)
+        if isinstance(records, list):
+            for record in records:
+                if isinstance(record, dict):
+                    resolve_record(record)
+    return obj
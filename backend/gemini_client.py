@@ -0,0 +1,213 @@
+"""
+Shared Gemini client and prebuilt request configs
+One lazily created genai.Client per process, reused across requests on warm instances.
+The google-genai SDK (most of a cold start's import time) is imported on first
+real use, so CORS preflights and cached responses never load it.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import admission
+import hedge
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ID = os.environ.get('PROJECT_ID', 'wz-fda-horizon-scan')
+LOCATION = os.environ.get('LOCATION', 'global')
+MODEL = 'gemini-2.5-flash'
+
+# Recreate the client periodically so long-lived instances do not hold stale connections
+CLIENT_MAX_AGE_SECONDS = float(os.environ.get('GENAI_CLIENT_MAX_AGE_SECONDS', '3600'))
+
+# Ask for typed JSON via response schemas (see schemas) instead of scraping JSON out of prose
+STRUCTURED_OUTPUT = os.environ.get('STRUCTURED_OUTPUT', '').lower() in ('1', 'true', 'yes')
+
+# live | record | replay | synthetic - see model_backend
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'live')
+
+SAFETY_CATEGORIES = (
+    "HARM_CATEGORY_HATE_SPEECH",
+    "HARM_CATEGORY_DANGEROUS_CONTENT",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+    "HARM_CATEGORY_HARASSMENT",
+)
+
+# Generation settings per endpoint - built into GenerateContentConfig objects on first use
+CONFIG_SPECS = {
+    'search': {'temperature': 0.2, 'max_output_tokens': 4096, 'seed': 0},
+    'search_stream': {'temperature': 0.2, 'max_output_tokens': 8192},
+    'search_thinking': {'temperature': 0.2, 'max_output_tokens': 8192, 'seed': 0},
+    'trends': {'temperature': 0.3, 'max_output_tokens': 8192, 'seed': 0},
+    'trends_stream': {'temperature': 0.3, 'max_output_tokens': 8192},
+}
+
+
+def _default_client_factory():
+    from google import genai
+    return genai.Client(
+        vertexai=True,
+        project=PROJECT_ID,
+        location=LOCATION,
+    )
+
+
+_client_factory = _default_client_factory
+_client = None
+_client_created_at = 0.0
+_client_lock = threading.Lock()
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client, creating or recycling it as needed"""
+    global _client, _client_created_at
+
+    client = _client
+    if client is not None and time.monotonic() - _client_created_at < CLIENT_MAX_AGE_SECONDS:
+        return client
+
+    with _client_lock:
+        if _client is None or time.monotonic() - _client_created_at >= CLIENT_MAX_AGE_SECONDS:
+            if _client is not None:
+                logger.info("Recycling Gemini client after max age")
+            _client = _client_factory()
+            _client_created_at = time.monotonic()
+        return _client
+
+
+def reset_client(client=None):
+    """
+    Drop the shared client so the next request builds a fresh one.
+    If client is given, only reset when it is still the current one.
+    """
+    global _client
+
+    with _client_lock:
+        if client is None or client is _client:
+            _client = None
+
+
+def set_client_factory(factory):
+    """Replace the client factory (e.g. with a stub) and drop the current client"""
+    global _client_factory
+
+    with _client_lock:
+        _client_factory = factory or _default_client_factory
+    reset_client()
+
+
+def _build_config(temperature, max_output_tokens, seed=None, response_schema=None):
+    from google.genai import types
+
+    if response_schema is not None:
+        # gemini-2.5-flash rejects response schemas combined with tools, so the
+        # structured mode answers from the model without Google Search grounding
+        # (search_grounded() is False; responses label their source accordingly)
+        output_settings = {'response_mime_type': 'application/json', 'response_schema': response_schema}
+    else:
+        output_settings = {'tools': [types.Tool(google_search=types.GoogleSearch())]}
+
+    return types.GenerateContentConfig(
+        temperature=temperature,
+        top_p=0.95,
+        seed=seed,
+        max_output_tokens=max_output_tokens,
+        safety_settings=[
+            types.SafetySetting(category=category, threshold="OFF")
+            for category in SAFETY_CATEGORIES
+        ],
+        thinking_config=types.ThinkingConfig(
+            thinking_budget=0,  # Zero for fast response
+            include_thoughts=False
+        ),
+        **output_settings,
+    )
+
+
+def search_grounded(structured=None):
+    """Whether generations are grounded with the Google Search tool (structured mode sends a schema instead)"""
+    if structured is None:
+        structured = STRUCTURED_OUTPUT
+    return not structured
+
+
+def get_config(endpoint, structured=None):
+    """Return the prebuilt GenerateContentConfig for an endpoint (structured defaults to STRUCTURED_OUTPUT)"""
+    if structured is None:
+        structured = STRUCTURED_OUTPUT
+    key = (endpoint, structured)
+    config = _configs.get(key)
+    if config is None:
+        with _configs_lock:
+            config = _configs.get(key)
+            if config is None:
+                spec = dict(CONFIG_SPECS[endpoint])
+                if structured:
+                    from schemas import RESPONSE_SCHEMAS
+                    spec['response_schema'] = RESPONSE_SCHEMAS[endpoint]
+                config = _build_config(**spec)
+                _configs[key] = config
+    return config
+
+
+def build_contents(prompt):
+    from google.genai import types
+    return [
+        types.Content(
+            role="user",
+            parts=[types.Part(text=prompt)]
+        )
+    ]
+
+
+def chunk_text(chunk):
+    """Text parts of a single response chunk"""
+    if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+        return [part.text for part in chunk.candidates[0].content.parts if part.text]
+    return ()
+
+
+def get_backend():
+    """Return the model backend serving every generate_content_stream call (MODEL_BACKEND on first use)"""
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                from model_backend import create_backend
+                _backend = create_backend(MODEL_BACKEND)
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the model backend, e.g. for a replay or synthetic stand-in"""
+    global _backend
+    _backend = backend
+
+
+def generate_content_stream(endpoint, prompt, deadline=None, cancel=None):
+    """
+    Stream a Gemini response for prompt with the endpoint's prebuilt config,
+    hedged, retried and bounded by deadline (a time.monotonic() value) - see hedge.
+    Setting the cancel event closes the upstream request at its next chunk.
+    The generation holds one of the instance's upstream slots from its first chunk
+    request until it is exhausted or closed, and raises admission.Overloaded when
+    no slot frees up in time.
+    """
+    backend = get_backend()
+    with admission.slot(endpoint, deadline):
+        yield from hedge.hedged_stream(endpoint, lambda: backend.generate_content_stream(endpoint, prompt), deadline, cancel)
+
+
+def agenerate_content_stream(endpoint, prompt, deadline=None):
+    """Async counterpart of generate_content_stream"""
+    backend = get_backend()
+    return hedge.ahedged_stream(endpoint, lambda: backend.agenerate_content_stream(endpoint, prompt), deadline)
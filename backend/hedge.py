@@ -0,0 +1,392 @@
+"""
+Hedged, deadline-aware upstream calls
+Wraps every generate_content_stream call: a per-request deadline, a second
+(hedged) request when no first chunk arrives within a latency percentile of
+recent calls, cancellation of whichever request loses, and bounded retry
+with full jitter for retriable errors that happen before any output
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds an upstream call may take end to end (0 = no deadline)
+UPSTREAM_DEADLINE_SECONDS = float(os.environ.get('UPSTREAM_DEADLINE_SECONDS', '120'))
+
+# Launch a hedged request when the first chunk is later than this percentile of recent calls
+HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))
+# Hedge delay until enough first-chunk samples exist, and the floor it never goes below
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.environ.get('HEDGE_DEFAULT_DELAY_SECONDS', '5'))
+HEDGE_MIN_DELAY_SECONDS = float(os.environ.get('HEDGE_MIN_DELAY_SECONDS', '0.05'))
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+# Most of the recent calls that may be hedged, so a slow upstream is not hit twice as hard
+HEDGE_MAX_RATE = float(os.environ.get('HEDGE_MAX_RATE', '0.1'))
+
+# Retries for retriable errors raised before the first chunk, with full-jitter backoff
+UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', '2'))
+RETRY_BASE_SECONDS = float(os.environ.get('RETRY_BASE_SECONDS', '0.25'))
+RETRY_MAX_SECONDS = float(os.environ.get('RETRY_MAX_SECONDS', '4'))
+
+# How often a wait for upstream chunks checks the cancel event, so a stalled call can be abandoned
+CANCEL_POLL_SECONDS = 0.1
+
+# Recent calls per endpoint that the hedge threshold and hedge rate are computed over
+LATENCY_WINDOW = 200
+
+RETRIABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The upstream call did not finish before its deadline"""
+
+
+def is_retriable(error):
+    """Transport failures, rate limits and server errors - not bad requests"""
+    if isinstance(error, ConnectionError):
+        return True
+    # httpx and the SDK are only imported once the SDK is in use, and only then can their errors occur
+    httpx = sys.modules.get('httpx')
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    genai_errors = sys.modules.get('google.genai.errors')
+    return genai_errors is not None and isinstance(error, genai_errors.APIError) and error.code in RETRIABLE_STATUS_CODES
+
+
+def retry_delay(attempt):
+    """Full-jitter exponential backoff for the attempt-th retry"""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+
+
+class LatencyTracker:
+    """Recent first-chunk latencies and hedges for one endpoint"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.first_chunk = collections.deque(maxlen=window)
+        self.hedged = collections.deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.deadlines = 0
+        self._lock = threading.Lock()
+
+    def hedge_delay(self):
+        """Seconds to wait for a first chunk before hedging, or None when hedging is off or over budget"""
+        if not HEDGE_ENABLED:
+            return None
+        with self._lock:
+            if self.hedged and sum(self.hedged) >= HEDGE_MAX_RATE * len(self.hedged):
+                return None
+            if len(self.first_chunk) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY_SECONDS
+            ordered = sorted(self.first_chunk)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(HEDGE_MIN_DELAY_SECONDS, ordered[index])
+
+    def record(self, first_chunk_s, hedged):
+        with self._lock:
+            if first_chunk_s is not None:
+                self.first_chunk.append(first_chunk_s)
+            self.hedged.append(hedged)
+
+    def count(self, name, endpoint):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        if metrics.METRICS_ENABLED:
+            metrics.registry.inc(f"fda_upstream_{name}_total", help_text=f"Upstream {name.replace('_', ' ')}",
+                                 endpoint=endpoint)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'hedge_rate': round(self.hedges / self.calls, 4) if self.calls else 0.0,
+                'retries': self.retries,
+                'deadlines': self.deadlines,
+            }
+
+
+_trackers = collections.defaultdict(LatencyTracker)
+
+
+def get_tracker(endpoint):
+    return _trackers[endpoint]
+
+
+def stats():
+    """Per-endpoint call, hedge, retry and deadline counts for this process"""
+    return {endpoint: tracker.stats() for endpoint, tracker in list(_trackers.items())}
+
+
+def _deadline_at(deadline):
+    if deadline is not None:
+        return deadline
+    return time.monotonic() + UPSTREAM_DEADLINE_SECONDS if UPSTREAM_DEADLINE_SECONDS > 0 else None
+
+
+def _wait_timeout(until, cancel):
+    """Seconds to block for the next attempt event: until a wake-up time, in slices while cancel may be set"""
+    timeout = None if until is None else max(0.0, until - time.monotonic())
+    if cancel is not None:
+        timeout = CANCEL_POLL_SECONDS if timeout is None else min(timeout, CANCEL_POLL_SECONDS)
+    return timeout
+
+
+def _passthrough():
+    return not HEDGE_ENABLED and UPSTREAM_DEADLINE_SECONDS <= 0 and UPSTREAM_MAX_RETRIES <= 0
+
+
+_CHUNK, _DONE, _ERROR, _CANCELLED = 'chunk', 'done', 'error', 'cancelled'
+
+
+class _Attempt:
+    """One upstream request, pumped by a daemon thread into a queue shared with its siblings"""
+
+    def __init__(self, number, start, events, trace, cancel=None):
+        self.number = number
+        self.started = time.monotonic()
+        self.cancelled = threading.Event()
+        thread = threading.Thread(target=self._run, args=(start, events, trace, cancel), daemon=True,
+                                  name=f"upstream-{number}")
+        thread.start()
+
+    def _run(self, start, events, trace, cancel):
+        metrics.activate(trace)
+        stream = None
+        try:
+            stream = start()
+            for chunk in stream:
+                # A blocked read cannot be interrupted; a cancelled request stops at its next chunk
+                if self.cancelled.is_set():
+                    return
+                if cancel is not None and cancel.is_set():
+                    events.put((self, _CANCELLED, None))
+                    return
+                events.put((self, _CHUNK, chunk))
+            events.put((self, _DONE, None))
+        except Exception as e:
+            events.put((self, _ERROR, e))
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+def hedged_stream(endpoint, start, deadline=None, cancel=None):
+    """
+    Yield the chunks of start() -> chunk iterator under the endpoint's deadline,
+    hedge and retry policy. deadline is an absolute time.monotonic() value
+    (default: UPSTREAM_DEADLINE_SECONDS from now). Setting the cancel event ends
+    the stream quietly within CANCEL_POLL_SECONDS, even while no chunk is arriving;
+    the upstream request is closed at its next chunk (a blocked read cannot be interrupted).
+    """
+    if _passthrough() and deadline is None:
+        yield from start()
+        return
+
+    tracker = get_tracker(endpoint)
+    tracker.count('calls', endpoint)
+    trace = metrics.current_trace()
+    deadline = _deadline_at(deadline)
+    events = queue.Queue()
+    attempts = []
+
+    def launch():
+        attempts.append(_Attempt(len(attempts), start, events, trace, cancel))
+
+    launch()
+    hedge_delay = tracker.hedge_delay()
+    hedge_at = attempts[0].started + hedge_delay if hedge_delay is not None else None
+    retry_at = None
+    retries = 0
+    hedge = None
+    winner = None
+    try:
+        # Wait for the first attempt to produce a chunk (or finish empty)
+        while winner is None:
+            wake = min((t for t in (hedge_at, retry_at, deadline) if t is not None), default=None)
+            try:
+                attempt, kind, payload = events.get(timeout=_wait_timeout(wake, cancel))
+            except queue.Empty:
+                if cancel is not None and cancel.is_set():
+                    return
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    tracker.count('deadlines', endpoint)
+                    raise DeadlineExceeded(f"{endpoint}: no upstream response within the deadline")
+                if retry_at is not None and now >= retry_at:
+                    retry_at = None
+                    launch()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    tracker.count('hedges', endpoint)
+                    trace.hedged = True
+                    launch()
+                    hedge = attempts[-1]
+                continue
+
+            if attempt.cancelled.is_set():
+                continue
+            if kind == _CANCELLED:
+                return
+            if kind == _ERROR:
+                attempt.cancel()
+                if any(not a.cancelled.is_set() for a in attempts) or retry_at is not None:
+                    continue  # A sibling may still answer
+                if not is_retriable(payload) or retries >= UPSTREAM_MAX_RETRIES:
+                    raise payload
+                retries += 1
+                tracker.count('retries', endpoint)
+                trace.retries = retries
+                retry_at = time.monotonic() + retry_delay(retries)
+                if deadline is not None and retry_at >= deadline:
+                    raise payload
+                logger.warning(f"{endpoint}: retrying upstream call ({retries}/{UPSTREAM_MAX_RETRIES}) after {payload}")
+                continue
+            winner = attempt
+
+        if winner is hedge:
+            tracker.count('hedge_wins', endpoint)
+        tracker.record(time.monotonic() - winner.started, hedge is not None)
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+
+        # Stream the winner
+        while kind == _CHUNK:
+            yield payload
+            while True:
+                try:
+                    attempt, kind, payload = events.get(timeout=_wait_timeout(deadline, cancel))
+                except queue.Empty:
+                    if cancel is not None and cancel.is_set():
+                        return
+                    if deadline is not None and time.monotonic() >= deadline:
+                        tracker.count('deadlines', endpoint)
+                        raise DeadlineExceeded(f"{endpoint}: upstream stream did not finish within the deadline")
+                    continue
+                if attempt is winner:
+                    break
+        if kind == _ERROR:
+            raise payload
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+
+async def ahedged_stream(endpoint, start, deadline=None):
+    """Async counterpart of hedged_stream; losing requests are cancelled outright"""
+    if _passthrough() and deadline is None:
+        async for chunk in start():
+            yield chunk
+        return
+
+    tracker = get_tracker(endpoint)
+    tracker.count('calls', endpoint)
+    trace = metrics.current_trace()
+    deadline = _deadline_at(deadline)
+    events = asyncio.Queue()
+    attempts = {}
+
+    async def pump(number):
+        stream = start()
+        try:
+            async for chunk in stream:
+                await events.put((number, _CHUNK, chunk))
+            await events.put((number, _DONE, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await events.put((number, _ERROR, e))
+        finally:
+            await stream.aclose()
+
+    def launch():
+        number = len(attempts)
+        attempts[number] = (time.monotonic(), asyncio.ensure_future(pump(number)))
+
+    launch()
+    hedge_delay = tracker.hedge_delay()
+    hedge_at = attempts[0][0] + hedge_delay if hedge_delay is not None else None
+    retry_at = None
+    retries = 0
+    hedge = None
+    failed = set()
+    winner = None
+    try:
+        while winner is None:
+            wake = min((t for t in (hedge_at, retry_at, deadline) if t is not None), default=None)
+            try:
+                number, kind, payload = await asyncio.wait_for(
+                    events.get(), None if wake is None else max(0.0, wake - time.monotonic()))
+            except asyncio.TimeoutError:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    tracker.count('deadlines', endpoint)
+                    raise DeadlineExceeded(f"{endpoint}: no upstream response within the deadline")
+                if retry_at is not None and now >= retry_at:
+                    retry_at = None
+                    launch()
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    tracker.count('hedges', endpoint)
+                    trace.hedged = True
+                    launch()
+                    hedge = len(attempts) - 1
+                continue
+
+            if kind == _ERROR:
+                failed.add(number)
+                if len(failed) < len(attempts) or retry_at is not None:
+                    continue
+                if not is_retriable(payload) or retries >= UPSTREAM_MAX_RETRIES:
+                    raise payload
+                retries += 1
+                tracker.count('retries', endpoint)
+                trace.retries = retries
+                retry_at = time.monotonic() + retry_delay(retries)
+                if deadline is not None and retry_at >= deadline:
+                    raise payload
+                logger.warning(f"{endpoint}: retrying upstream call ({retries}/{UPSTREAM_MAX_RETRIES}) after {payload}")
+                continue
+            winner = number
+
+        started, _ = attempts[winner]
+        if winner == hedge:
+            tracker.count('hedge_wins', endpoint)
+        tracker.record(time.monotonic() - started, hedge is not None)
+        for number, (_, task) in attempts.items():
+            if number != winner:
+                task.cancel()
+
+        while kind == _CHUNK:
+            yield payload
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    number, kind, payload = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    tracker.count('deadlines', endpoint)
+                    raise DeadlineExceeded(f"{endpoint}: upstream stream did not finish within the deadline")
+                if number == winner:
+                    break
+        if kind == _ERROR:
+            raise payload
+    finally:
+        for _, task in attempts.values():
+            task.cancel()
@@ -0,0 +1,314 @@
+"""
+Server-side hotspot tiles for the map
+Every located result/trend record is binned into a Web Mercator grid cell at
+each zoom level (HOTSPOT_CELLS_PER_TILE cells across each z/x/y map tile), and
+each cell keeps a count, intensity, weighted centroid and severity/type mix.
+Records are buffered and folded into the per-level arrays in vectorized
+batches. A bounding box + zoom query returns at most HOTSPOT_MAX_FEATURES
+clusters however many events there are, coarsening the zoom when a view
+holds more cells than that.
+"""
+
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+import dedup
+from aggregate import EVENT_TYPES, FOLD_BATCH_SIZE, SEVERITIES, event_record, record_values
+from event_store import ENDPOINT_EVENT_TYPES, get_event_store, records_of
+
+logger = logging.getLogger(__name__)
+
+HOTSPOT_MIN_ZOOM = int(os.environ.get('HOTSPOT_MIN_ZOOM', '2'))
+HOTSPOT_MAX_ZOOM = int(os.environ.get('HOTSPOT_MAX_ZOOM', '12'))
+
+# Cells across one 256px map tile (a power of two; 4 = 64px clusters)
+HOTSPOT_CELLS_PER_TILE = int(os.environ.get('HOTSPOT_CELLS_PER_TILE', '4'))
+
+# Most features one query returns
+HOTSPOT_MAX_FEATURES = int(os.environ.get('HOTSPOT_MAX_FEATURES', '200'))
+
+# Stored events replayed into a new instance's index on first use
+HOTSPOT_BOOTSTRAP_EVENTS = int(os.environ.get('HOTSPOT_BOOTSTRAP_EVENTS', '10000'))
+
+# Web Mercator's latitude limit
+MAX_LATITUDE = 85.05112878
+
+WORLD = (-180.0, -MAX_LATITUDE, 180.0, MAX_LATITUDE)
+
+
+def _mercator(lat, lng):
+    """Fractions (x, y) in [0, 1) of the Web Mercator world for coordinate arrays"""
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (lng + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+def _latitude(y):
+    """Latitude of a Web Mercator y fraction"""
+    return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y))))
+
+
+class _Level:
+    """Per-cell accumulators for one zoom level, rows grown by doubling"""
+
+    FIELDS = ('count', 'weight', 'affected', 'lat', 'lng', 'centroid_weight')
+
+    def __init__(self, zoom, cells_per_tile):
+        self.zoom = zoom
+        self.size = (2 ** zoom) * cells_per_tile
+        self.rows = {}
+        self.n = 0
+        self._allocate(64)
+
+    def _allocate(self, capacity):
+        self.x = np.zeros(capacity, dtype=np.int64)
+        self.y = np.zeros(capacity, dtype=np.int64)
+        self.sums = np.zeros((len(self.FIELDS), capacity), dtype=np.float64)
+        self.severity = np.zeros((capacity, len(SEVERITIES)), dtype=np.int64)
+        self.types = np.zeros((capacity, len(EVENT_TYPES)), dtype=np.int64)
+
+    def _grow(self, needed):
+        capacity = len(self.x)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == len(self.x):
+            return
+        x, y, sums, severity, types, n = self.x, self.y, self.sums, self.severity, self.types, self.n
+        self._allocate(capacity)
+        self.x[:n], self.y[:n], self.sums[:, :n] = x[:n], y[:n], sums[:, :n]
+        self.severity[:n], self.types[:n] = severity[:n], types[:n]
+
+    def fold(self, fx, fy, values, severities, types):
+        """Add a batch: Mercator fractions, (FIELDS x batch) sums and per-record severity/type codes"""
+        cx = (fx * self.size).astype(np.int64)
+        cy = (fy * self.size).astype(np.int64)
+        cells, first, inverse = np.unique(cy * self.size + cx, return_index=True, return_inverse=True)
+
+        # Rows for cells seen before, new rows appended for the rest
+        rows = np.empty(len(cells), dtype=np.int64)
+        new = []
+        for i, cell in enumerate(cells.tolist()):
+            row = self.rows.get(cell)
+            if row is None:
+                row = self.rows[cell] = self.n + len(new)
+                new.append(i)
+            rows[i] = row
+        if new:
+            self._grow(self.n + len(new))
+            new_rows = rows[new]
+            self.x[new_rows], self.y[new_rows] = cx[first[new]], cy[first[new]]
+            self.n += len(new)
+
+        k = len(cells)
+        self.sums[:, rows] += np.stack([np.bincount(inverse, weights=field, minlength=k) for field in values])
+        self.severity[rows] += np.bincount(inverse * len(SEVERITIES) + severities,
+                                           minlength=k * len(SEVERITIES)).reshape(k, len(SEVERITIES))
+        self.types[rows] += np.bincount(inverse * len(EVENT_TYPES) + types,
+                                        minlength=k * len(EVENT_TYPES)).reshape(k, len(EVENT_TYPES))
+
+    def in_bbox(self, west, south, east, north):
+        """Rows of cells intersecting the box (west > east crosses the antimeridian)"""
+        x0, y1 = _mercator(np.array([south]), np.array([west]))
+        x1, y0 = _mercator(np.array([north]), np.array([east]))
+        x0, x1 = int(x0[0] * self.size), int(x1[0] * self.size)
+        y0, y1 = int(y0[0] * self.size), int(y1[0] * self.size)
+        x, y = self.x[:self.n], self.y[:self.n]
+        in_x = (x >= x0) & (x <= x1) if west <= east else (x >= x0) | (x <= x1)
+        return np.flatnonzero(in_x & (y >= y0) & (y <= y1))
+
+
+class HotspotIndex:
+    """
+    Hotspot cells for every zoom level from min_zoom to max_zoom. add() buffers
+    records; they are folded into all levels every FOLD_BATCH_SIZE records and
+    before each query. Duplicate incidents (see dedup) are counted once.
+    """
+
+    def __init__(self, min_zoom=HOTSPOT_MIN_ZOOM, max_zoom=HOTSPOT_MAX_ZOOM, cells_per_tile=HOTSPOT_CELLS_PER_TILE,
+                 max_features=HOTSPOT_MAX_FEATURES):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.cells_per_tile = cells_per_tile
+        self.max_features = max_features
+        self.levels = {zoom: _Level(zoom, cells_per_tile) for zoom in range(min_zoom, max_zoom + 1)}
+        self.total = 0
+        self.unlocated = 0
+        self.duplicates = 0
+        self._dedup = dedup.DedupIndex() if dedup.DEDUP_ENABLED else None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, event_type, record):
+        """Buffer one parsed result/trend record"""
+        if not isinstance(record, dict):
+            return
+        if self._dedup is not None and self._dedup.add(event_type, record) is not None:
+            self.duplicates += 1
+            return
+        values = record_values(event_type, record)
+        with self._lock:
+            self._pending.append(values)
+            if len(self._pending) >= FOLD_BATCH_SIZE:
+                self._fold()
+
+    def add_event(self, event):
+        """Buffer an SSE event payload ({'type': 'result'|'trend', 'data': {...}}) or a bare record"""
+        self.add(*event_record(event))
+
+    def observe(self, endpoint, query, obj):
+        """Add the records in a parsed object from a Gemini endpoint"""
+        event_type = ENDPOINT_EVENT_TYPES.get(endpoint, 'result')
+        for record in records_of(obj):
+            self.add(event_type, record)
+
+    def _fold(self):
+        if not self._pending:
+            return
+        batch = np.array(self._pending, dtype=np.float64)
+        self._pending = []
+        self.total += len(batch)
+
+        lat, lng = batch[:, 5], batch[:, 6]
+        located = np.isfinite(lat) & np.isfinite(lng) & (np.abs(lat) <= 90) & (np.abs(lng) <= 180)
+        self.unlocated += int((~located).sum())
+        if not located.any():
+            return
+        batch, lat, lng = batch[located], lat[located], lng[located]
+        types, severities = batch[:, 0].astype(np.int64), batch[:, 1].astype(np.int64)
+        affected, weight = batch[:, 3], batch[:, 4]
+        # Centroids are weighted by intensity, falling back to plain means for zero-weight records
+        centroid_weight = np.where(weight > 0, weight, 1e-9)
+        values = (np.ones(len(batch)), weight, affected, lat * centroid_weight, lng * centroid_weight, centroid_weight)
+        fx, fy = _mercator(lat, lng)
+        for level in self.levels.values():
+            level.fold(fx, fy, values, severities, types)
+
+    def flush(self):
+        """Fold buffered records now"""
+        with self._lock:
+            self._fold()
+
+    def query(self, bbox=None, zoom=4, limit=None):
+        """
+        Clusters intersecting bbox (west, south, east, north) at zoom, heaviest
+        first: at most limit (capped at max_features). When the view holds more
+        cells than that, coarser zoom levels are used; when even the coarsest
+        does, only the heaviest cells are returned and truncated is set.
+        """
+        west, south, east, north = bbox or WORLD
+        limit = max(1, min(int(limit or self.max_features), self.max_features))
+        zoom = max(self.min_zoom, min(int(zoom), self.max_zoom))
+        with self._lock:
+            self._fold()
+            for cluster_zoom in range(zoom, self.min_zoom - 1, -1):
+                level = self.levels[cluster_zoom]
+                rows = level.in_bbox(west, south, east, north)
+                if len(rows) <= limit:
+                    break
+            sums = level.sums[:, rows]
+            x, y = level.x[rows], level.y[rows]
+            severity, types = level.severity[rows], level.types[rows]
+            total = self.total
+
+        count, weight, affected, lat, lng, centroid_weight = sums
+        events = int(count.sum())
+        truncated = len(rows) > limit
+        order = np.argsort(-weight, kind='stable')
+        if truncated:
+            order = order[:limit]
+        tile_shift = self.cells_per_tile.bit_length() - 1
+        features = []
+        for i in order.tolist():
+            mix = severity[i]
+            features.append({
+                'lat': round(float(lat[i] / centroid_weight[i]), 4),
+                'lng': round(float(lng[i] / centroid_weight[i]), 4),
+                'intensity': round(float(weight[i]), 2),
+                'count': int(count[i]),
+                'affected': int(affected[i]),
+                # Worst severity present, for the map's marker color
+                'severity': SEVERITIES[int(np.flatnonzero(mix)[0])] if mix.any() else 'unknown',
+                'severity_mix': {name: int(n) for name, n in zip(SEVERITIES, mix) if n},
+                'types': {name: int(n) for name, n in zip(EVENT_TYPES, types[i]) if n},
+                'tile': f"{cluster_zoom}/{int(x[i]) >> tile_shift}/{int(y[i]) >> tile_shift}",
+                'bounds': [
+                    round(int(x[i]) / level.size * 360.0 - 180.0, 4),
+                    round(_latitude((int(y[i]) + 1) / level.size), 4),
+                    round((int(x[i]) + 1) / level.size * 360.0 - 180.0, 4),
+                    round(_latitude(int(y[i]) / level.size), 4),
+                ],
+            })
+        return {
+            'features': features,
+            'zoom': zoom,
+            'cluster_zoom': cluster_zoom,
+            'events_in_view': events,
+            'cells_in_view': int(len(rows)),
+            'truncated': truncated,
+            'events_indexed': total,
+        }
+
+    def load_events(self, event_store, max_events=HOTSPOT_BOOTSTRAP_EVENTS):
+        """Replay up to max_events stored events, newest first; returns how many were read"""
+        read, cursor = 0, None
+        while read < max_events:
+            events, cursor = event_store.query(limit=min(500, max_events - read), cursor=cursor)
+            for event in events:
+                self.add(event['type'], event['data'])
+            read += len(events)
+            if cursor is None:
+                break
+        return read
+
+
+_hotspot_index = None
+_hotspot_index_lock = threading.Lock()
+_build_started = threading.Event()
+
+
+def get_hotspot_index():
+    """
+    Return the process-wide hotspot index, seeded on first use from the events
+    the store has already committed (waiting for a background build in progress)
+    """
+    global _hotspot_index
+
+    if _hotspot_index is None:
+        with _hotspot_index_lock:
+            if _hotspot_index is None:
+                index = HotspotIndex()
+                try:
+                    read = index.load_events(get_event_store())
+                    if read:
+                        logger.info(f"Seeded hotspot index with {read} stored events")
+                except Exception as e:
+                    logger.error(f"Could not seed hotspot index from the event store: {e}")
+                _hotspot_index = index
+    return _hotspot_index
+
+
+def observe(endpoint, query, obj):
+    """
+    Add live records to the index. The first one starts building it on a background
+    thread, so streams never wait for seeding; records arriving before it is ready
+    are dropped. Callers observe before recording to the event store, so seeding
+    never replays a record that was added live.
+    """
+    index = _hotspot_index
+    if index is not None:
+        index.observe(endpoint, query, obj)
+    elif not _build_started.is_set():
+        _build_started.set()
+        threading.Thread(target=get_hotspot_index, name="hotspot-index-build", daemon=True).start()
+
+
+def set_hotspot_index(hotspot_index):
+    """Swap the process-wide hotspot index (e.g. for an empty one)"""
+    global _hotspot_index
+    _hotspot_index = hotspot_index
+    _build_started.clear()
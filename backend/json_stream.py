@@ -0,0 +1,109 @@
+"""
+Incremental JSON object extraction for streamed Gemini output
+Scans each character once across chunks and decodes top-level objects as they close
+"""
+
+import json
+import re
+
+# Characters that matter while inside an object (outside a string) and inside a string
+_OBJECT_SPECIAL = re.compile(r'[{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class JsonObjectExtractor:
+    """
+    Stateful extractor for top-level JSON objects embedded in streamed text.
+
+    Scan position, brace depth and in-string/escape state are carried across
+    feed() calls, so each chunk is scanned exactly once. Text outside objects
+    (prose, markdown fences, array brackets) is skipped without being copied;
+    only the text of an object spanning several chunks is held until it closes.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.objects = 0
+        self.decode_errors = 0
+        self.chars_scanned = 0
+        self._parts = []
+
+    def feed(self, text):
+        """Scan a chunk of text and return the list of objects completed by it"""
+        results = []
+        if not text:
+            return results
+
+        n = len(text)
+        self.chars_scanned += n
+        pos = 0
+        start = 0
+
+        # A backslash at the end of the previous chunk escapes our first character
+        if self.escape:
+            self.escape = False
+            pos = 1
+
+        while pos < n:
+            if self.depth == 0:
+                # Outside any object - jump straight to the next opening brace
+                pos = text.find('{', pos)
+                if pos == -1:
+                    break
+                start = pos
+                self.depth = 1
+                pos += 1
+            elif self.in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    pos = n
+                    break
+                pos = match.end()
+                if match.group() == '"':
+                    self.in_string = False
+                elif pos >= n:
+                    self.escape = True
+                else:
+                    pos += 1
+            else:
+                match = _OBJECT_SPECIAL.search(text, pos)
+                if match is None:
+                    pos = n
+                    break
+                pos = match.end()
+                char = match.group()
+                if char == '"':
+                    self.in_string = True
+                elif char == '{':
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        obj = self._decode(text[start:pos])
+                        if obj is not None:
+                            results.append(obj)
+
+        # Hold on to the unfinished object's text until a later chunk closes it
+        if self.depth > 0:
+            self._parts.append(text[start:])
+
+        return results
+
+    def _decode(self, tail):
+        if self._parts:
+            self._parts.append(tail)
+            json_str = ''.join(self._parts)
+            self._parts = []
+        else:
+            json_str = tail
+
+        try:
+            obj = json.loads(json_str)
+        except json.JSONDecodeError:
+            self.decode_errors += 1
+            return None
+
+        self.objects += 1
+        return obj
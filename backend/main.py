@@ -6,124 +6,273 @@ Supports Server-Sent Events (SSE) for streaming responses
 
 import functions_framework
 from flask import jsonify, Response, request
-from google import genai
-from google.genai import types
 import json
 import logging
+import os
+import queue
+import threading
 from datetime import datetime
 import time
 
+import admission
+import dedup
+import gemini_client
+import hedge
+import hotspots
+import metrics
+import prompts
+import resume
+import scheduler
+import sse
+import watchlist
+from cache import cache_key, cached, get_query_cache
+from aggregate import StreamAggregator, aggregate_events, event_record
+from coalesce import STOP_POLL_SECONDS, SingleFlight
+from event_store import FILTERS, get_event_store
+from gazetteer import resolve_locations
+from json_stream import JsonObjectExtractor
+from timeseries import get_series_store
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def search_with_gemini(query):
+# Concurrent identical stream requests share one upstream Gemini stream
+stream_flights = SingleFlight()
+
+# Serve the SSE endpoints from the asyncio pipeline instead of a thread-bound generator
+ASYNC_STREAMING = os.environ.get('ASYNC_STREAMING', '').lower() in ('1', 'true', 'yes')
+
+def _resumed_stream(request, key):
     """
-    REAL Gemini 2.5 Flash implementation with Google Search grounding
-    Always returns fresh data from current news and health sources
+    Frames after the client's Last-Event-ID when it is reconnecting to a stream
+    this instance still holds (EventSource sends the header; ?last_event_id= also works)
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return resume.resume(key, last_event_id)
+
+def _sse_format(request):
+    """
+    Whether the client asked for the compact wire format (?compact=1 or "compact": true)
+    and, for compact streams, the Content-Encoding negotiated from Accept-Encoding
+    """
+    compact = _request_flag(request, 'compact')
+    return compact, sse.negotiate(request.headers.get('Accept-Encoding')) if compact else None
+
+def _sse_response(frames, encoding=None):
+    """Wrap an iterator of SSE frames in a streaming response, compressed when encoding is set"""
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'Access-Control-Allow-Origin': '*'
+    }
+    if encoding:
+        frames = sse.compress(frames, encoding)
+        headers['Content-Encoding'] = encoding
+        headers['Vary'] = 'Accept-Encoding'
+    return Response(frames, mimetype="text/event-stream", headers=headers)
+
+def _too_many_requests(retry_after):
+    """429 telling the client when this instance expects to have room again"""
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Retry-After': str(retry_after)
+    }
+    return jsonify({'error': 'Too many requests in flight - retry later', 'retry_after': retry_after}), 429, headers
+
+def _overloaded_response(error):
+    """The 429 for an error raised because this instance or the upstream quota is saturated, else None"""
+    retry_after = admission.retry_after(error)
+    return _too_many_requests(retry_after) if retry_after is not None else None
+
+def _admission_rejection(endpoints, query):
+    """
+    A 429 when a stream would need a new upstream generation that could not even
+    queue for a slot. Streams the cache or an identical in-flight stream can serve
+    go ahead; the check runs before the 200 so clients see a status, not an error event.
+    """
+    for endpoint in endpoints:
+        retry_after = admission.rejection(endpoint)
+        if retry_after is None:
+            continue
+        if get_query_cache().lookup(endpoint, query)[0] is not None or stream_flights.in_flight(cache_key(endpoint, query)):
+            continue
+        return _too_many_requests(retry_after)
+    return None
+
+def _get_query(request, default):
+    """Read the query from a JSON body, falling back to the ?query= parameter used by EventSource"""
+    request_json = request.get_json(silent=True)
+    if request_json and request_json.get('query'):
+        return request_json['query']
+    return request.args.get('query') or default
+
+def _request_flag(request, name):
+    """Whether an opt-in flag is set in the JSON body ("name": true) or the query string (?name=1)"""
+    request_json = request.get_json(silent=True)
+    if isinstance(request_json, dict) and request_json.get(name):
+        return True
+    return request.args.get(name) in ('1', 'true')
+
+def _request_param(request, name):
+    """A string parameter from the JSON body or the query string, or None"""
+    request_json = request.get_json(silent=True)
+    if isinstance(request_json, dict) and request_json.get(name):
+        return str(request_json[name])
+    return request.args.get(name) or None
+
+def _request_limit(request, name):
+    """A positive integer parameter (e.g. max_results), None when absent; ValueError when malformed"""
+    value = _request_param(request, name)
+    if value is None:
+        return None
+    value = int(value)
+    if value <= 0:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+def _wants_metrics(request):
+    """Whether the client asked for a final metrics SSE event (?metrics=1 or "metrics": true)"""
+    return metrics.METRICS_ENABLED and _request_flag(request, 'metrics')
+
+def _search_source(live=True):
+    """'source' label for Gemini search answers, claiming Google Search only when the config is grounded"""
+    if not gemini_client.search_grounded():
+        return 'Gemini 2.5 Flash (structured output, not grounded in Google Search)'
+    return 'Gemini 2.5 Flash with Google Search (LIVE)' if live else 'Gemini 2.5 Flash with Google Search'
+
+def _aggregate_event(aggregator, final=False):
+    """SSE frame carrying the current aggregate snapshot"""
+    return {'type': 'aggregate', 'final': final, 'data': aggregator.snapshot(), 'timestamp': datetime.now().isoformat()}
+
+def _record_live(endpoint, query, obj):
+    """Send a live (not cache-replayed) parsed object to the hotspot index, event store and time series"""
+    # Before recording: a new hotspot index is seeded from the event store
+    hotspots.observe(endpoint, query, obj)
+    # Queued for the background writer
+    get_event_store().record(endpoint, query, obj)
+    # Each live trends answer is one point in its DMAs' time series
+    get_series_store().observe(endpoint, query, obj)
+
+def _stream_objects(endpoint, query, trace=metrics.NULL_TRACE, cancelled=None, deadline=None):
     """
+    Yield each JSON object parsed from a streamed Gemini response, as soon as it
+    closes, recording chunk, byte, token and parse-failure counts on trace.
+    Stops, closing the upstream stream, at the first chunk after cancelled is set.
+    deadline (time.monotonic()) bounds the upstream call, its hedges and retries,
+    instead of the UPSTREAM_DEADLINE_SECONDS default.
+    """
+    extractor = JsonObjectExtractor()
+    metrics.activate(trace)
+    response_stream = gemini_client.generate_content_stream(endpoint, prompts.build_prompt(endpoint, query),
+                                                            deadline=deadline, cancel=cancelled)
     try:
-        client = genai.Client(
-            vertexai=True,
-            project="wz-fda-horizon-scan",
-            location="global",
-        )
+        for chunk in response_stream:
+            if cancelled is not None and cancelled.is_set():
+                return
+            texts = gemini_client.chunk_text(chunk)
+            trace.chunk(chunk, texts)
+            for text in texts:
+                for obj in extractor.feed(text):
+                    # Fill in or snap coordinates from the offline gazetteer
+                    obj = resolve_locations(obj)
+                    _record_live(endpoint, query, obj)
+                    yield obj
+    finally:
+        response_stream.close()
+        trace.parse_failures = extractor.decode_errors
 
-        model = "gemini-2.5-flash"
-        
-        # Build the prompt for FDA surveillance and health incidents
-        prompt = f"""You are an FDA health surveillance expert. Search for and analyze CURRENT information about: "{query}"
-
-Focus on finding REAL news reports, FDA announcements, and documented incidents related to the query. This could include:
-- FDA warning letters, enforcement actions, recalls
-- Regulatory violations and compliance issues
-- Health incidents, adverse events, outbreaks
-- Product safety issues and contamination
-- Medical device and drug problems
-- Any other relevant health or regulatory matters
-
-Search for ACTUAL news articles and official reports. Provide exactly 5 results based on real sources.
-
-Use this exact JSON format:
-{{
-  "results": [
-    {{
-      "title": "Brief title from the actual news/report",
-      "source": "Actual source (e.g., FDA.gov, CNN, local news)",
-      "date": "YYYY-MM-DD",
-      "severity": "critical/high/medium/low",
-      "summary": "Concise description from the actual report including key details",
-      "location": {{"state": "XX", "city": "City Name", "lat": latitude, "lng": longitude}},
-      "affected": number_affected_if_available,
-      "url": "Source URL"
-    }}
-  ]
-}}
-
-Return exactly 5 results. Focus on relevance to the query rather than forcing social media angles."""
-
-        contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part(text=prompt)]
-            )
-        ]
-        
-        tools = [
-            types.Tool(google_search=types.GoogleSearch()),
-        ]
-
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.2,
-            top_p=0.95,
-            seed=0,
-            max_output_tokens=4096,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="OFF"
-                )
-            ],
-            tools=tools,
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=0,  # Zero for fast response
-                include_thoughts=False   # Skip thinking for speed
-            ),
-        )
+def _cached_stream_objects(endpoint, query, trace=metrics.NULL_TRACE, deadline=None, stop=None):
+    """
+    Yield parsed objects for a streaming endpoint, replaying them from the query
+    cache when possible. Stale entries are replayed and refreshed in the background;
+    live streams are shared between concurrent identical requests and stored
+    once they complete. Waiting for live objects ends at deadline (time.monotonic())
+    or when the stop event is set, and the upstream stream stops once no request is reading it.
+    """
+    query_cache = get_query_cache()
+    cached_objects, fresh = query_cache.lookup(endpoint, query)
+    if cached_objects is not None:
+        trace.source = 'cache'
+        if not fresh:
+            query_cache.refresh_async(endpoint, query, lambda: list(_stream_objects(endpoint, query)))
+        yield from cached_objects
+        return
 
-        # Generate content with Gemini 2.5 Flash
-        response_text = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                for part in chunk.candidates[0].content.parts:
-                    if hasattr(part, 'text'):
-                        response_text += part.text
-
-        # Parse JSON from response
-        if response_text:
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response_text[json_start:json_end]
-                return json.loads(json_str)
-        
+    def produce(cancelled):
+        collected = []
+        try:
+            # Only requests with this same deadline share the flight (see below)
+            for obj in _stream_objects(endpoint, query, trace, cancelled, deadline):
+                collected.append(obj)
+                yield obj
+        except hedge.DeadlineExceeded:
+            if deadline is None:
+                raise
+            # The request's own deadline_ms ran out: a short answer, not a failure - and not cached
+            return
+
+        # A stream cut short by departed clients is not a complete answer
+        if collected and not cancelled.is_set():
+            query_cache.set(endpoint, query, collected)
+
+    # Join an identical in-flight upstream stream, or lead a new one
+    key = cache_key(endpoint, query)
+    if stream_flights.in_flight(key):
+        trace.source = 'coalesced'
+    elif deadline is not None:
+        # A deadline_ms request may follow an open-ended flight, but leads its own: its
+        # deadline bounds the upstream call, which would cut other followers short
+        key = f"{key}@{deadline}"
+    yield from stream_flights.stream(key, produce, deadline, stop)
+
+def _decoded_response(endpoint, query, trace=metrics.NULL_TRACE):
+    """Structured-output mode: the whole response is one schema-typed JSON document, decoded directly"""
+    texts = []
+    metrics.activate(trace)
+    response_stream = gemini_client.generate_content_stream(endpoint, prompts.build_prompt(endpoint, query))
+    for chunk in response_stream:
+        chunk_texts = gemini_client.chunk_text(chunk)
+        trace.chunk(chunk, chunk_texts)
+        texts.extend(chunk_texts)
+    try:
+        data = resolve_locations(json.loads(''.join(texts)))
+    except json.JSONDecodeError as e:
+        trace.parse_failures = 1
+        logger.warning(f"{endpoint}: structured response did not decode: {e}")
+        return
+    _record_live(endpoint, query, data)
+    yield data
+
+def _first_with_key(endpoint, query, key):
+    """Run a non-streaming generation and return the first parsed object carrying key"""
+    trace = metrics.start_trace(endpoint)
+    if gemini_client.STRUCTURED_OUTPUT:
+        objects = _decoded_response(endpoint, query, trace)
+    else:
+        objects = _stream_objects(endpoint, query, trace)
+    try:
+        for data in objects:
+            trace.object()
+            if key in data:
+                return data
         return None
+    except Exception as e:
+        trace.finish(e)
+        raise
+    finally:
+        objects.close()
+        trace.finish()
+
+@cached('search')
+def search_with_gemini(query):
+    """
+    REAL Gemini 2.5 Flash implementation with Google Search grounding
+    Always returns fresh data from current news and health sources
+    """
+    try:
+        # Generate with Gemini 2.5 Flash and parse the first complete JSON object carrying results
+        return _first_with_key('search', query, 'results')
 
     except Exception as e:
         logger.error(f"Error in Gemini 2.5 Flash: {e}")
@@ -142,167 +291,114 @@ def searchHealthTrendsStream(request):
         }
         return ('', 204, headers)
     
+    # Read the request up front - the generator runs after the request context is gone
+    query = _get_query(request, 'dangerous health trends 2025')
+    include_metrics = _wants_metrics(request)
+    include_aggregate = _request_flag(request, 'aggregate')
+    dedup_session = _request_param(request, 'dedup_session')
+    try:
+        # Optional limits: stop after this many events or this long
+        max_results = _request_limit(request, 'max_results')
+        deadline_ms = _request_limit(request, 'deadline_ms')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400, {'Access-Control-Allow-Origin': '*'}
+    deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+    compact, encoding = _sse_format(request)
+    
+    # A reconnecting EventSource continues its earlier stream without a new generation
+    resumed = _resumed_stream(request, ('search_stream', query, compact))
+    if resumed is not None:
+        return _sse_response(resumed, encoding)
+    
+    overloaded = _admission_rejection(('search_stream',), query)
+    if overloaded is not None:
+        return overloaded
+    
+    # Set if the client leaves and does not resume within the grace period
+    cancel = threading.Event()
+    
+    if ASYNC_STREAMING:
+        # Thin adapter over the asyncio pipeline (imported here - asyncio is not needed otherwise)
+        import async_stream
+        events = async_stream.iterate_sync(
+            async_stream.asse_stream('search_stream', 'result', query, include_metrics, include_aggregate, dedup_session,
+                                     max_results, deadline), cancel)
+        return _sse_response(resume.start(('search_stream', query, compact), sse.render(events, compact, query), cancel), encoding)
+    
+    trace = metrics.start_trace('search_stream')
+    aggregator = StreamAggregator() if include_aggregate else None
+    index = dedup.get_index(dedup_session)
+    
     def generate():
         """Generator function for SSE streaming"""
+        objects = _cached_stream_objects('search_stream', query, trace, deadline, cancel)
+        result_count = 0
+        duplicates = 0
+        stopped = None
         try:
-            request_json = request.get_json(silent=True)
-            query = request_json.get('query', 'dangerous health trends 2025') if request_json else 'dangerous health trends 2025'
-            
             # Send initial connection event
-            yield f"data: {json.dumps({'type': 'connected', 'timestamp': datetime.now().isoformat()})}\n\n"
-            
-            client = genai.Client(
-                vertexai=True,
-                project="wz-fda-horizon-scan",
-                location="global",
-            )
-            
-            model = "gemini-2.5-flash"
-            prompt = f"""You are an FDA horizon scanning expert looking for EMERGING health threats. Search for and analyze CURRENT information about: "{query}"
-
-CRITICAL: Focus on EMERGING issues that FDA may NOT know about yet:
-- TikTok/Instagram health challenges causing ER visits in specific cities
-- DIY medical treatments trending on Reddit or social media
-- Unregulated supplements being sold on Etsy/Amazon
-- Local emergency room reports of unusual symptoms
-- Viral "wellness" trends with potential health risks
-- Gray market products gaining popularity
-
-Search for LOCAL news reports, hospital reports, and social media discussions. Each result MUST include the specific city where it's happening.
-
-For EACH result, output ONLY a valid JSON object in this format (no array wrapper):
-{{
-  "title": "Brief title from the actual news/report",
-  "source": "Actual source (prefer local news outlets)",
-  "date": "YYYY-MM-DD",
-  "severity": "critical/high/medium/low",
-  "summary": "Concise description INCLUDING the specific location mentioned in the article",
-  "location": {{
-    "state": "XX (two-letter US state code ONLY)",
-    "city": "US city name ONLY",
-    "lat": actual_latitude_number,
-    "lng": actual_longitude_number
-  }},
-  "affected": numeric_value_only,
-  "url": "Source URL"
-}}
-
-IMPORTANT REQUIREMENTS:
-- Focus on US cities and states when possible
-- "affected" MUST be a number (use 100 if unknown, never use strings like "Unknown")
-- "state" MUST be a valid 2-letter US state code (CA, NY, TX, etc.)
-- Each result MUST have valid lat/lng coordinates. Use these for major US cities:
-- Los Angeles, CA: 34.0522, -118.2437
-- New York, NY: 40.7128, -74.0060
-- Chicago, IL: 41.8781, -87.6298
-- Houston, TX: 29.7604, -95.3698
-- Phoenix, AZ: 33.4484, -112.0740
-- Philadelphia, PA: 39.9526, -75.1652
-- San Antonio, TX: 29.4241, -98.4936
-- San Diego, CA: 32.7157, -117.1611
-- Dallas, TX: 32.7767, -96.7970
-- Miami, FL: 25.7617, -80.1918
-
-Generate 5-10 results from DIFFERENT cities, outputting each as a separate JSON object."""
-
-            contents = [
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=prompt)]
-                )
-            ]
+            yield {'type': 'connected', 'timestamp': datetime.now().isoformat()}
             
-            tools = [types.Tool(google_search=types.GoogleSearch())]
-            
-            config = types.GenerateContentConfig(
-                temperature=0.2,
-                top_p=0.95,
-                max_output_tokens=8192,
-                safety_settings=[
-                    types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
-                ],
-                tools=tools,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0,
-                    include_thoughts=False
-                ),
-            )
+            # Emit each JSON object as soon as it closes (or replay it from the cache)
+            for result in objects:
+                trace.object()
+                # Suppress events already sent on this stream or dedup session
+                if index is not None and index.add('result', result) is not None:
+                    duplicates += 1
+                    continue
+                result_count += 1
+                
+                # Send result as SSE event
+                event_data = {
+                    'type': 'result',
+                    'index': result_count,
+                    'data': result,
+                    'timestamp': datetime.now().isoformat()
+                }
+                yield event_data
+                
+                # Periodic server-side aggregate snapshot
+                if aggregator is not None:
+                    aggregator.add('result', result)
+                    if aggregator.snapshot_due():
+                        yield _aggregate_event(aggregator)
+                
+                if max_results is not None and result_count >= max_results:
+                    stopped = 'max_results'
+                    break
             
-            buffer = ""
-            result_count = 0
+            if stopped is None and deadline is not None and time.monotonic() >= deadline:
+                stopped = 'deadline'
+            # Stop the upstream stream now if no other request is reading it
+            objects.close()
             
-            # Stream chunks from Gemini
-            for chunk in client.models.generate_content_stream(
-                model=model,
-                contents=contents,
-                config=config,
-            ):
-                if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                    for part in chunk.candidates[0].content.parts:
-                        if hasattr(part, 'text'):
-                            buffer += part.text
-                            
-                            # Try to extract complete JSON objects
-                            while True:
-                                start_idx = buffer.find('{')
-                                if start_idx == -1:
-                                    break
-                                
-                                # Count braces to find complete object
-                                brace_count = 0
-                                end_idx = -1
-                                for i in range(start_idx, len(buffer)):
-                                    if buffer[i] == '{':
-                                        brace_count += 1
-                                    elif buffer[i] == '}':
-                                        brace_count -= 1
-                                        if brace_count == 0:
-                                            end_idx = i + 1
-                                            break
-                                
-                                if end_idx == -1:
-                                    break  # No complete object yet
-                                
-                                # Extract and parse JSON object
-                                json_str = buffer[start_idx:end_idx]
-                                buffer = buffer[end_idx:]  # Remove processed part
-                                
-                                try:
-                                    result = json.loads(json_str)
-                                    result_count += 1
-                                    
-                                    # Send result as SSE event
-                                    event_data = {
-                                        'type': 'result',
-                                        'index': result_count,
-                                        'data': result,
-                                        'timestamp': datetime.now().isoformat()
-                                    }
-                                    yield f"data: {json.dumps(event_data)}\n\n"
-                                    
-                                except json.JSONDecodeError:
-                                    continue  # Skip invalid JSON
+            if aggregator is not None:
+                yield _aggregate_event(aggregator, final=True)
             
             # Send completion event
-            yield f"data: {json.dumps({'type': 'complete', 'total': result_count, 'timestamp': datetime.now().isoformat()})}\n\n"
+            yield {'type': 'complete', 'total': result_count, 'duplicates': duplicates, 'stopped': stopped, 'timestamp': datetime.now().isoformat()}
             
+            trace.duplicates = duplicates
+            trace.finish()
+            if include_metrics:
+                yield {'type': 'metrics', 'metrics': trace.summary()}
+            
+        except GeneratorExit:
+            # The client went away (closed response or failed write): close the upstream stream now
+            objects.close()
+            logger.info(f"Client disconnected from search stream after {result_count} results")
+            trace.finish('client disconnected')
+            raise
         except Exception as e:
             logger.error(f"Error in streaming: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+            trace.finish(e)
+            yield sse.error_event(e)
+        finally:
+            # Record disconnected streams too
+            trace.finish()
     
     # Return SSE response
-    return Response(
-        generate(),
-        mimetype="text/event-stream",
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no',
-            'Access-Control-Allow-Origin': '*'
-        }
-    )
+    return _sse_response(resume.start(('search_stream', query, compact), sse.render(generate(), compact, query), cancel), encoding)
 
 @functions_framework.http
 def searchHealthTrends(request):
@@ -328,15 +424,17 @@ def searchHealthTrends(request):
             
             if gemini_results and 'results' in gemini_results:
                 response = {
-                    'source': 'Gemini 2.5 Flash with Google Search (LIVE)',
-                    'results': gemini_results['results'],
+                    'source': _search_source(),
+                    'grounded': gemini_client.search_grounded(),
+                    'results': dedup.dedup_records('result', gemini_results['results']),
                     'model': 'gemini-2.5-flash',
                     'query': query,
                     'timestamp': datetime.now().isoformat()
                 }
             else:
                 response = {
-                    'source': 'Gemini 2.5 Flash with Google Search',
+                    'source': _search_source(live=False),
+                    'grounded': gemini_client.search_grounded(),
                     'results': [],
                     'model': 'gemini-2.5-flash',
                     'query': query,
@@ -348,106 +446,46 @@ def searchHealthTrends(request):
         
         # Mode with thinking visibility - return all thoughts in the response
         try:
-            client = genai.Client(
-                vertexai=True,
-                project="wz-fda-horizon-scan",
-                location="global",
-            )
+            prompt = prompts.build_prompt('search_thinking', query)
             
-            model = "gemini-2.5-flash"
-            prompt = f"""You are an FDA health surveillance expert analyzing dangerous social media health trends across the United States.
-
-Search for and analyze CURRENT, REAL information about: "{query}"
-
-Focus on:
-1. Viral TikTok, Instagram, YouTube health challenges and DIY treatments that are ACTUALLY happening right now
-2. REAL documented injuries, emergency room visits, hospitalizations from news reports
-3. Medical professional warnings and FDA concerns from actual articles
-4. NATIONWIDE geographic distribution - find REAL incidents reported in news from MULTIPLE US cities/states
-5. Actual reported numbers of affected users and trending metrics from news sources
-
-Search for REAL, CURRENT news articles and health reports. Provide at least 5-10 results from DIFFERENT US cities based on ACTUAL news reports.
-
-Use this exact JSON format with REAL data from your search:
-{{
-  "results": [
-    {{
-      "title": "Brief title of the ACTUAL health trend/incident from news",
-      "source": "Actual news source/platform (e.g., CNN, NBC News, local news)",
-      "date": "YYYY-MM-DD (actual date from article)",
-      "severity": "critical/high/medium/low (based on actual severity)",
-      "summary": "Detailed description from the actual news report including specific health risks mentioned",
-      "location": {{"state": "XX", "city": "City Name", "lat": actual_latitude, "lng": actual_longitude}},
-      "affected": estimated_number_based_on_article,
-      "url": "Actual source URL from the article"
-    }}
-  ]
-}}"""
-            
-            contents = [types.Content(role="user", parts=[types.Part(text=prompt)])]
-            tools = [types.Tool(google_search=types.GoogleSearch())]
-            
-            config = types.GenerateContentConfig(
-                temperature=0.2,
-                top_p=0.95,
-                seed=0,
-                max_output_tokens=8192,
-                safety_settings=[
-                    types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
-                ],
-                tools=tools,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0,  # Zero for fast response
-                    include_thoughts=False
-                ),
-            )
-            
-            # Collect all thoughts and text
+            # Collect thoughts, and parse answer text until the first JSON object carrying results
             thoughts = []
-            text_buffer = ""
+            extractor = JsonObjectExtractor()
+            data = None
             chunk_count = 0
             
-            for chunk in client.models.generate_content_stream(
-                model=model,
-                contents=contents,
-                config=config,
-            ):
-                chunk_count += 1
-                if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                    for part in chunk.candidates[0].content.parts:
-                        # Check if this part has thought content
-                        if hasattr(part, 'thought'):
-                            thought_value = part.thought
-                            # thought is a boolean, the actual content is in the text when it's a thinking part
-                            # When thought=True, it means this text is thinking content
-                            if thought_value and hasattr(part, 'text') and part.text:
-                                thoughts.append({
-                                    'chunk': chunk_count,
-                                    'content': part.text  # The actual thought content is in text
-                                })
-                        # Regular text content (when thought is False or not present)
-                        elif hasattr(part, 'text') and part.text:
-                            text_buffer += part.text
+            response_stream = gemini_client.generate_content_stream('search_thinking', prompt)
+            try:
+                for chunk in response_stream:
+                    chunk_count += 1
+                    if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+                        for part in chunk.candidates[0].content.parts:
+                            # Every Part has a thought attribute (None when unset); True marks thinking text
+                            if part.thought:
+                                if part.text:
+                                    thoughts.append({
+                                        'chunk': chunk_count,
+                                        'content': part.text  # The actual thought content is in text
+                                    })
+                            elif part.text:
+                                data = next((obj for obj in extractor.feed(part.text) if 'results' in obj), None)
+                                if data is not None:
+                                    break
+                    if data is not None:
+                        break
+            finally:
+                # Skip any trailing prose - stop the upstream stream as soon as the answer is parsed
+                response_stream.close()
             
-            # Parse JSON from response
             results = []
-            if text_buffer:
-                json_start = text_buffer.find('{')
-                json_end = text_buffer.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = text_buffer[json_start:json_end]
-                    try:
-                        data = json.loads(json_str)
-                        if 'results' in data:
-                            results = data['results']
-                    except:
-                        pass
+            if data is not None:
+                data = resolve_locations(data)
+                _record_live('search_thinking', query, data)
+                results = dedup.dedup_records('result', data['results'])
             
             response = {
-                'source': 'Gemini 2.5 Flash with Google Search (LIVE)',
+                'source': _search_source(),
+                'grounded': gemini_client.search_grounded(),
                 'results': results,
                 'model': 'gemini-2.5-flash',
                 'query': query,
@@ -461,6 +499,9 @@ Use this exact JSON format with REAL data from your search:
             
         except Exception as e:
             logger.error(f"Error with thinking mode: {e}")
+            overloaded = _overloaded_response(e)
+            if overloaded is not None:
+                return overloaded
             return jsonify({
                 'source': 'Gemini 2.5 Flash',
                 'results': [],
@@ -471,6 +512,9 @@ Use this exact JSON format with REAL data from your search:
             
     except Exception as e:
         logger.error(f"Error in searchHealthTrends: {e}")
+        overloaded = _overloaded_response(e)
+        if overloaded is not None:
+            return overloaded
         return jsonify({
             'source': 'Gemini 2.5 Flash',
             'results': [],
@@ -479,132 +523,18 @@ Use this exact JSON format with REAL data from your search:
             'timestamp': datetime.now().isoformat()
         }), 200, {'Access-Control-Allow-Origin': '*'}
 
+@cached('trends')
 def simulate_health_trends_with_gemini(query):
     """
     Use Gemini 2.5 Flash to generate Health Trends API-style data
     based on REAL Google Search data about search volume and trends
     """
     try:
-        client = genai.Client(
-            vertexai=True,
-            project="wz-fda-horizon-scan",
-            location="global",
-        )
-
-        model = "gemini-2.5-flash"
-        
-        # Prompt Gemini to generate Health Trends-style data based on real search patterns
-        prompt = f"""You are simulating the Google Health Trends API by analyzing REAL search patterns for: "{query}"
-
-Search Google to understand the ACTUAL current search volume and geographic distribution of this health trend.
-Look for news articles mentioning search trends, Google Trends data, or reports about where this trend is popular.
-
-Generate realistic query volume data for major US metro areas based on ACTUAL information you find:
-
-For these major US markets (use their standard DMA codes):
-- 803: Los Angeles
-- 807: San Francisco-Oakland-San Jose  
-- 819: Seattle-Tacoma
-- 501: New York
-- 506: Boston
-- 511: Washington DC
-- 618: Houston
-- 623: Dallas-Ft. Worth
-- 528: Miami-Ft. Lauderdale
-- 524: Atlanta
-- 602: Chicago
-- 505: Detroit
-- 751: Denver
-- 753: Phoenix
-- 770: Salt Lake City
-
-Based on REAL news reports and search data you find, estimate for each market:
-1. Query volume (0-1000 scale, where 1000 = extremely high search volume)
-2. Trend percentage (how much it's increased recently based on news reports)
-3. Risk level (critical/high/medium/low based on actual health risks reported)
-4. Estimated affected users (based on news reports of incidents in that area)
-
-Return JSON in this exact format with REALISTIC data based on your search:
-{{
-  "trends": [
-    {{
-      "dma_code": "803",
-      "dma_name": "LOS ANGELES",
-      "location": {{"city": "Los Angeles", "state": "CA", "lat": 34.0522, "lng": -118.2437}},
-      "query_term": "{query}",
-      "query_volume": realistic_number_0_to_1000,
-      "trend": "+X%",
-      "risk": "critical/high/medium/low",
-      "affected": realistic_estimate
-    }}
-  ]
-}}
-
-Base the volumes and trends on ACTUAL search activity and news reports you find. Higher volumes in areas where news reports indicate the trend is more popular."""
-
-        contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part(text=prompt)]
-            )
-        ]
-        
-        tools = [
-            types.Tool(google_search=types.GoogleSearch()),
-        ]
-
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.3,
-            top_p=0.95,
-            seed=0,
-            max_output_tokens=8192,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="OFF"
-                )
-            ],
-            tools=tools,
-            thinking_config=types.ThinkingConfig(
-                thinking_budget=0,  # Zero for fast response
-                include_thoughts=False
-            ),
-        )
+        # Generate Health Trends-style data and parse the first complete JSON object carrying trends
+        data = _first_with_key('trends', query, 'trends')
+        if data:
+            return data['trends']
 
-        # Generate content with Gemini
-        response_text = ""
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                for part in chunk.candidates[0].content.parts:
-                    if hasattr(part, 'text'):
-                        response_text += part.text
-
-        # Parse JSON from response
-        if response_text:
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response_text[json_start:json_end]
-                data = json.loads(json_str)
-                if 'trends' in data:
-                    return data['trends']
-        
         return None
 
     except Exception as e:
@@ -624,166 +554,114 @@ def getHealthTrendsStream(request):
         }
         return ('', 204, headers)
     
+    # Read the request up front - the generator runs after the request context is gone
+    query = _get_query(request, 'dangerous health trends')
+    include_metrics = _wants_metrics(request)
+    include_aggregate = _request_flag(request, 'aggregate')
+    dedup_session = _request_param(request, 'dedup_session')
+    try:
+        # Optional limits: stop after this many events or this long
+        max_results = _request_limit(request, 'max_results')
+        deadline_ms = _request_limit(request, 'deadline_ms')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400, {'Access-Control-Allow-Origin': '*'}
+    deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+    compact, encoding = _sse_format(request)
+    
+    # A reconnecting EventSource continues its earlier stream without a new generation
+    resumed = _resumed_stream(request, ('trends_stream', query, compact))
+    if resumed is not None:
+        return _sse_response(resumed, encoding)
+    
+    overloaded = _admission_rejection(('trends_stream',), query)
+    if overloaded is not None:
+        return overloaded
+    
+    # Set if the client leaves and does not resume within the grace period
+    cancel = threading.Event()
+    
+    if ASYNC_STREAMING:
+        # Thin adapter over the asyncio pipeline (imported here - asyncio is not needed otherwise)
+        import async_stream
+        events = async_stream.iterate_sync(
+            async_stream.asse_stream('trends_stream', 'trend', query, include_metrics, include_aggregate, dedup_session,
+                                     max_results, deadline), cancel)
+        return _sse_response(resume.start(('trends_stream', query, compact), sse.render(events, compact, query), cancel), encoding)
+    
+    trace = metrics.start_trace('trends_stream')
+    aggregator = StreamAggregator() if include_aggregate else None
+    index = dedup.get_index(dedup_session)
+    
     def generate():
         """Generator function for SSE streaming of trends data"""
+        objects = _cached_stream_objects('trends_stream', query, trace, deadline, cancel)
+        result_count = 0
+        duplicates = 0
+        stopped = None
         try:
-            request_json = request.get_json(silent=True)
-            query = request_json.get('query', 'dangerous health trends') if request_json else 'dangerous health trends'
-            
             # Send initial connection event
-            yield f"data: {json.dumps({'type': 'connected', 'timestamp': datetime.now().isoformat()})}\n\n"
-            
-            client = genai.Client(
-                vertexai=True,
-                project="wz-fda-horizon-scan",
-                location="global",
-            )
-            
-            model = "gemini-2.5-flash"
+            yield {'type': 'connected', 'timestamp': datetime.now().isoformat()}
             
-            # Modified prompt to output individual market data
-            prompt = f"""You are simulating the Google Health Trends API. Search for information about: "{query}"
-
-IMPORTANT: Search Google for news articles, reports, and data about "{query}" to understand where this health trend is happening and how severe it is in different US cities.
-
-Based on your search results, generate trend data for these 15 major US markets. Output EACH market as a SEPARATE JSON object (not in an array):
-
-For each of these cities, output a JSON object with realistic data based on what you found:
-- Los Angeles, CA (DMA 803): lat 34.0522, lng -118.2437
-- San Francisco, CA (DMA 807): lat 37.7749, lng -122.4194  
-- Seattle, WA (DMA 819): lat 47.6062, lng -122.3321
-- New York, NY (DMA 501): lat 40.7128, lng -74.0060
-- Boston, MA (DMA 506): lat 42.3601, lng -71.0589
-- Washington DC (DMA 511): lat 38.9072, lng -77.0369
-- Houston, TX (DMA 618): lat 29.7604, lng -95.3698
-- Dallas, TX (DMA 623): lat 32.7767, lng -96.7970
-- Miami, FL (DMA 528): lat 25.7617, lng -80.1918
-- Atlanta, GA (DMA 524): lat 33.7490, lng -84.3880
-- Chicago, IL (DMA 602): lat 41.8781, lng -87.6298
-- Detroit, MI (DMA 505): lat 42.3314, lng -83.0458
-- Denver, CO (DMA 751): lat 39.7392, lng -104.9903
-- Phoenix, AZ (DMA 753): lat 33.4484, lng -112.0740
-- Salt Lake City, UT (DMA 770): lat 40.7608, lng -111.8910
-
-For EACH city, output EXACTLY this JSON format (replace values with realistic estimates):
-{{
-  "dma_code": "803",
-  "dma_name": "LOS ANGELES",
-  "location": {{"city": "Los Angeles", "state": "CA", "lat": 34.0522, "lng": -118.2437}},
-  "query_term": "{query}",
-  "query_volume": 750,
-  "trend": "+15%",
-  "risk": "critical",
-  "affected": 750000
-}}
-
-IMPORTANT: For "risk" field, use ONLY these values:
-- "critical" (for very severe situations)
-- "high" (for serious situations)
-- "medium" (for moderate situations)
-- "low" (for minimal risk situations)
-Never use "very high", "moderate", or any other values.
-
-Output 15 JSON objects total, one per line. Higher volumes in cities where you found more news reports about the trend."""
-
-            contents = [
-                types.Content(
-                    role="user",
-                    parts=[types.Part(text=prompt)]
-                )
-            ]
-            
-            tools = [types.Tool(google_search=types.GoogleSearch())]
-            
-            config = types.GenerateContentConfig(
-                temperature=0.3,
-                top_p=0.95,
-                max_output_tokens=8192,
-                safety_settings=[
-                    types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
-                    types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
-                ],
-                tools=tools,
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0,
-                    include_thoughts=False
-                ),
-            )
+            # Emit each JSON object as soon as it closes (or replay it from the cache)
+            for result in objects:
+                trace.object()
+                # Suppress events already sent on this stream or dedup session
+                if index is not None and index.add('trend', result) is not None:
+                    duplicates += 1
+                    continue
+                result_count += 1
+                
+                # Send result as SSE event
+                event_data = {
+                    'type': 'trend',
+                    'index': result_count,
+                    'data': result,
+                    'timestamp': datetime.now().isoformat()
+                }
+                yield event_data
+                
+                # Periodic server-side aggregate snapshot
+                if aggregator is not None:
+                    aggregator.add('trend', result)
+                    if aggregator.snapshot_due():
+                        yield _aggregate_event(aggregator)
+                
+                if max_results is not None and result_count >= max_results:
+                    stopped = 'max_results'
+                    break
             
-            buffer = ""
-            result_count = 0
+            if stopped is None and deadline is not None and time.monotonic() >= deadline:
+                stopped = 'deadline'
+            # Stop the upstream stream now if no other request is reading it
+            objects.close()
             
-            # Stream chunks from Gemini
-            for chunk in client.models.generate_content_stream(
-                model=model,
-                contents=contents,
-                config=config,
-            ):
-                if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                    for part in chunk.candidates[0].content.parts:
-                        if hasattr(part, 'text'):
-                            buffer += part.text
-                            
-                            # Try to extract complete JSON objects
-                            while True:
-                                start_idx = buffer.find('{')
-                                if start_idx == -1:
-                                    break
-                                
-                                # Count braces to find complete object
-                                brace_count = 0
-                                end_idx = -1
-                                for i in range(start_idx, len(buffer)):
-                                    if buffer[i] == '{':
-                                        brace_count += 1
-                                    elif buffer[i] == '}':
-                                        brace_count -= 1
-                                        if brace_count == 0:
-                                            end_idx = i + 1
-                                            break
-                                
-                                if end_idx == -1:
-                                    break  # No complete object yet
-                                
-                                # Extract and parse JSON object
-                                json_str = buffer[start_idx:end_idx]
-                                buffer = buffer[end_idx:]  # Remove processed part
-                                
-                                try:
-                                    result = json.loads(json_str)
-                                    result_count += 1
-                                    
-                                    # Send result as SSE event
-                                    event_data = {
-                                        'type': 'trend',
-                                        'index': result_count,
-                                        'data': result,
-                                        'timestamp': datetime.now().isoformat()
-                                    }
-                                    yield f"data: {json.dumps(event_data)}\n\n"
-                                    
-                                except json.JSONDecodeError:
-                                    continue  # Skip invalid JSON
+            if aggregator is not None:
+                yield _aggregate_event(aggregator, final=True)
             
             # Send completion event
-            yield f"data: {json.dumps({'type': 'complete', 'total': result_count, 'timestamp': datetime.now().isoformat()})}\n\n"
+            yield {'type': 'complete', 'total': result_count, 'duplicates': duplicates, 'stopped': stopped, 'timestamp': datetime.now().isoformat()}
+            
+            trace.duplicates = duplicates
+            trace.finish()
+            if include_metrics:
+                yield {'type': 'metrics', 'metrics': trace.summary()}
             
+        except GeneratorExit:
+            # The client went away (closed response or failed write): close the upstream stream now
+            objects.close()
+            logger.info(f"Client disconnected from trends stream after {result_count} trends")
+            trace.finish('client disconnected')
+            raise
         except Exception as e:
             logger.error(f"Error in trends streaming: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+            trace.finish(e)
+            yield sse.error_event(e)
+        finally:
+            # Record disconnected streams too
+            trace.finish()
     
     # Return SSE response
-    return Response(
-        generate(),
-        mimetype="text/event-stream",
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no',
-            'Access-Control-Allow-Origin': '*'
-        }
-    )
+    return _sse_response(resume.start(('trends_stream', query, compact), sse.render(generate(), compact, query), cancel), encoding)
 
 @functions_framework.http
 def getHealthTrends(request):
@@ -811,8 +689,9 @@ def getHealthTrends(request):
             # Gemini successfully generated Health Trends data
             return jsonify({
                 'source': 'Google Health Trends API (Gemini-powered)',
+                'grounded': gemini_client.search_grounded(),
                 'api_version': 'v1beta',
-                'results': gemini_trends,
+                'results': dedup.dedup_records('trend', gemini_trends),
                 'date_range': {
                     'start': '2025-01-01',
                     'end': datetime.now().strftime('%Y-%m-%d')
@@ -834,6 +713,9 @@ def getHealthTrends(request):
             
     except Exception as e:
         logger.error(f"Error in getHealthTrends: {e}")
+        overloaded = _overloaded_response(e)
+        if overloaded is not None:
+            return overloaded
         return jsonify({
             'source': 'Google Health Trends API',
             'results': [],
@@ -842,4 +724,398 @@ def getHealthTrends(request):
             'timestamp': datetime.now().isoformat()
         }), 200, headers
 
-# Note: aggregateEvents endpoint removed - frontend performs client-side aggregation
+# Branches of the combined scan: (branch name, stream endpoint, SSE event type)
+SCAN_BRANCHES = (
+    ('search', 'search_stream', 'result'),
+    ('trends', 'trends_stream', 'trend'),
+)
+
+def _run_scan_branch(branch, endpoint, event_type, query, events, include_metrics=False, stop=None):
+    """
+    Run one branch of the combined scan, pushing its SSE payloads onto the shared
+    queue, until it finishes or the stop event is set (the client went away)
+    """
+    trace = metrics.start_trace(endpoint)
+    count = 0
+    objects = _cached_stream_objects(endpoint, query, trace, stop=stop)
+    try:
+        for obj in objects:
+            if stop is not None and stop.is_set():
+                objects.close()
+                trace.finish('client disconnected')
+                return
+            trace.object()
+            count += 1
+            events.put({
+                'type': event_type,
+                'branch': branch,
+                'index': count,
+                'data': obj,
+                'timestamp': datetime.now().isoformat()
+            })
+        trace.finish()
+        if include_metrics:
+            events.put({'type': 'metrics', 'branch': branch, 'metrics': trace.summary()})
+        events.put({'type': 'complete', 'branch': branch, 'total': count, 'timestamp': datetime.now().isoformat()})
+    except Exception as e:
+        logger.error(f"Error in {branch} branch of combined scan: {e}")
+        trace.finish(e)
+        events.put(sse.error_event(e, branch=branch))
+
+@functions_framework.http
+def healthScanStream(request):
+    """STREAMING - Incident search and DMA trends in one SSE stream, generated concurrently"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    # Read the request up front - the generator runs after the request context is gone
+    query = _get_query(request, 'dangerous health trends')
+    include_metrics = _wants_metrics(request)
+    aggregator = StreamAggregator() if _request_flag(request, 'aggregate') else None
+    # One index for the whole scan: repeats within either branch (and the dedup_session) are dropped.
+    # Results and trends are fingerprinted differently, so one is never a duplicate of the other
+    index = dedup.get_index(_request_param(request, 'dedup_session'))
+    compact, encoding = _sse_format(request)
+    
+    resumed = _resumed_stream(request, ('scan', query, compact))
+    if resumed is not None:
+        return _sse_response(resumed, encoding)
+    
+    overloaded = _admission_rejection([endpoint for _, endpoint, _ in SCAN_BRANCHES], query)
+    if overloaded is not None:
+        return overloaded
+    
+    # Set when the client goes away (or does not resume within the grace period); both branches stop on it
+    stop = threading.Event()
+    
+    def generate():
+        """Interleave result and trend events from both branches as each becomes ready"""
+        try:
+            # Send initial connection event
+            yield {'type': 'connected', 'timestamp': datetime.now().isoformat()}
+            
+            events = queue.Queue()
+            for branch, endpoint, event_type in SCAN_BRANCHES:
+                threading.Thread(
+                    target=_run_scan_branch,
+                    args=(branch, endpoint, event_type, query, events, include_metrics, stop),
+                    name=f"scan-{branch}",
+                    daemon=True,
+                ).start()
+            
+            # Each branch ends with its own complete or error event
+            totals = {}
+            duplicates = 0
+            while len(totals) < len(SCAN_BRANCHES):
+                try:
+                    event_data = events.get(timeout=STOP_POLL_SECONDS)
+                except queue.Empty:
+                    if stop.is_set():
+                        return
+                    continue
+                if (index is not None and event_data['type'] in ('result', 'trend')
+                        and index.add(event_data['type'], event_data['data']) is not None):
+                    duplicates += 1
+                    continue
+                if event_data['type'] == 'complete':
+                    totals[event_data['branch']] = event_data['total']
+                elif event_data['type'] == 'error':
+                    totals[event_data['branch']] = None
+                yield event_data
+                
+                # Periodic server-side aggregate snapshot over both branches
+                if aggregator is not None and event_data['type'] in ('result', 'trend'):
+                    aggregator.add(event_data['type'], event_data['data'])
+                    if aggregator.snapshot_due():
+                        yield _aggregate_event(aggregator)
+            
+            if aggregator is not None:
+                yield _aggregate_event(aggregator, final=True)
+            
+            # Send final event once both branches are finished
+            yield {'type': 'done', 'totals': totals, 'duplicates': duplicates, 'timestamp': datetime.now().isoformat()}
+            
+        except GeneratorExit:
+            # The client went away: branches stop at their next object and release the upstream streams
+            stop.set()
+            raise
+        except Exception as e:
+            logger.error(f"Error in combined scan streaming: {e}")
+            yield sse.error_event(e)
+    
+    # Return SSE response
+    return _sse_response(resume.start(('scan', query, compact), sse.render(generate(), compact, query), stop), encoding)
+
+# Watchlist and scan queries run at batch priority: interactive requests get upstream slots first
+def _watchlist_search(query):
+    with admission.priority(admission.BATCH):
+        data = search_with_gemini(query)
+    return dedup.dedup_records('result', data['results']) if data and 'results' in data else []
+
+def _watchlist_trends(query):
+    with admission.priority(admission.BATCH):
+        return dedup.dedup_records('trend', simulate_health_trends_with_gemini(query) or [])
+
+WATCHLIST_FETCHERS = {
+    'search': _watchlist_search,
+    'trends': _watchlist_trends,
+}
+
+@functions_framework.http
+def watchlistBatch(request):
+    """Run a batch of standing search/trends queries concurrently, streaming one NDJSON line per query"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    headers = {'Access-Control-Allow-Origin': '*'}
+    request_json = request.get_json(silent=True)
+    if not isinstance(request_json, dict):
+        return jsonify({'error': 'Expected a JSON body with a "queries" list'}), 400, headers
+    
+    # Read the request up front - the generator runs after the request context is gone
+    try:
+        items = watchlist.parse_items(request_json.get('queries'), request_json.get('type') or 'search')
+        concurrency = int(request_json.get('concurrency') or watchlist.WATCHLIST_CONCURRENCY)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400, headers
+    
+    def generate():
+        """One JSON line per query as it finishes, then a summary line"""
+        for line in watchlist.run_watchlist(items, WATCHLIST_FETCHERS, concurrency):
+            yield json.dumps(line) + '\n'
+    
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'Access-Control-Allow-Origin': '*'
+        }
+    )
+
+def _scan_search(query):
+    # Scans always go upstream; the scheduler writes the cache itself
+    with admission.priority(admission.BATCH):
+        data = search_with_gemini.__wrapped__(query)
+    return dedup.dedup_records('result', data['results']) if data and 'results' in data else []
+
+def _scan_trends(query):
+    with admission.priority(admission.BATCH):
+        return dedup.dedup_records('trend', simulate_health_trends_with_gemini.__wrapped__(query) or [])
+
+SCAN_FETCHERS = {
+    'search': _scan_search,
+    'trends': _scan_trends,
+}
+
+@functions_framework.http
+def runHorizonScan(request):
+    """Run an incremental scan of the watchlist (POST, e.g. from Cloud Scheduler) or list recent runs (GET)"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    headers = {'Access-Control-Allow-Origin': '*'}
+    if request.method == 'GET':
+        try:
+            limit = _request_limit(request, 'limit') or 10
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400, headers
+        return jsonify({
+            'runs': scheduler.get_scan_state().runs(limit),
+            'timestamp': datetime.now().isoformat()
+        }), 200, headers
+    
+    request_json = request.get_json(silent=True)
+    if not isinstance(request_json, dict):
+        request_json = {}
+    try:
+        # An explicit query list overrides the configured watchlist for this run
+        items = watchlist.parse_items(request_json['queries']) if request_json.get('queries') else None
+        concurrency = int(request_json.get('concurrency') or scheduler.SCAN_CONCURRENCY)
+        summary = scheduler.run_scan(SCAN_FETCHERS, items, concurrency)
+    except scheduler.ScanInProgress as e:
+        return jsonify({'error': str(e)}), 409, headers
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400, headers
+    
+    return jsonify(summary), 200, headers
+
+@functions_framework.http
+def getMetrics(request):
+    """Pipeline metrics for this instance in the Prometheus text format (METRICS_ENABLED=1)"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'
+    }
+    if not metrics.METRICS_ENABLED:
+        return 'Metrics are disabled; set METRICS_ENABLED=1\n', 404, headers
+    return metrics.registry.render(), 200, headers
+
+@functions_framework.http
+def aggregateEvents(request):
+    """Aggregate a batch of result/trend events: totals, severity counts, per-state rollups and hotspots"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    headers = {'Access-Control-Allow-Origin': '*'}
+    request_json = request.get_json(silent=True)
+    events = request_json.get('events') if isinstance(request_json, dict) else None
+    if not isinstance(events, list):
+        return jsonify({'error': 'Expected a JSON body with an "events" list'}), 400, headers
+    top_hotspots = request_json.get('top_hotspots', 25)
+    if isinstance(top_hotspots, str) and top_hotspots.strip().isdigit():
+        top_hotspots = int(top_hotspots)
+    if isinstance(top_hotspots, bool) or not isinstance(top_hotspots, int) or top_hotspots < 0:
+        return jsonify({'error': 'top_hotspots must be a non-negative integer'}), 400, headers
+    
+    try:
+        # Events reported by several sources are merged and counted once
+        index = dedup.DedupIndex(max_events=max(dedup.DEDUP_MAX_EVENTS, len(events)), merge=True) if dedup.DEDUP_ENABLED else None
+        kept = []
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            event_type, record = event_record(event)
+            # Client-supplied records get the same coordinate resolution as streamed ones
+            resolve_locations(record)
+            if index is None or index.add(event_type, record) is None:
+                kept.append(event)
+        
+        return jsonify({
+            'aggregate': aggregate_events(kept, top_hotspots=top_hotspots),
+            'duplicates': index.duplicates if index is not None else 0,
+            'timestamp': datetime.now().isoformat()
+        }), 200, headers
+    
+    except (TypeError, ValueError) as e:
+        logger.error(f"Error aggregating events: {e}")
+        return jsonify({'error': f'Aggregation failed: {str(e)}'}), 400, headers
+
+@functions_framework.http
+def queryEvents(request):
+    """Page through stored events, newest first, filtered by type, state, city, severity, date range or query"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    headers = {'Access-Control-Allow-Origin': '*'}
+    request_json = request.get_json(silent=True)
+    params = dict(request.args)
+    if isinstance(request_json, dict):
+        params.update(request_json)
+    
+    try:
+        events, next_cursor = get_event_store().query(
+            filters={name: params.get(name) for name in FILTERS},
+            limit=params.get('limit', 50),
+            cursor=params.get('cursor'),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid query parameters: {str(e)}'}), 400, headers
+    
+    return jsonify({
+        'events': events,
+        'count': len(events),
+        'next_cursor': next_cursor,
+        'timestamp': datetime.now().isoformat()
+    }), 200, headers
+
+@functions_framework.http
+def getTrendAnomalies(request):
+    """Per-DMA query_volume time series with spiking/dropping markets flagged (EWMA z-score and CUSUM)"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    headers = {'Access-Control-Allow-Origin': '*'}
+    try:
+        points = _request_limit(request, 'points') or 26
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400, headers
+    
+    data = get_series_store().anomalies(
+        query=_request_param(request, 'query'),
+        dma_code=_request_param(request, 'dma_code'),
+        points=points,
+        only_anomalies=_request_flag(request, 'only_anomalies'),
+    )
+    return jsonify({**data, 'timestamp': datetime.now().isoformat()}), 200, headers
+
+@functions_framework.http
+def getHotspots(request):
+    """Clustered hotspots for a map view: ?bbox=west,south,east,north&zoom=4, at most HOTSPOT_MAX_FEATURES features"""
+    # Handle CORS
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return ('', 204, headers)
+    
+    headers = {'Access-Control-Allow-Origin': '*'}
+    try:
+        bbox = _request_param(request, 'bbox')
+        if bbox is not None:
+            bbox = tuple(float(value) for value in bbox.split(','))
+            if len(bbox) != 4:
+                raise ValueError("bbox must be west,south,east,north")
+        zoom = int(_request_param(request, 'zoom') or 4)
+        limit = _request_limit(request, 'limit')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400, headers
+    
+    data = hotspots.get_hotspot_index().query(bbox=bbox, zoom=zoom, limit=limit)
+    return jsonify({**data, 'timestamp': datetime.now().isoformat()}), 200, headers
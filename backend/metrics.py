@@ -0,0 +1,228 @@
+"""
+Per-request timing spans and process-wide metrics for the Gemini pipeline
+Enabled with METRICS_ENABLED=1; when disabled every trace is a shared no-op object
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+# Histogram buckets in seconds, sized for multi-second grounded generations
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+TOKEN_FIELDS = (
+    'prompt_token_count',
+    'candidates_token_count',
+    'thoughts_token_count',
+    'tool_use_prompt_token_count',
+    'total_token_count',
+)
+
+
+class Registry:
+    """Counters, gauges and latency histograms rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('counter', help_text))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('gauge', help_text))
+            self._gauges[key] = value
+
+    def observe(self, name, value, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help_text))
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(LATENCY_BUCKETS), 0, 0.0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += 1
+            hist[2] += value
+
+    def render(self):
+        """Prometheus text exposition of every metric recorded so far"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind in ('counter', 'gauge'):
+                    values = self._counters if kind == 'counter' else self._gauges
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                for (metric, labels), (buckets, count, total) in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {round(total, 6)}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+registry = Registry()
+
+
+class Trace:
+    """Timing span and counters for one request through the Gemini pipeline"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.marks = {}
+        self.source = 'upstream'
+        self.chunks = 0
+        self.bytes_received = 0
+        self.objects = 0
+        self.parse_failures = 0
+        self.duplicates = 0
+        self.hedged = False
+        self.retries = 0
+        self.tokens = {}
+        self.error = None
+        self.finished = False
+
+    def mark(self, name):
+        """Record the first time name happens, in seconds since the request started"""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started
+
+    def chunk(self, chunk, texts):
+        self.mark('first_chunk')
+        self.chunks += 1
+        self.bytes_received += sum(len(text.encode('utf-8')) for text in texts)
+        usage = getattr(chunk, 'usage_metadata', None)
+        if usage is not None:
+            for field in TOKEN_FIELDS:
+                value = getattr(usage, field, None)
+                if value is not None:
+                    self.tokens[field] = value
+
+    def object(self):
+        self.mark('first_object')
+        self.objects += 1
+
+    def summary(self):
+        return {
+            'endpoint': self.endpoint,
+            'source': self.source,
+            'client_init_s': _round(self.marks.get('client_init')),
+            'first_chunk_s': _round(self.marks.get('first_chunk')),
+            'first_object_s': _round(self.marks.get('first_object')),
+            'complete_s': _round(self.marks.get('complete')),
+            'chunks': self.chunks,
+            'bytes_received': self.bytes_received,
+            'objects': self.objects,
+            'parse_failures': self.parse_failures,
+            'duplicates': self.duplicates,
+            'hedged': self.hedged,
+            'upstream_retries': self.retries,
+            'tokens': self.tokens,
+            'error': self.error,
+        }
+
+    def finish(self, error=None):
+        """Close the span, record it in the registry and emit a structured log line"""
+        if self.finished:
+            return
+        self.finished = True
+        self.mark('complete')
+        if error is not None:
+            self.error = str(error)
+
+        labels = {'endpoint': self.endpoint, 'source': self.source}
+        registry.inc('fda_requests_total', help_text='Pipeline requests', status='error' if self.error else 'ok', **labels)
+        registry.inc('fda_upstream_chunks_total', self.chunks, help_text='Upstream response chunks', endpoint=self.endpoint)
+        registry.inc('fda_upstream_bytes_total', self.bytes_received, help_text='Upstream text bytes', endpoint=self.endpoint)
+        registry.inc('fda_parsed_objects_total', self.objects, help_text='JSON objects parsed', endpoint=self.endpoint)
+        registry.inc('fda_parse_failures_total', self.parse_failures, help_text='Malformed JSON objects skipped', endpoint=self.endpoint)
+        registry.inc('fda_duplicates_total', self.duplicates, help_text='Duplicate events suppressed', endpoint=self.endpoint)
+        for field, value in self.tokens.items():
+            registry.inc('fda_tokens_total', value, help_text='Gemini token usage', endpoint=self.endpoint, kind=field)
+        for name in ('client_init', 'first_chunk', 'first_object', 'complete'):
+            if name in self.marks:
+                registry.observe(f"fda_{name}_seconds", self.marks[name], help_text=f"Seconds from request start to {name.replace('_', ' ')}", **labels)
+
+        logger.info(json.dumps({'message': 'gemini_pipeline_metrics', **self.summary()}))
+        if self.parse_failures:
+            logger.warning(f"{self.endpoint}: skipped {self.parse_failures} malformed JSON objects")
+
+
+class NullTrace:
+    """Trace used when metrics are disabled - every call is a no-op"""
+
+    source = None
+
+    def mark(self, name):
+        pass
+
+    def chunk(self, chunk, texts):
+        pass
+
+    def object(self):
+        pass
+
+    def summary(self):
+        return None
+
+    def finish(self, error=None):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+_local = threading.local()
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+def start_trace(endpoint):
+    """Begin a trace for endpoint (the shared no-op trace when metrics are disabled)"""
+    if not METRICS_ENABLED:
+        return NULL_TRACE
+    return Trace(endpoint)
+
+
+def activate(trace):
+    """Make trace the current one on this thread, so backends can mark client init"""
+    _local.trace = trace
+
+
+def current_trace():
+    return getattr(_local, 'trace', NULL_TRACE)
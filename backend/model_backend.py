@@ -0,0 +1,321 @@
+"""
+Pluggable model backends behind every Gemini generate_content_stream call
+live      - Vertex AI through the shared genai client
+record    - live calls, with each chunk sequence and its timing saved to a cassette file
+replay    - cassettes played back with original or scaled inter-chunk latency
+synthetic - generated streams of configurable size, malformed JSON rate and braces-in-strings density
+"""
+
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+
+import httpx
+from google.genai import types
+
+import gemini_client
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_DIR = os.environ.get('CASSETTE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cassettes'))
+REPLAY_LATENCY_SCALE = float(os.environ.get('REPLAY_LATENCY_SCALE', '1.0'))
+
+# Errors that indicate the client's transport is unusable and should be rebuilt
+TRANSPORT_ERRORS = (httpx.TransportError, ConnectionError)
+
+
+def make_chunk(text):
+    """Build a response chunk shaped like the ones the genai SDK streams"""
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))]
+    )
+
+
+def cassette_name(endpoint, prompt):
+    digest = hashlib.sha256(f"{endpoint}\n{prompt}".encode('utf-8')).hexdigest()[:16]
+    return f"{endpoint}-{digest}.json"
+
+
+class LiveBackend:
+    """Calls Vertex AI through the shared client; transport failures reset the client"""
+
+    def generate_content_stream(self, endpoint, prompt):
+        client = gemini_client.get_client()
+        metrics.current_trace().mark('client_init')
+        try:
+            yield from client.models.generate_content_stream(
+                model=gemini_client.MODEL,
+                contents=gemini_client.build_contents(prompt),
+                config=gemini_client.get_config(endpoint),
+            )
+        except TRANSPORT_ERRORS as e:
+            logger.warning(f"Gemini transport error, resetting client: {e}")
+            gemini_client.reset_client(client)
+            raise
+
+    async def agenerate_content_stream(self, endpoint, prompt):
+        client = gemini_client.get_client()
+        metrics.current_trace().mark('client_init')
+        try:
+            response_stream = await client.aio.models.generate_content_stream(
+                model=gemini_client.MODEL,
+                contents=gemini_client.build_contents(prompt),
+                config=gemini_client.get_config(endpoint),
+            )
+            async for chunk in response_stream:
+                yield chunk
+        except TRANSPORT_ERRORS as e:
+            logger.warning(f"Gemini transport error, resetting client: {e}")
+            gemini_client.reset_client(client)
+            raise
+
+
+class RecordingBackend:
+    """
+    Passes calls through to another backend and saves each stream as a cassette.
+    A stream closed early (client gone, max_results, deadline) or failed saves the
+    chunks read so far, marked incomplete, unless a complete cassette already exists.
+    """
+
+    def __init__(self, inner=None, cassette_dir=CASSETTE_DIR):
+        self.inner = inner or LiveBackend()
+        self.cassette_dir = cassette_dir
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    def _save(self, endpoint, prompt, chunks, complete):
+        path = os.path.join(self.cassette_dir, cassette_name(endpoint, prompt))
+        if not chunks or (not complete and os.path.exists(path)):
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'endpoint': endpoint, 'prompt': prompt, 'complete': complete, 'chunks': chunks}, f, indent=1)
+        logger.info(f"Recorded {len(chunks)} chunks to {path}{'' if complete else ' (stream ended early)'}")
+
+    def generate_content_stream(self, endpoint, prompt):
+        chunks, complete = [], False
+        last = time.perf_counter()
+        try:
+            for chunk in self.inner.generate_content_stream(endpoint, prompt):
+                now = time.perf_counter()
+                chunks.append({'delay': round(now - last, 4), 'text': ''.join(gemini_client.chunk_text(chunk))})
+                last = now
+                yield chunk
+            complete = True
+        finally:
+            self._save(endpoint, prompt, chunks, complete)
+
+    async def agenerate_content_stream(self, endpoint, prompt):
+        chunks, complete = [], False
+        last = time.perf_counter()
+        try:
+            async for chunk in self.inner.agenerate_content_stream(endpoint, prompt):
+                now = time.perf_counter()
+                chunks.append({'delay': round(now - last, 4), 'text': ''.join(gemini_client.chunk_text(chunk))})
+                last = now
+                yield chunk
+            complete = True
+        finally:
+            self._save(endpoint, prompt, chunks, complete)
+
+
+class TruncatedCassette(Exception):
+    """Raised after replaying a cassette whose recorded stream ended early"""
+
+
+class ReplayBackend:
+    """
+    Plays recorded cassettes back. A prompt without its own cassette falls back
+    to a complete cassette recorded for the same endpoint (an incomplete one only
+    if there is nothing else), so arbitrary queries can be benchmarked offline.
+    Replaying an incomplete cassette ends with TruncatedCassette after its chunks,
+    as the recorded stream did, rather than passing as a full response.
+    latency_scale=0 replays as fast as possible.
+    """
+
+    def __init__(self, cassette_dir=CASSETTE_DIR, latency_scale=REPLAY_LATENCY_SCALE):
+        self.cassette_dir = cassette_dir
+        self.latency_scale = latency_scale
+        self._loaded = {}
+
+    def _read(self, path):
+        cassette = self._loaded.get(path)
+        if cassette is None:
+            with open(path, 'r', encoding='utf-8') as f:
+                cassette = self._loaded[path] = json.load(f)
+        return cassette
+
+    def load(self, endpoint, prompt):
+        path = os.path.join(self.cassette_dir, cassette_name(endpoint, prompt))
+        if os.path.exists(path):
+            return self._read(path)
+        candidates = sorted(glob.glob(os.path.join(self.cassette_dir, f"{endpoint}-*.json")))
+        if not candidates:
+            raise LookupError(f"No cassette recorded for {endpoint} in {self.cassette_dir}")
+        # Cassettes recorded before the complete flag existed were only saved after a full drain
+        return next((cassette for cassette in map(self._read, candidates) if cassette.get('complete', True)),
+                     self._read(candidates[0]))
+
+    def _check_complete(self, endpoint, cassette):
+        if not cassette.get('complete', True):
+            raise TruncatedCassette(f"{endpoint} cassette for {cassette['prompt'][:40]!r} "
+                                    f"was recorded from a stream that ended early")
+
+    def generate_content_stream(self, endpoint, prompt):
+        cassette = self.load(endpoint, prompt)
+        for recorded in cassette['chunks']:
+            if self.latency_scale and recorded['delay']:
+                time.sleep(recorded['delay'] * self.latency_scale)
+            yield make_chunk(recorded['text'])
+        self._check_complete(endpoint, cassette)
+
+    async def agenerate_content_stream(self, endpoint, prompt):
+        cassette = self.load(endpoint, prompt)
+        for recorded in cassette['chunks']:
+            if self.latency_scale and recorded['delay']:
+                await asyncio.sleep(recorded['delay'] * self.latency_scale)
+            yield make_chunk(recorded['text'])
+        self._check_complete(endpoint, cassette)
+
+
+SEVERITIES = ('critical', 'high', 'medium', 'low')
+SYNTHETIC_CITIES = (
+    ('Los Angeles', 'CA', '803', 34.0522, -118.2437),
+    ('New York', 'NY', '501', 40.7128, -74.0060),
+    ('Chicago', 'IL', '602', 41.8781, -87.6298),
+    ('Houston', 'TX', '618', 29.7604, -95.3698),
+    ('Phoenix', 'AZ', '753', 33.4484, -112.0740),
+    ('Miami', 'FL', '528', 25.7617, -80.1918),
+    ('Seattle', 'WA', '819', 47.6062, -122.3321),
+    ('Denver', 'CO', '751', 39.7392, -104.9903),
+)
+
+# Varied per city so synthetic incidents in the same market stay distinct under dedup
+SYNTHETIC_PRODUCTS = (
+    'Benadryl', 'melatonin gummy', 'nitrous oxide', 'kratom', 'eye drop', 'vape cartridge', 'energy drink',
+    'diet pill',
+)
+
+
+class SyntheticBackend:
+    """
+    Generates model-like output locally. Streaming endpoints get one JSON object
+    per result surrounded by prose; the others get a single results/trends wrapper.
+    slow_rate of calls wait slow_delay instead of first_chunk_delay, and error_rate
+    of calls fail with a connection error before any output (drawn per call).
+    trailing_sentences of prose follow the JSON, as the model often adds.
+    """
+
+    def __init__(self, results=10, summary_sentences=2, malformed_rate=0.0, brace_density=0.0,
+                 chunk_size=80, first_chunk_delay=0.0, chunk_delay=0.0, seed=0,
+                 slow_rate=0.0, slow_delay=0.0, error_rate=0.0, trailing_sentences=0):
+        self.results = results
+        self.summary_sentences = summary_sentences
+        self.malformed_rate = malformed_rate
+        self.brace_density = brace_density
+        self.chunk_size = chunk_size
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.seed = seed
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.error_rate = error_rate
+        self.trailing_sentences = trailing_sentences
+        self._call_rng = random.Random(seed)
+
+    def _result(self, rng, endpoint, i):
+        city, state, dma, lat, lng = SYNTHETIC_CITIES[i % len(SYNTHETIC_CITIES)]
+        product = SYNTHETIC_PRODUCTS[(i // len(SYNTHETIC_CITIES)) % len(SYNTHETIC_PRODUCTS)]
+        title = f"Synthetic report {i}: {product} challenge"
+        if rng.random() < self.brace_density:
+            title += " {update}"
+        if endpoint.startswith('trends'):
+            return {
+                'dma_code': dma,
+                'dma_name': city.upper(),
+                'location': {'city': city, 'state': state, 'lat': lat, 'lng': lng},
+                'query_term': title,
+                'query_volume': rng.randint(0, 1000),
+                'trend': f"+{rng.randint(0, 300)}%",
+                'risk': rng.choice(SEVERITIES),
+                'affected': rng.randint(100, 1000000),
+            }
+        summary = ' '.join(
+            f"Sentence {n} about reported ER visits{' {sic}' if rng.random() < self.brace_density else ''}."
+            for n in range(self.summary_sentences)
+        )
+        return {
+            'title': title,
+            'source': 'Synthetic News',
+            'date': f"2025-06-{(i // len(SYNTHETIC_CITIES)) % 28 + 1:02d}",
+            'severity': rng.choice(SEVERITIES),
+            'summary': summary,
+            'location': {'state': state, 'city': city, 'lat': lat, 'lng': lng},
+            'affected': rng.randint(1, 5000),
+            'url': f"https://example.com/synthetic/{i}",
+        }
+
+    def _encode(self, rng, obj):
+        text = json.dumps(obj, indent=2)
+        if rng.random() < self.malformed_rate:
+            # Drop the first comma so the object still closes but no longer decodes
+            text = text.replace(',', '', 1)
+        return text
+
+    def render(self, endpoint, prompt=''):
+        """Full synthetic response text for one call"""
+        rng = random.Random(f"{self.seed}:{endpoint}:{prompt}")
+        results = [self._result(rng, endpoint, i) for i in range(self.results)]
+        if gemini_client.STRUCTURED_OUTPUT:
+            # Schema-constrained output: bare JSON, a top-level array for streaming endpoints
+            if endpoint.endswith('_stream'):
+                return '[' + ','.join(self._encode(rng, obj) for obj in results) + ']'
+            key = 'trends' if endpoint.startswith('trends') else 'results'
+            return self._encode(rng, {key: results})
+        trailing = ''.join(
+            f" Note {n}: these figures may change as local health departments publish updates."
+            for n in range(self.trailing_sentences)
+        )
+        if endpoint.endswith('_stream'):
+            body = '\n'.join(self._encode(rng, obj) for obj in results)
+            return f"Here is what I found.\n{body}\nThese reports are based on current sources.{trailing}"
+        key = 'trends' if endpoint.startswith('trends') else 'results'
+        return f"```json\n{self._encode(rng, {key: results})}\n```\nLet me know if you need more detail.{trailing}"
+
+    def _pieces(self, endpoint, prompt):
+        text = self.render(endpoint, prompt)
+        first_chunk_delay = self.slow_delay if self._call_rng.random() < self.slow_rate else self.first_chunk_delay
+        failed = self._call_rng.random() < self.error_rate
+        for i in range(0, len(text), self.chunk_size):
+            delay = first_chunk_delay if i == 0 else self.chunk_delay
+            yield delay, (None if failed else text[i:i + self.chunk_size])
+
+    def generate_content_stream(self, endpoint, prompt):
+        for delay, text in self._pieces(endpoint, prompt):
+            if delay:
+                time.sleep(delay)
+            if text is None:
+                raise ConnectionError('Synthetic upstream connection reset')
+            yield make_chunk(text)
+
+    async def agenerate_content_stream(self, endpoint, prompt):
+        for delay, text in self._pieces(endpoint, prompt):
+            if delay:
+                await asyncio.sleep(delay)
+            if text is None:
+                raise ConnectionError('Synthetic upstream connection reset')
+            yield make_chunk(text)
+
+
+def create_backend(name):
+    if name == 'record':
+        return RecordingBackend()
+    if name == 'replay':
+        return ReplayBackend()
+    if name == 'synthetic':
+        return SyntheticBackend()
+    return LiveBackend()
@@ -0,0 +1,267 @@
+"""
+Gemini prompt templates for the FDA Horizon Scan endpoints
+Keyed by the same endpoint names as the request configs in gemini_client
+"""
+
+import gemini_client
+
+
+# Markets the trends endpoints report on; coordinates come from the gazetteer, not the prompt
+DMA_MARKETS = ', '.join(f"{code}: {name}" for code, name in (
+    ('803', 'LOS ANGELES'), ('807', 'SAN FRANCISCO-OAKLAND-SAN JOSE'), ('819', 'SEATTLE-TACOMA'),
+    ('501', 'NEW YORK'), ('506', 'BOSTON'), ('511', 'WASHINGTON DC'), ('618', 'HOUSTON'),
+    ('623', 'DALLAS-FT. WORTH'), ('528', 'MIAMI-FT. LAUDERDALE'), ('524', 'ATLANTA'),
+    ('602', 'CHICAGO'), ('505', 'DETROIT'), ('751', 'DENVER'), ('753', 'PHOENIX'),
+    ('770', 'SALT LAKE CITY'),
+))
+
+
+def search_prompt(query):
+    """Prompt for the non-streaming incident search (single results wrapper)"""
+    return f"""You are an FDA health surveillance expert. Search for and analyze CURRENT information about: "{query}"
+
+Focus on finding REAL news reports, FDA announcements, and documented incidents related to the query. This could include:
+- FDA warning letters, enforcement actions, recalls
+- Regulatory violations and compliance issues
+- Health incidents, adverse events, outbreaks
+- Product safety issues and contamination
+- Medical device and drug problems
+- Any other relevant health or regulatory matters
+
+Search for ACTUAL news articles and official reports. Provide exactly 5 results based on real sources.
+
+Use this exact JSON format:
+{{
+  "results": [
+    {{
+      "title": "Brief title from the actual news/report",
+      "source": "Actual source (e.g., FDA.gov, CNN, local news)",
+      "date": "YYYY-MM-DD",
+      "severity": "critical/high/medium/low",
+      "summary": "Concise description from the actual report including key details",
+      "location": {{"state": "XX", "city": "City Name", "lat": latitude, "lng": longitude}},
+      "affected": number_affected_if_available,
+      "url": "Source URL"
+    }}
+  ]
+}}
+
+Return exactly 5 results. Focus on relevance to the query rather than forcing social media angles."""
+
+
+def search_stream_prompt(query):
+    """Prompt for the streaming incident search (one JSON object per result)"""
+    return f"""You are an FDA horizon scanning expert looking for EMERGING health threats. Search for and analyze CURRENT information about: "{query}"
+
+CRITICAL: Focus on EMERGING issues that FDA may NOT know about yet:
+- TikTok/Instagram health challenges causing ER visits in specific cities
+- DIY medical treatments trending on Reddit or social media
+- Unregulated supplements being sold on Etsy/Amazon
+- Local emergency room reports of unusual symptoms
+- Viral "wellness" trends with potential health risks
+- Gray market products gaining popularity
+
+Search for LOCAL news reports, hospital reports, and social media discussions. Each result MUST include the specific city where it's happening.
+
+For EACH result, output ONLY a valid JSON object in this format (no array wrapper):
+{{
+  "title": "Brief title from the actual news/report",
+  "source": "Actual source (prefer local news outlets)",
+  "date": "YYYY-MM-DD",
+  "severity": "critical/high/medium/low",
+  "summary": "Concise description INCLUDING the specific location mentioned in the article",
+  "location": {{
+    "state": "XX (two-letter US state code ONLY)",
+    "city": "US city name ONLY",
+    "lat": actual_latitude_number,
+    "lng": actual_longitude_number
+  }},
+  "affected": numeric_value_only,
+  "url": "Source URL"
+}}
+
+IMPORTANT REQUIREMENTS:
+- Focus on US cities and states when possible
+- "affected" MUST be a number (use 100 if unknown, never use strings like "Unknown")
+- "state" MUST be a valid 2-letter US state code (CA, NY, TX, etc.)
+- Each result MUST name the specific US city and its state
+
+Generate 5-10 results from DIFFERENT cities, outputting each as a separate JSON object."""
+
+
+def search_thinking_prompt(query):
+    """Prompt for the incident search with thinking visibility"""
+    return f"""You are an FDA health surveillance expert analyzing dangerous social media health trends across the United States.
+
+Search for and analyze CURRENT, REAL information about: "{query}"
+
+Focus on:
+1. Viral TikTok, Instagram, YouTube health challenges and DIY treatments that are ACTUALLY happening right now
+2. REAL documented injuries, emergency room visits, hospitalizations from news reports
+3. Medical professional warnings and FDA concerns from actual articles
+4. NATIONWIDE geographic distribution - find REAL incidents reported in news from MULTIPLE US cities/states
+5. Actual reported numbers of affected users and trending metrics from news sources
+
+Search for REAL, CURRENT news articles and health reports. Provide at least 5-10 results from DIFFERENT US cities based on ACTUAL news reports.
+
+Use this exact JSON format with REAL data from your search:
+{{
+  "results": [
+    {{
+      "title": "Brief title of the ACTUAL health trend/incident from news",
+      "source": "Actual news source/platform (e.g., CNN, NBC News, local news)",
+      "date": "YYYY-MM-DD (actual date from article)",
+      "severity": "critical/high/medium/low (based on actual severity)",
+      "summary": "Detailed description from the actual news report including specific health risks mentioned",
+      "location": {{"state": "XX", "city": "City Name", "lat": actual_latitude, "lng": actual_longitude}},
+      "affected": estimated_number_based_on_article,
+      "url": "Actual source URL from the article"
+    }}
+  ]
+}}"""
+
+
+def trends_prompt(query):
+    """Prompt for simulated Health Trends data (single trends wrapper)"""
+    return f"""You are simulating the Google Health Trends API by analyzing REAL search patterns for: "{query}"
+
+Search Google to understand the ACTUAL current search volume and geographic distribution of this health trend.
+Look for news articles mentioning search trends, Google Trends data, or reports about where this trend is popular.
+
+Generate realistic query volume data for major US metro areas based on ACTUAL information you find:
+
+For these major US markets (use their standard DMA codes):
+- 803: Los Angeles
+- 807: San Francisco-Oakland-San Jose  
+- 819: Seattle-Tacoma
+- 501: New York
+- 506: Boston
+- 511: Washington DC
+- 618: Houston
+- 623: Dallas-Ft. Worth
+- 528: Miami-Ft. Lauderdale
+- 524: Atlanta
+- 602: Chicago
+- 505: Detroit
+- 751: Denver
+- 753: Phoenix
+- 770: Salt Lake City
+
+Based on REAL news reports and search data you find, estimate for each market:
+1. Query volume (0-1000 scale, where 1000 = extremely high search volume)
+2. Trend percentage (how much it's increased recently based on news reports)
+3. Risk level (critical/high/medium/low based on actual health risks reported)
+4. Estimated affected users (based on news reports of incidents in that area)
+
+Return JSON in this exact format with REALISTIC data based on your search:
+{{
+  "trends": [
+    {{
+      "dma_code": "803",
+      "dma_name": "LOS ANGELES",
+      "location": {{"city": "Los Angeles", "state": "CA"}},
+      "query_term": "{query}",
+      "query_volume": realistic_number_0_to_1000,
+      "trend": "+X%",
+      "risk": "critical/high/medium/low",
+      "affected": realistic_estimate
+    }}
+  ]
+}}
+
+Base the volumes and trends on ACTUAL search activity and news reports you find. Higher volumes in areas where news reports indicate the trend is more popular."""
+
+
+def trends_stream_prompt(query):
+    """Prompt for streamed Health Trends data (one JSON object per market)"""
+    return f"""You are simulating the Google Health Trends API. Search for information about: "{query}"
+
+IMPORTANT: Search Google for news articles, reports, and data about "{query}" to understand where this health trend is happening and how severe it is in different US cities.
+
+Based on your search results, generate trend data for these 15 major US markets. Output EACH market as a SEPARATE JSON object (not in an array):
+
+For each of these markets (DMA code: name), output a JSON object with realistic data based on what you found:
+{DMA_MARKETS}
+
+For EACH city, output EXACTLY this JSON format (replace values with realistic estimates):
+{{
+  "dma_code": "803",
+  "dma_name": "LOS ANGELES",
+  "location": {{"city": "Los Angeles", "state": "CA"}},
+  "query_term": "{query}",
+  "query_volume": 750,
+  "trend": "+15%",
+  "risk": "critical",
+  "affected": 750000
+}}
+
+IMPORTANT: For "risk" field, use ONLY these values:
+- "critical" (for very severe situations)
+- "high" (for serious situations)
+- "medium" (for moderate situations)
+- "low" (for minimal risk situations)
+Never use "very high", "moderate", or any other values.
+
+Output 15 JSON objects total, one per line. Higher volumes in cities where you found more news reports about the trend."""
+
+
+# Structured-output mode: the response schema fixes the shape, types and enums, so these
+# prompts carry only the task - no format examples or coordinate tables
+
+def search_schema_prompt(query):
+    """Structured-mode prompt for the non-streaming incident search"""
+    return f"""You are an FDA health surveillance expert. Report CURRENT, documented news reports, FDA announcements and incidents about: "{query}"
+Include warning letters, recalls, adverse events, outbreaks, contamination and product safety issues.
+Return exactly 5 results. Use the US city and state where each incident happened; use 100 for "affected" when unknown."""
+
+
+def search_stream_schema_prompt(query):
+    """Structured-mode prompt for the streaming incident search"""
+    return f"""You are an FDA horizon scanning expert looking for EMERGING health threats about: "{query}"
+Prioritize issues FDA may not know about yet: social media health challenges causing ER visits, DIY treatments, unregulated supplements sold online, unusual symptoms in local ER reports, risky wellness trends and gray market products.
+Return 5-10 results from DIFFERENT US cities, each with its city and two-letter state code; use 100 for "affected" when unknown."""
+
+
+def search_thinking_schema_prompt(query):
+    """Structured-mode prompt for the incident search with thinking visibility"""
+    return f"""You are an FDA health surveillance expert analyzing dangerous social media health trends across the United States: "{query}"
+Cover viral health challenges and DIY treatments, documented injuries and ER visits, medical warnings and FDA concerns, and the numbers affected.
+Return 5-10 results from DIFFERENT US cities, each with its city and two-letter state code."""
+
+
+def trends_schema_prompt(query):
+    """Structured-mode prompt for simulated Health Trends data"""
+    return f"""You are simulating the Google Health Trends API for: "{query}"
+Estimate, from what is known about where this trend is reported, a record for each of these US markets (DMA code: name):
+{DMA_MARKETS}
+query_volume is 0-1000 (1000 = extremely high search volume), trend is the recent change such as "+15%", risk reflects the reported health risk and query_term is "{query}"."""
+
+
+def trends_stream_schema_prompt(query):
+    """Structured-mode prompt for streamed Health Trends data"""
+    return trends_schema_prompt(query)
+
+
+PROMPTS = {
+    'search': search_prompt,
+    'search_stream': search_stream_prompt,
+    'search_thinking': search_thinking_prompt,
+    'trends': trends_prompt,
+    'trends_stream': trends_stream_prompt,
+}
+
+
+SCHEMA_PROMPTS = {
+    'search': search_schema_prompt,
+    'search_stream': search_stream_schema_prompt,
+    'search_thinking': search_thinking_schema_prompt,
+    'trends': trends_schema_prompt,
+    'trends_stream': trends_stream_schema_prompt,
+}
+
+
+def build_prompt(endpoint, query, structured=None):
+    """Prompt for endpoint; structured defaults to gemini_client.STRUCTURED_OUTPUT"""
+    if structured is None:
+        structured = gemini_client.STRUCTURED_OUTPUT
+    return (SCHEMA_PROMPTS if structured else PROMPTS)[endpoint](query)
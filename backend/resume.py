@@ -0,0 +1,187 @@
+"""
+Resumable SSE streams
+Each stream's frames are produced on a background thread into a bounded ring
+buffer and sent with an `id: <stream>-<seq>` line. A client reconnecting with
+Last-Event-ID picks up after that frame - from the buffer, then the live
+stream - without another upstream call. A stream nobody is reading keeps
+running for a grace period so a reconnect can reclaim it, then is cancelled
+by a timer, whether or not the upstream is still sending anything.
+"""
+
+import collections
+import logging
+import os
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SSE_RESUME = os.environ.get('SSE_RESUME', '1').lower() in ('1', 'true', 'yes')
+
+# Per-stream ring buffer caps; the oldest frames are dropped first
+RESUME_BUFFER_FRAMES = int(os.environ.get('RESUME_BUFFER_FRAMES', '512'))
+RESUME_BUFFER_BYTES = int(os.environ.get('RESUME_BUFFER_BYTES', str(1024 * 1024)))
+
+# How long a stream with no readers keeps generating, and a finished stream stays resumable
+RESUME_GRACE_SECONDS = float(os.environ.get('RESUME_GRACE_SECONDS', '15'))
+RESUME_TTL_SECONDS = float(os.environ.get('RESUME_TTL_SECONDS', '300'))
+
+# Streams kept per instance; the oldest are forgotten first
+RESUME_MAX_STREAMS = int(os.environ.get('RESUME_MAX_STREAMS', '256'))
+
+
+class ResumableStream:
+    """Frames of one SSE response, numbered from 1, in a ring buffer readers can follow"""
+
+    def __init__(self, key, frames, max_frames=None, max_bytes=None, grace=None, cancel=None):
+        self.key = key
+        self.stream_id = secrets.token_hex(8)
+        self.max_frames = max_frames or RESUME_BUFFER_FRAMES
+        self.max_bytes = max_bytes or RESUME_BUFFER_BYTES
+        self.grace = RESUME_GRACE_SECONDS if grace is None else grace
+        self.buffer = collections.deque()
+        self.buffered_bytes = 0
+        self.last_seq = 0
+        self.readers = 0
+        self.abandoned_at = None
+        self.finished_at = None
+        self.cancelled = False
+        # Set when the grace period runs out; the frame pipeline stops its waits and upstream on it
+        self.cancel = cancel
+        self._cond = threading.Condition()
+        threading.Thread(target=self._produce, args=(frames,), name=f"sse-{self.stream_id}", daemon=True).start()
+
+    @property
+    def first_seq(self):
+        return self.buffer[0][0] if self.buffer else self.last_seq + 1
+
+    def _produce(self, frames):
+        try:
+            for frame in frames:
+                with self._cond:
+                    self.last_seq += 1
+                    self.buffer.append((self.last_seq, frame))
+                    self.buffered_bytes += len(frame)
+                    while self.buffer and (len(self.buffer) > self.max_frames or self.buffered_bytes > self.max_bytes):
+                        self.buffered_bytes -= len(self.buffer.popleft()[1])
+                    self._cond.notify_all()
+                    cancelled = self.cancelled
+                if cancelled:
+                    break
+        except Exception as e:
+            logger.error(f"SSE stream {self.stream_id} failed: {e}")
+        finally:
+            # Closing the frame generator closes its upstream stream
+            frames.close()
+            with self._cond:
+                self.finished_at = time.monotonic()
+                self._cond.notify_all()
+
+    def can_resume(self, after):
+        """Whether every frame after seq `after` is still available"""
+        with self._cond:
+            return not self.cancelled and self.first_seq <= after + 1 <= self.last_seq + 1
+
+    def follow(self, after=0):
+        """Yield id-tagged frames after seq `after`: buffered ones, then live ones until the stream ends"""
+        with self._cond:
+            self.readers += 1
+            self.abandoned_at = None
+        try:
+            while True:
+                with self._cond:
+                    while self.last_seq <= after and self.finished_at is None:
+                        self._cond.wait()
+                    if after + 1 < self.first_seq:
+                        # This reader fell behind the ring buffer; end so the client reconnects
+                        return
+                    batch = [(seq, frame) for seq, frame in self.buffer if seq > after]
+                    finished = self.finished_at is not None
+                for seq, frame in batch:
+                    yield f"id: {self.stream_id}-{seq}\n{frame}"
+                    after = seq
+                if finished and after >= self.last_seq:
+                    return
+        finally:
+            with self._cond:
+                self.readers -= 1
+                abandoned = self.readers == 0 and self.finished_at is None
+                if abandoned:
+                    self.abandoned_at = time.monotonic()
+            if abandoned:
+                timer = threading.Timer(self.grace, self._expire, args=(self.abandoned_at,))
+                timer.daemon = True
+                timer.start()
+
+    def _expire(self, abandoned_at):
+        """Grace timer: cancel the stream unless a reader has come back since abandoned_at"""
+        with self._cond:
+            if self.finished_at is not None or self.abandoned_at != abandoned_at:
+                return
+            self.cancelled = True
+            self._cond.notify_all()
+        logger.info(f"SSE stream {self.stream_id} abandoned for {self.grace:g}s; closing it")
+        if self.cancel is not None:
+            self.cancel.set()
+
+    def expired(self, now, ttl=RESUME_TTL_SECONDS):
+        return self.cancelled or (self.finished_at is not None and now - self.finished_at > ttl)
+
+
+class ResumeRegistry:
+    """Streams by id, forgetting expired ones and the oldest beyond max_streams"""
+
+    def __init__(self, max_streams=RESUME_MAX_STREAMS, ttl=RESUME_TTL_SECONDS):
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self._streams = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.expired(now, self.ttl):
+                del self._streams[stream_id]
+        while len(self._streams) > self.max_streams:
+            self._streams.popitem(last=False)
+
+    def start(self, key, frames, cancel=None):
+        """
+        Run frames on a new resumable stream and return the first reader's id-tagged frames.
+        cancel (a threading.Event) is set if the stream is abandoned past its grace period.
+        """
+        stream = ResumableStream(key, frames, cancel=cancel)
+        with self._lock:
+            self._prune()
+            self._streams[stream.stream_id] = stream
+        return stream.follow()
+
+    def resume(self, key, last_event_id):
+        """Frames after last_event_id, or None when that stream cannot be resumed (start a new one)"""
+        if not last_event_id:
+            return None
+        stream_id, _, seq = last_event_id.rpartition('-')
+        with self._lock:
+            self._prune()
+            stream = self._streams.get(stream_id)
+        if stream is None or stream.key != key or not seq.isdigit() or not stream.can_resume(int(seq)):
+            return None
+        logger.info(f"Resuming SSE stream {stream_id} after frame {seq}")
+        return stream.follow(int(seq))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._streams)
+
+
+registry = ResumeRegistry()
+
+
+def start(key, frames, cancel=None):
+    """frames with resumable ids (SSE_RESUME), or unchanged when resumption is off"""
+    return registry.start(key, frames, cancel) if SSE_RESUME else frames
+
+
+def resume(key, last_event_id):
+    return registry.resume(key, last_event_id) if SSE_RESUME else None
@@ -0,0 +1,280 @@
+"""
+Scheduled incremental horizon scans
+Re-runs the configured watchlist upstream in parallel, diffs each query's
+results against the previous run by event fingerprint, records only new or
+changed events, and pre-warms the query cache so the interactive endpoints
+answer instantly with a new_since_last_scan flag on every record
+
+Run locally with:
+    MODEL_BACKEND=synthetic python scheduler.py --watchlist watchlist.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import metrics
+import watchlist
+from cache import get_query_cache
+from dedup import fingerprint
+from event_store import EVENT_STORE_PATH, get_event_store, paused
+from timeseries import get_series_store
+
+logger = logging.getLogger(__name__)
+
+# JSON list of queries - strings or {"query", "type": "search"|"trends"} objects
+SCAN_WATCHLIST_FILE = os.environ.get('SCAN_WATCHLIST_FILE', '')
+
+# Previous-run fingerprints and the run log live next to the event history by default
+SCAN_STATE_PATH = os.environ.get('SCAN_STATE_PATH', EVENT_STORE_PATH)
+
+SCAN_CONCURRENCY = int(os.environ.get('SCAN_CONCURRENCY', '8'))
+
+DEFAULT_WATCHLIST = [
+    {'query': 'dangerous tiktok health trends 2025', 'type': 'search'},
+    {'query': 'dangerous health trends', 'type': 'trends'},
+]
+
+NEW_FLAG = 'new_since_last_scan'
+
+# Scan kind -> (event type, event store endpoint, cache endpoints warmed with the records)
+KIND_TARGETS = {
+    'search': ('result', 'scan_search', ('search', 'search_stream')),
+    'trends': ('trend', 'scan_trends', ('trends', 'trends_stream')),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_items (
+    kind TEXT NOT NULL,
+    query TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (kind, query, fingerprint)
+);
+CREATE TABLE IF NOT EXISTS scan_runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    duration_s REAL NOT NULL,
+    summary TEXT NOT NULL
+);
+"""
+
+
+class ScanInProgress(Exception):
+    """Raised when a scan is started while another one is still running in this process"""
+
+
+def load_watchlist(path=SCAN_WATCHLIST_FILE):
+    """(query, kind) pairs from the watchlist file, or the endpoints' default queries"""
+    if not path:
+        return watchlist.parse_items(DEFAULT_WATCHLIST)
+    with open(path, 'r', encoding='utf-8') as f:
+        return watchlist.parse_items(json.load(f))
+
+
+def content_hash(record):
+    """Digest of everything in a record, so any edit between runs counts as a change"""
+    content = {key: value for key, value in record.items() if key != NEW_FLAG}
+    return hashlib.blake2b(json.dumps(content, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+
+
+class ScanState:
+    """Fingerprints seen by the previous run of each query, and a log of runs, in SQLite"""
+
+    def __init__(self, path=SCAN_STATE_PATH):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def previous(self, kind, query):
+        """{fingerprint: content hash} from the last run of a query"""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT fingerprint, content_hash FROM scan_items WHERE kind = ? AND query = ?', (kind, query),
+            ).fetchall()
+        return dict(rows)
+
+    def replace(self, kind, query, current, now):
+        """Make current ({fingerprint: content hash}) the state of a query, keeping first-seen times"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"DELETE FROM scan_items WHERE kind = ? AND query = ? AND fingerprint NOT IN "
+                f"({', '.join('?' for _ in current)})",
+                (kind, query, *current),
+            )
+            self._connection.executemany(
+                'INSERT INTO scan_items (kind, query, fingerprint, content_hash, first_seen, last_seen) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (kind, query, fingerprint) '
+                'DO UPDATE SET content_hash = excluded.content_hash, last_seen = excluded.last_seen',
+                [(kind, query, key, digest, now, now) for key, digest in current.items()],
+            )
+
+    def log_run(self, summary):
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO scan_runs (started_at, duration_s, summary) VALUES (?, ?, ?)',
+                (summary['started_at'], summary['duration_s'], json.dumps(summary)),
+            )
+        return cursor.lastrowid
+
+    def runs(self, limit=10):
+        """Most recent run summaries, newest first"""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id, summary FROM scan_runs ORDER BY id DESC LIMIT ?', (limit,),
+            ).fetchall()
+        return [dict(json.loads(summary), run_id=run_id) for run_id, summary in rows]
+
+
+def diff_records(event_type, records, previous):
+    """
+    Flag each record against the previous run's fingerprints. Returns the flagged
+    copies, the new {fingerprint: content hash} state and new/changed/unchanged/removed counts.
+    """
+    flagged, current = [], {}
+    counts = {'new': 0, 'changed': 0, 'unchanged': 0}
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        key, digest = fingerprint(event_type, record), content_hash(record)
+        if key in current:
+            continue
+        current[key] = digest
+        status = 'new' if key not in previous else 'changed' if previous[key] != digest else 'unchanged'
+        counts[status] += 1
+        flagged.append(dict(record, **{NEW_FLAG: status != 'unchanged'}))
+    counts['removed'] = sum(1 for key in previous if key not in current)
+    return flagged, current, counts
+
+
+def _warm_cache(kind, query, flagged):
+    _, _, endpoints = KIND_TARGETS[kind]
+    query_cache = get_query_cache()
+    for endpoint in endpoints:
+        # Same shapes the cached pipelines store: a results wrapper for search, lists otherwise
+        query_cache.set(endpoint, query, {'results': flagged} if endpoint == 'search' else flagged)
+
+
+_run_lock = threading.Lock()
+
+
+def run_scan(fetchers, items=None, concurrency=SCAN_CONCURRENCY, state=None):
+    """
+    Run one scan of items ((query, kind) pairs, default: the configured watchlist)
+    with fetchers[kind](query) -> records called upstream, and return the run summary
+    """
+    if not _run_lock.acquire(blocking=False):
+        raise ScanInProgress('A scan is already running')
+    try:
+        items = items or load_watchlist()
+        state = state or get_scan_state()
+        event_store = get_event_store()
+        started_at = time.time()
+        upstream_calls = 0
+        calls_lock = threading.Lock()
+
+        def upstream(kind):
+            def fetch(query):
+                nonlocal upstream_calls
+                with calls_lock:
+                    upstream_calls += 1
+                # The scan records its own deltas below, not every parsed event
+                with paused():
+                    return fetchers[kind](query)
+            return fetch
+
+        totals = {'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+        per_query = []
+        for line in watchlist.run_watchlist(items, {kind: upstream(kind) for kind in fetchers}, concurrency,
+                                            cache_aware=False):
+            if line['type'] == 'summary':
+                batch = line
+                continue
+            entry = {key: line.get(key) for key in ('query', 'query_type', 'status', 'elapsed_s', 'error')}
+            # An empty or failed answer leaves the previous state and cache entries alone
+            if line['status'] == 'ok':
+                kind, query = line['query_type'], line['query']
+                event_type, store_endpoint, _ = KIND_TARGETS[kind]
+                flagged, current, counts = diff_records(event_type, line['results'], state.previous(kind, query))
+                state.replace(kind, query, current, started_at)
+                for record in flagged:
+                    if record[NEW_FLAG]:
+                        event_store.record(store_endpoint, query, record)
+                _warm_cache(kind, query, flagged)
+                entry.update(counts)
+                for name, count in counts.items():
+                    totals[name] += count
+            per_query.append(entry)
+
+        # The stores write in the background: make the recorded deltas and series points
+        # durable before the run is logged, since the next run diffs against this one
+        event_store.flush()
+        get_series_store().flush()
+
+        summary = {
+            'started_at': started_at,
+            'started': datetime.fromtimestamp(started_at).isoformat(),
+            'duration_s': round(time.time() - started_at, 3),
+            'queries': len(items),
+            'upstream_calls': upstream_calls,
+            **{status: batch[status] for status in ('ok', 'empty', 'error', 'timeout')},
+            **totals,
+            'per_query': per_query,
+        }
+        summary['run_id'] = state.log_run(summary)
+    finally:
+        _run_lock.release()
+
+    if metrics.METRICS_ENABLED:
+        metrics.registry.inc('fda_scan_runs_total', help_text='Scheduled scan runs')
+        metrics.registry.inc('fda_scan_upstream_calls_total', upstream_calls, help_text='Upstream calls made by scans')
+        metrics.registry.observe('fda_scan_duration_seconds', summary['duration_s'], help_text='Scan run duration')
+    logger.info(json.dumps({'message': 'horizon_scan', **{k: v for k, v in summary.items() if k != 'per_query'}}))
+    return summary
+
+
+_scan_state = None
+_scan_state_lock = threading.Lock()
+
+
+def get_scan_state():
+    """Return the process-wide scan state, opening it on first use"""
+    global _scan_state
+
+    if _scan_state is None:
+        with _scan_state_lock:
+            if _scan_state is None:
+                _scan_state = ScanState()
+    return _scan_state
+
+
+def set_scan_state(scan_state):
+    """Swap the process-wide scan state (e.g. for a temporary database)"""
+    global _scan_state
+    _scan_state = scan_state
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--watchlist', default=SCAN_WATCHLIST_FILE, help='JSON watchlist file')
+    parser.add_argument('--concurrency', type=int, default=SCAN_CONCURRENCY)
+    args = parser.parse_args()
+
+    import main  # The HTTP functions module, which imports this one
+    summary = run_scan(main.SCAN_FETCHERS, load_watchlist(args.watchlist), args.concurrency)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
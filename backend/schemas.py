@@ -0,0 +1,72 @@
+"""
+Typed response schemas for the structured-output mode (STRUCTURED_OUTPUT=1)
+Keyed by the same endpoint names as the request configs in gemini_client
+"""
+
+from google.genai import types
+
+SEVERITY_LEVELS = ['critical', 'high', 'medium', 'low']
+
+LOCATION = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        'city': types.Schema(type=types.Type.STRING, description='US city name'),
+        'state': types.Schema(type=types.Type.STRING, description='Two-letter US state code'),
+        'lat': types.Schema(type=types.Type.NUMBER),
+        'lng': types.Schema(type=types.Type.NUMBER),
+    },
+    # Coordinates are optional - the gazetteer fills them in from city/state
+    required=['city', 'state'],
+    property_ordering=['city', 'state', 'lat', 'lng'],
+)
+
+INCIDENT = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        'title': types.Schema(type=types.Type.STRING),
+        'source': types.Schema(type=types.Type.STRING),
+        'date': types.Schema(type=types.Type.STRING, description='YYYY-MM-DD'),
+        'severity': types.Schema(type=types.Type.STRING, enum=SEVERITY_LEVELS),
+        'summary': types.Schema(type=types.Type.STRING),
+        'location': LOCATION,
+        'affected': types.Schema(type=types.Type.INTEGER, minimum=0, description='People affected; 100 if unknown'),
+        'url': types.Schema(type=types.Type.STRING),
+    },
+    required=['title', 'source', 'date', 'severity', 'summary', 'location', 'affected', 'url'],
+    property_ordering=['title', 'source', 'date', 'severity', 'summary', 'location', 'affected', 'url'],
+)
+
+TREND = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        'dma_code': types.Schema(type=types.Type.STRING),
+        'dma_name': types.Schema(type=types.Type.STRING),
+        'location': LOCATION,
+        'query_term': types.Schema(type=types.Type.STRING),
+        'query_volume': types.Schema(type=types.Type.INTEGER, minimum=0, maximum=1000),
+        'trend': types.Schema(type=types.Type.STRING, description='Recent change, e.g. +15%'),
+        'risk': types.Schema(type=types.Type.STRING, enum=SEVERITY_LEVELS),
+        'affected': types.Schema(type=types.Type.INTEGER, minimum=0),
+    },
+    required=['dma_code', 'dma_name', 'location', 'query_term', 'query_volume', 'trend', 'risk', 'affected'],
+    property_ordering=['dma_code', 'dma_name', 'location', 'query_term', 'query_volume', 'trend', 'risk', 'affected'],
+)
+
+
+def _wrapper(key, item):
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={key: types.Schema(type=types.Type.ARRAY, items=item)},
+        required=[key],
+    )
+
+
+# Streaming endpoints get a top-level array, so each element still closes (and is
+# emitted) on its own; the others get the same results/trends wrapper as legacy mode
+RESPONSE_SCHEMAS = {
+    'search': _wrapper('results', INCIDENT),
+    'search_stream': types.Schema(type=types.Type.ARRAY, items=INCIDENT),
+    'search_thinking': _wrapper('results', INCIDENT),
+    'trends': _wrapper('trends', TREND),
+    'trends_stream': types.Schema(type=types.Type.ARRAY, items=TREND),
+}
@@ -0,0 +1,194 @@
+"""
+SSE wire formats
+The default format sends one `data: {json}` frame per event, exactly as
+App.jsx expects. The opt-in compact format (?compact=1) sends a one-time
+header, then result/trend events in batches flushed every SSE_FLUSH_MS, each
+carrying only the fields that changed since the previous event of its type,
+optionally gzip/deflate-compressed with a sync flush after every frame.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import admission
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder is used when orjson is not installed
+    orjson = None
+
+# Compact mode: longest an event waits in a batch, and most events per batch
+SSE_FLUSH_MS = float(os.environ.get('SSE_FLUSH_MS', '50'))
+SSE_BATCH_MAX = int(os.environ.get('SSE_BATCH_MAX', '32'))
+
+# Compress compact streams when the client accepts gzip or deflate
+SSE_COMPRESSION = os.environ.get('SSE_COMPRESSION', '1').lower() in ('1', 'true', 'yes')
+
+COMPACT_VERSION = 1
+
+# Event types batched as deltas in compact mode -> their short codes
+DELTA_TYPES = {'result': 'r', 'trend': 't'}
+
+_compact_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, check_circular=False)
+
+
+def dumps(obj):
+    """Compact JSON text, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return _compact_encoder.encode(obj)
+
+
+def error_event(error, **fields):
+    """The error event ending a failed stream, with retry_after when the instance or upstream quota is saturated"""
+    event = {'type': 'error', **fields, 'error': str(error)}
+    retry_after = admission.retry_after(error)
+    if retry_after is not None:
+        event['retry_after'] = retry_after
+    return event
+
+
+def frame(event):
+    """The default SSE frame for an event"""
+    return f"data: {json.dumps(event)}\n\n"
+
+
+class CompactEncoder:
+    """
+    Turns result/trend events into [code, index, ms, delta(, branch)] entries, where
+    ms is the offset from the header's start time and delta holds the fields
+    that differ from the previous event of that type ("-" lists removed fields)
+    """
+
+    def __init__(self, query=None):
+        self.query = query
+        self.started = time.time()
+        self._previous = {}
+
+    def header(self):
+        return {
+            'type': 'header',
+            'format': 'compact',
+            'version': COMPACT_VERSION,
+            'query': self.query,
+            'started_ms': int(self.started * 1000),
+            'started': datetime.fromtimestamp(self.started).isoformat(),
+            'codes': {code: name for name, code in DELTA_TYPES.items()},
+        }
+
+    def entry(self, event):
+        data = event['data']
+        previous = self._previous.get(event['type'], {})
+        delta = {key: value for key, value in data.items() if key not in previous or previous[key] != value}
+        removed = [key for key in previous if key not in data]
+        if removed:
+            delta['-'] = removed
+        self._previous[event['type']] = data
+        entry = [DELTA_TYPES[event['type']], event.get('index'), int((time.time() - self.started) * 1000), delta]
+        if 'branch' in event:
+            entry.append(event['branch'])
+        return entry
+
+
+def _close(iterator):
+    close = getattr(iterator, 'close', None)
+    if close is not None:
+        close()
+
+
+def _batch_frame(entries):
+    return f"data: {dumps({'type': 'batch', 'events': entries})}\n\n"
+
+
+def _pump(events, pending, stop):
+    """Move events onto a queue from a helper thread, so a batch can flush on time while upstream is quiet"""
+    try:
+        for event in events:
+            pending.put(('event', event))
+            if stop.is_set():
+                break
+        pending.put(('end', None))
+    except Exception as e:
+        pending.put(('error', e))
+    finally:
+        # Closing the event generator here (its own thread) closes its upstream stream
+        _close(events)
+
+
+def render(events, compact=False, query=None, flush_ms=None, batch_max=None):
+    """SSE frames for a generator of event dicts, in the default or compact format"""
+    if not compact:
+        try:
+            for event in events:
+                yield frame(event)
+        finally:
+            _close(events)
+        return
+
+    flush_s = (SSE_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+    batch_max = batch_max or SSE_BATCH_MAX
+    encoder = CompactEncoder(query)
+    pending, stop = queue.Queue(), threading.Event()
+    threading.Thread(target=_pump, args=(events, pending, stop), name='sse-compact', daemon=True).start()
+    batch, flush_at = [], None
+    try:
+        yield f"data: {dumps(encoder.header())}\n\n"
+        while True:
+            try:
+                kind, event = pending.get(timeout=None if flush_at is None else max(0.0, flush_at - time.monotonic()))
+            except queue.Empty:
+                yield _batch_frame(batch)
+                batch, flush_at = [], None
+                continue
+            if kind == 'error':
+                raise event
+            if kind == 'event' and event.get('type') in DELTA_TYPES and 'data' in event:
+                batch.append(encoder.entry(event))
+                flush_at = flush_at or time.monotonic() + flush_s
+                if len(batch) >= batch_max:
+                    yield _batch_frame(batch)
+                    batch, flush_at = [], None
+                continue
+            # Anything else goes out on its own, after the events before it
+            if batch:
+                yield _batch_frame(batch)
+                batch, flush_at = [], None
+            if kind == 'end':
+                return
+            yield f"data: {dumps(event)}\n\n"
+    finally:
+        stop.set()
+
+
+def negotiate(accept_encoding):
+    """gzip or deflate when the client accepts it (and SSE_COMPRESSION is on), else None"""
+    if not SSE_COMPRESSION or not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = params.strip()[2:] if params.strip().startswith('q=') else '1'
+        try:
+            accepted[name.strip().lower()] = float(q)
+        except ValueError:
+            continue
+    for encoding in ('gzip', 'deflate'):
+        if accepted.get(encoding, 0) > 0:
+            return encoding
+    return None
+
+
+def compress(frames, encoding):
+    """gzip/deflate-encode frames as one stream, sync-flushed after each frame so none waits in the compressor"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+    try:
+        for frame in frames:
+            yield compressor.compress(frame.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        _close(frames)
@@ -0,0 +1,17 @@
+"""
+Backend tests run offline: the synthetic model backend and no on-disk stores
+The backend modules are top-level files, so the backend directory goes on sys.path
+"""
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Read at import time by the modules under test
+os.environ.setdefault('MODEL_BACKEND', 'synthetic')
+os.environ.setdefault('CACHE_BACKEND', 'off')
+os.environ.setdefault('EVENT_STORE', 'off')
+os.environ.setdefault('TIMESERIES_STORE', 'off')
+os.environ.setdefault('METRICS_ENABLED', '0')
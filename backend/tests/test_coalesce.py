@@ -0,0 +1,178 @@
+"""
+SingleFlight: leader failure, subscriber disconnect and late joiners after cancellation,
+and requests with mismatched deadlines sharing a query
+"""
+
+import queue
+import threading
+import time
+
+import pytest
+
+import gemini_client
+import main
+from coalesce import FlightCancelled, FlightFailed, SingleFlight
+from model_backend import SyntheticBackend
+
+DONE = object()
+
+
+class FakeProducer:
+    """Producer that yields whatever the test feeds it: an event, an exception to raise, or DONE"""
+
+    def __init__(self):
+        self.items = queue.Queue()
+        self.calls = 0
+        self.closed = threading.Event()
+
+    def feed(self, *items):
+        for item in items:
+            self.items.put(item)
+
+    def __call__(self, cancelled):
+        self.calls += 1
+        try:
+            while True:
+                item = self.items.get(timeout=5)
+                if item is DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.closed.set()
+
+
+def test_subscribers_share_one_producer():
+    flights, producer = SingleFlight(), FakeProducer()
+    leader = flights.stream('key', producer)
+    producer.feed('a')
+    assert next(leader) == 'a'
+    follower = flights.stream('key', producer)
+    producer.feed('b', DONE)
+    assert list(leader) == ['b']
+    # A follower joining mid-stream replays what was already published
+    assert list(follower) == ['a', 'b']
+    assert producer.calls == 1
+
+
+def test_leader_failure_reaches_every_subscriber():
+    flights, producer = SingleFlight(), FakeProducer()
+    leader = flights.stream('key', producer)
+    producer.feed('a')
+    assert next(leader) == 'a'
+    follower = flights.stream('key', producer)
+    producer.feed(RuntimeError('upstream reset'))
+
+    for subscriber, expected in ((leader, []), (follower, ['a'])):
+        received = []
+        with pytest.raises(FlightFailed, match='upstream reset'):
+            for event in subscriber:
+                received.append(event)
+        assert received == expected
+    assert producer.closed.wait(5)
+
+    # The failed flight is unregistered: the next request starts a fresh producer
+    assert not flights.in_flight('key')
+    retry = FakeProducer()
+    retry.feed('c', DONE)
+    assert list(flights.stream('key', retry)) == ['c']
+    assert retry.calls == 1
+
+
+def test_producer_stops_only_when_every_subscriber_leaves():
+    flights, producer = SingleFlight(), FakeProducer()
+    first = flights.stream('key', producer)
+    producer.feed('a')
+    assert next(first) == 'a'
+    second = flights.stream('key', producer)
+    assert next(second) == 'a'
+    flight = flights._flights['key']
+
+    first.close()
+    assert not flight.cancelled.is_set()
+    assert flights.in_flight('key')
+
+    second.close()
+    assert flight.cancelled.is_set()
+    # The producer notices at its next event and is closed
+    producer.feed('b')
+    assert producer.closed.wait(5)
+    assert not flights.in_flight('key')
+
+
+def test_late_joiners_after_cancellation():
+    flights, producer = SingleFlight(), FakeProducer()
+    leader = flights.stream('key', producer)
+    producer.feed('a')
+    assert next(leader) == 'a'
+    cancelled_flight = flights._flights['key']
+    leader.close()
+    assert cancelled_flight.cancelled.is_set()
+
+    # A request arriving after cancellation starts a new flight instead of joining the dying one
+    fresh = FakeProducer()
+    late = flights.stream('key', fresh)
+    fresh.feed('x', DONE)
+    assert list(late) == ['x']
+    assert fresh.calls == 1 and producer.calls == 1
+
+    # One that subscribed to the cancelled flight in the race gets an error, not a short stream
+    raced = cancelled_flight.subscribe()
+    producer.feed('b')
+    received = []
+    with pytest.raises(FlightFailed) as failure:
+        for event in raced:
+            received.append(event)
+    assert isinstance(failure.value.__cause__, FlightCancelled)
+    assert received == ['a', 'b']
+    assert producer.closed.wait(5)
+
+
+@pytest.fixture
+def slow_backend(monkeypatch):
+    backend = SyntheticBackend(results=10, chunk_delay=0.01)
+    monkeypatch.setattr(gemini_client, '_backend', backend)
+    return backend
+
+
+def read_objects(query, deadline, first_read=None):
+    """Collect _cached_stream_objects on a thread; first_read is set once the first object arrives"""
+    received = []
+
+    def read():
+        for obj in main._cached_stream_objects('search_stream', query, deadline=deadline):
+            received.append(obj)
+            if first_read is not None:
+                first_read.set()
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    return thread, received
+
+
+def test_deadline_leader_does_not_cut_followers_short(slow_backend):
+    query = 'deadline leader test'
+    full = list(main._stream_objects('search_stream', query))
+    first_read = threading.Event()
+    leader, led = read_objects(query, time.monotonic() + 0.2, first_read)
+    assert first_read.wait(5)
+    follower, followed = read_objects(query, None)
+    leader.join(10)
+    follower.join(10)
+    assert 0 < len(led) < len(full)
+    assert followed == full
+
+
+def test_deadline_follower_stops_at_its_own_deadline(slow_backend):
+    query = 'deadline follower test'
+    full = list(main._stream_objects('search_stream', query))
+    first_read = threading.Event()
+    leader, led = read_objects(query, None, first_read)
+    assert first_read.wait(5)
+    assert main.stream_flights.in_flight(main.cache_key('search_stream', query))
+    follower, followed = read_objects(query, time.monotonic() + 0.2)
+    follower.join(10)
+    leader.join(10)
+    assert 0 < len(followed) < len(full)
+    assert led == full
@@ -0,0 +1,164 @@
+"""
+The upstream stream is closed within one chunk once a stream endpoint stops early:
+on client disconnect, after max_results and after deadline_ms. With SSE resumption
+on, a disconnected stream is closed when its grace period runs out, even if the
+upstream has stalled.
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask, request
+
+import gemini_client
+import main
+import resume
+from cache import cache_key
+from model_backend import SyntheticBackend
+
+STOP_AFTER = 3
+GRACE_SECONDS = 0.3
+
+
+class ProbeBackend(SyntheticBackend):
+    """Synthetic backend that counts chunks produced and notes when its iterator is closed"""
+
+    produced = 0
+    closed_at = None
+
+    def generate_content_stream(self, endpoint, prompt):
+        self.produced, self.closed_at = 0, None
+        try:
+            for chunk in super().generate_content_stream(endpoint, prompt):
+                self.produced += 1
+                yield chunk
+        finally:
+            self.closed_at = self.produced
+
+
+class StallingBackend(ProbeBackend):
+    """Probe backend that stops sending after stall_after chunks until released"""
+
+    def __init__(self, stall_after, **kwargs):
+        super().__init__(**kwargs)
+        self.stall_after = stall_after
+        self.release = threading.Event()
+
+    def generate_content_stream(self, endpoint, prompt):
+        for i, chunk in enumerate(super().generate_content_stream(endpoint, prompt)):
+            if i == self.stall_after:
+                self.release.wait(10)
+            yield chunk
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(resume, 'SSE_RESUME', False)
+    probe = ProbeBackend(results=50, chunk_delay=0.01)
+    monkeypatch.setattr(gemini_client, '_backend', probe)
+    return probe
+
+
+def stop_stream(backend, query, body, stop_after=None):
+    """Read the stream (until stop_after results), close it, and return (chunks at stop, chunks when closed)"""
+    app = Flask(__name__)
+    with app.test_request_context('/', method='POST', json={'query': query, **body}):
+        response = main.searchHealthTrendsStream(request)
+    results = 0
+    for frame in response.response:
+        results += '"type": "result"' in frame
+        if stop_after is not None and results >= stop_after:
+            break
+    produced_at_stop = backend.produced
+    # What the WSGI server does when the client goes away
+    response.close()
+    waited = time.monotonic()
+    while backend.closed_at is None and time.monotonic() - waited < 10:
+        time.sleep(0.005)
+    assert backend.closed_at is not None, 'upstream stream was never closed'
+    return results, produced_at_stop, backend.closed_at
+
+
+def disconnect(query, stop_after):
+    """Open a stream, read stop_after results and disconnect"""
+    app = Flask(__name__)
+    with app.test_request_context('/', method='POST', json={'query': query}):
+        response = main.searchHealthTrendsStream(request)
+    results = 0
+    for frame in response.response:
+        results += '"type": "result"' in frame
+        if results >= stop_after:
+            break
+    response.close()
+
+
+def resumable_stream(key):
+    return next(stream for stream in resume.registry._streams.values() if stream.key == key)
+
+
+def full_response_chunks(backend, query):
+    return -(-len(backend.render('search_stream', query)) // backend.chunk_size)
+
+
+def test_disconnect_closes_upstream(backend):
+    results, at_stop, closed_at = stop_stream(backend, 'disconnect test', {}, STOP_AFTER)
+    assert results == STOP_AFTER
+    assert closed_at - at_stop <= 1
+    assert closed_at < full_response_chunks(backend, 'disconnect test')
+
+
+def test_max_results_closes_upstream(backend):
+    results, at_stop, closed_at = stop_stream(backend, 'max results test', {'max_results': STOP_AFTER})
+    assert results == STOP_AFTER
+    assert closed_at - at_stop <= 1
+    assert closed_at < full_response_chunks(backend, 'max results test')
+
+
+def test_deadline_closes_upstream(backend):
+    results, at_stop, closed_at = stop_stream(backend, 'deadline test', {'deadline_ms': 200})
+    assert closed_at - at_stop <= 1
+    assert closed_at < full_response_chunks(backend, 'deadline test')
+
+
+@pytest.fixture
+def resumable(monkeypatch):
+    monkeypatch.setattr(resume, 'SSE_RESUME', True)
+    monkeypatch.setattr(resume, 'RESUME_GRACE_SECONDS', GRACE_SECONDS)
+
+
+def test_disconnect_with_resume_closes_upstream_after_grace(backend, resumable):
+    query = 'resumable disconnect test'
+    disconnect(query, STOP_AFTER)
+    stream = resumable_stream(('search_stream', query, False))
+    # Still generating for a client that may come back
+    assert backend.closed_at is None
+    waited = time.monotonic()
+    while backend.closed_at is None and time.monotonic() - waited < GRACE_SECONDS + 2:
+        time.sleep(0.005)
+    assert stream.cancelled
+    assert backend.closed_at is not None, 'upstream stream was never closed'
+    assert backend.closed_at < full_response_chunks(backend, query)
+
+
+def test_stalled_upstream_is_abandoned_after_grace(monkeypatch, resumable):
+    backend = StallingBackend(stall_after=12, results=50)
+    monkeypatch.setattr(gemini_client, '_backend', backend)
+    query = 'stalled disconnect test'
+    disconnect(query, 1)
+    stream = resumable_stream(('search_stream', query, False))
+
+    # No chunk arrives, yet the grace timer cancels the stream and the shared upstream flight
+    waited = time.monotonic()
+    while main.stream_flights.in_flight(cache_key('search_stream', query)) and time.monotonic() - waited < GRACE_SECONDS + 2:
+        time.sleep(0.01)
+    assert stream.cancelled
+    assert not main.stream_flights.in_flight(cache_key('search_stream', query))
+    assert backend.closed_at is None
+
+    # The blocked read cannot be interrupted; the upstream is closed as soon as it returns
+    backend.release.set()
+    waited = time.monotonic()
+    while backend.closed_at is None and time.monotonic() - waited < 2:
+        time.sleep(0.005)
+    assert backend.closed_at is not None and backend.closed_at <= backend.stall_after + 1
@@ -0,0 +1,343 @@
+"""
+Per-(query, DMA) trend time series with incremental anomaly detection
+Every live trends response adds one query_volume point per DMA. Points sit in
+fixed-size NumPy ring buffers, one row per series, and each point updates that
+series' EWMA mean/variance, z-score and two-sided CUSUM in O(1). anomalies()
+flags spiking or dropping markets across every series in one vectorized pass.
+The arrays are saved to an .npz file in the background and reloaded on start.
+"""
+
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from cache import normalize_query
+from event_store import records_of
+
+logger = logging.getLogger(__name__)
+
+TIMESERIES_STORE = os.environ.get('TIMESERIES_STORE', 'disk')  # disk | memory | off
+TIMESERIES_PATH = os.environ.get('TIMESERIES_PATH', os.path.join(tempfile.gettempdir(), 'fda-horizon-trends.npz'))
+
+# Points kept per series (104 weekly points = two years), and series kept in all
+TIMESERIES_CAPACITY = int(os.environ.get('TIMESERIES_CAPACITY', '104'))
+TIMESERIES_MAX_SERIES = int(os.environ.get('TIMESERIES_MAX_SERIES', '20000'))
+
+# A point this soon after a series' previous one is skipped (repeat queries are not new observations)
+TIMESERIES_MIN_INTERVAL_SECONDS = float(os.environ.get('TIMESERIES_MIN_INTERVAL_SECONDS', '3600'))
+
+# How often unsaved points are written to TIMESERIES_PATH
+TIMESERIES_FLUSH_SECONDS = float(os.environ.get('TIMESERIES_FLUSH_SECONDS', '30'))
+
+# EWMA smoothing, |z| that flags a point, CUSUM slack and decision interval (in standard deviations)
+EWMA_ALPHA = float(os.environ.get('EWMA_ALPHA', '0.1'))
+ANOMALY_Z = float(os.environ.get('ANOMALY_Z', '3.5'))
+CUSUM_K = float(os.environ.get('CUSUM_K', '0.5'))
+CUSUM_H = float(os.environ.get('CUSUM_H', '8.0'))
+
+# Points a series needs before it can be flagged
+ANOMALY_MIN_POINTS = int(os.environ.get('ANOMALY_MIN_POINTS', '4'))
+
+# Floor on the standard deviation (query_volume units, 0-1000), so a flat series does not turn a small move into a huge z
+ANOMALY_MIN_STD = float(os.environ.get('ANOMALY_MIN_STD', '10'))
+
+# Endpoints whose responses carry DMA trend records
+TREND_ENDPOINTS = ('trends', 'trends_stream')
+
+# Per-series rolling statistics, one float64 array each
+STATS = ('mean', 'var', 'z', 'cusum_pos', 'cusum_neg')
+
+INITIAL_ROWS = 64
+
+
+def _volume(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        try:
+            return float(value.replace(',', '').strip())
+        except ValueError:
+            return None
+    return None
+
+
+class SeriesStore:
+    """
+    Ring buffers of (time, value) points and rolling statistics for up to
+    max_series series, keyed by (normalized query, DMA code). Rows are grown
+    by doubling; a full store drops new series rather than evicting old ones.
+    """
+
+    def __init__(self, path=None, capacity=TIMESERIES_CAPACITY, max_series=TIMESERIES_MAX_SERIES,
+                 min_interval=TIMESERIES_MIN_INTERVAL_SECONDS, alpha=EWMA_ALPHA, flush_seconds=TIMESERIES_FLUSH_SECONDS):
+        self.path = path
+        self.capacity = capacity
+        self.max_series = max_series
+        self.min_interval = min_interval
+        self.alpha = alpha
+        self.flush_seconds = flush_seconds
+        self.skipped = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._rows = {}
+        self.keys = []
+        self.dma_names = []
+        self._allocate(INITIAL_ROWS)
+        if path and os.path.exists(path):
+            self._load(path)
+        if path:
+            threading.Thread(target=self._flush_loop, name="timeseries-writer", daemon=True).start()
+
+    def _allocate(self, rows):
+        self.times = np.zeros((rows, self.capacity), dtype=np.float64)
+        self.values = np.zeros((rows, self.capacity), dtype=np.float32)
+        self.count = np.zeros(rows, dtype=np.int32)
+        self.head = np.zeros(rows, dtype=np.int32)
+        self.stats = {name: np.zeros(rows, dtype=np.float64) for name in STATS}
+
+    def _grow(self):
+        rows = min(len(self.count) * 2, self.max_series)
+        extra = rows - len(self.count)
+        self.times = np.concatenate([self.times, np.zeros((extra, self.capacity), dtype=np.float64)])
+        self.values = np.concatenate([self.values, np.zeros((extra, self.capacity), dtype=np.float32)])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int32)])
+        self.head = np.concatenate([self.head, np.zeros(extra, dtype=np.int32)])
+        self.stats = {name: np.concatenate([array, np.zeros(extra, dtype=np.float64)])
+                      for name, array in self.stats.items()}
+
+    def _row(self, key, dma_name):
+        row = self._rows.get(key)
+        if row is None:
+            if len(self.keys) >= self.max_series:
+                return None
+            if len(self.keys) == len(self.count):
+                self._grow()
+            row = self._rows[key] = len(self.keys)
+            self.keys.append(key)
+            self.dma_names.append(dma_name)
+        elif dma_name and not self.dma_names[row]:
+            self.dma_names[row] = dma_name
+        return row
+
+    def __len__(self):
+        return len(self.keys)
+
+    def observe(self, endpoint, query, obj, now=None):
+        """Add a point per DMA trend record in a parsed trends object"""
+        if endpoint not in TREND_ENDPOINTS:
+            return
+        now = time.time() if now is None else now
+        for record in records_of(obj):
+            if record.get('dma_code') is None:
+                continue
+            value = _volume(record.get('query_volume'))
+            if value is not None:
+                self.add(query, str(record['dma_code']).strip(), value, now, record.get('dma_name') or '')
+
+    def add(self, query, dma_code, value, at, dma_name=''):
+        """
+        Append one point and update the series' statistics in O(1). The z-score
+        is taken against the EWMA mean/variance before this point; CUSUM
+        accumulates z beyond CUSUM_K in each direction. Returns False when skipped.
+        """
+        with self._lock:
+            row = self._row((normalize_query(query), dma_code), dma_name)
+            if row is None:
+                self.dropped += 1
+                return False
+            count = int(self.count[row])
+            if count and at - self.times[row, (self.head[row] - 1) % self.capacity] < self.min_interval:
+                self.skipped += 1
+                return False
+
+            head = int(self.head[row])
+            self.times[row, head] = at
+            self.values[row, head] = value
+            self.head[row] = (head + 1) % self.capacity
+            self.count[row] = min(count + 1, self.capacity)
+
+            stats = self.stats
+            if count == 0:
+                stats['mean'][row], stats['var'][row], stats['z'][row] = value, 0.0, 0.0
+            else:
+                mean, var = stats['mean'][row], stats['var'][row]
+                diff = value - mean
+                z = diff / max(math.sqrt(var), ANOMALY_MIN_STD)
+                increment = self.alpha * diff
+                stats['mean'][row] = mean + increment
+                stats['var'][row] = (1 - self.alpha) * (var + diff * increment)
+                stats['z'][row] = z
+                stats['cusum_pos'][row] = max(0.0, stats['cusum_pos'][row] + z - CUSUM_K)
+                stats['cusum_neg'][row] = max(0.0, stats['cusum_neg'][row] - z - CUSUM_K)
+            self._dirty = True
+            return True
+
+    def anomalies(self, query=None, dma_code=None, points=26, only_anomalies=False,
+                  z_threshold=ANOMALY_Z, cusum_threshold=CUSUM_H, min_points=ANOMALY_MIN_POINTS):
+        """
+        Series (most anomalous first) with their last `points` points, statistics
+        and an `anomaly` of "spike", "drop" or None, flagged over all series at once
+        """
+        with self._lock:
+            n = len(self.keys)
+            rows = np.arange(n)
+            if query is not None or dma_code is not None:
+                wanted = normalize_query(query) if query is not None else None
+                rows = np.array([row for row, key in enumerate(self.keys)
+                                 if (wanted is None or key[0] == wanted) and (dma_code is None or key[1] == str(dma_code))],
+                                dtype=np.int64)
+            count = self.count[rows]
+            stats = {name: array[rows] for name, array in self.stats.items()}
+
+            # Flags for every selected series in one pass
+            ready = count >= min_points
+            spike = ready & ((stats['z'] >= z_threshold) | (stats['cusum_pos'] >= cusum_threshold))
+            drop = ready & ~spike & ((stats['z'] <= -z_threshold) | (stats['cusum_neg'] >= cusum_threshold))
+
+            # The last `points` slots of each ring, oldest first
+            points = max(1, min(int(points), self.capacity))
+            slots = (self.head[rows, None] - points + np.arange(points)) % self.capacity
+            window_times = self.times[rows[:, None], slots]
+            window_values = self.values[rows[:, None], slots]
+            keys = [self.keys[row] for row in rows]
+            dma_names = [self.dma_names[row] for row in rows]
+
+        score = np.maximum(np.abs(stats['z']), np.maximum(stats['cusum_pos'], stats['cusum_neg']))
+        order = np.argsort(-np.where(spike | drop, score + 1e9, score), kind='stable')
+        if only_anomalies:
+            order = order[(spike | drop)[order]]
+        # Point times as ISO strings (UTC) and values for the returned series, converted in bulk
+        stamps = np.datetime_as_string(window_times[order].astype('datetime64[s]'), timezone='UTC').tolist()
+        volumes = window_values[order].tolist()
+        series = []
+        for position, i in enumerate(order.tolist()):
+            kept = min(int(count[i]), points)
+            series.append({
+                'query': keys[i][0],
+                'dma_code': keys[i][1],
+                'dma_name': dma_names[i],
+                'anomaly': 'spike' if spike[i] else 'drop' if drop[i] else None,
+                'points': list(zip(stamps[position][points - kept:], volumes[position][points - kept:])),
+                'count': int(count[i]),
+                'ewma': round(float(stats['mean'][i]), 2),
+                'std': round(math.sqrt(float(stats['var'][i])), 2),
+                'z': round(float(stats['z'][i]), 2),
+                'cusum_pos': round(float(stats['cusum_pos'][i]), 2),
+                'cusum_neg': round(float(stats['cusum_neg'][i]), 2),
+            })
+        return {
+            'series': series,
+            'series_total': int(len(rows)),
+            'anomalies': int(spike.sum() + drop.sum()),
+            'thresholds': {'z': z_threshold, 'cusum': cusum_threshold, 'cusum_k': CUSUM_K,
+                           'ewma_alpha': self.alpha, 'min_points': min_points},
+        }
+
+    def save(self, path=None):
+        """Write every series to an .npz file (atomically replaced)"""
+        path = path or self.path
+        with self._lock:
+            n = len(self.keys)
+            arrays = {
+                'queries': np.array([key[0] for key in self.keys], dtype=str),
+                'dma_codes': np.array([key[1] for key in self.keys], dtype=str),
+                'dma_names': np.array(self.dma_names, dtype=str),
+                'times': self.times[:n].copy(),
+                'values': self.values[:n].copy(),
+                'count': self.count[:n].copy(),
+                'head': self.head[:n].copy(),
+                **{f"stat_{name}": array[:n].copy() for name, array in self.stats.items()},
+            }
+            self._dirty = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        partial = f"{path}.partial.npz"
+        np.savez(partial, **arrays)
+        os.replace(partial, path)
+
+    def _load(self, path):
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                if saved['values'].shape[1] != self.capacity:
+                    logger.warning(f"Ignoring saved series in {path}: capacity {saved['values'].shape[1]} != {self.capacity}")
+                    return
+                n = min(len(saved['count']), self.max_series)
+                rows = INITIAL_ROWS
+                while rows < n:
+                    rows *= 2
+                self._allocate(min(rows, self.max_series) if n else INITIAL_ROWS)
+                self.times[:n], self.values[:n] = saved['times'][:n], saved['values'][:n]
+                self.count[:n], self.head[:n] = saved['count'][:n], saved['head'][:n]
+                for name in STATS:
+                    self.stats[name][:n] = saved[f"stat_{name}"][:n]
+                self.keys = list(zip(saved['queries'][:n].tolist(), saved['dma_codes'][:n].tolist()))
+                self.dma_names = saved['dma_names'][:n].tolist()
+                self._rows = {key: row for row, key in enumerate(self.keys)}
+            logger.info(f"Loaded {n} trend series from {path}")
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Could not load trend series from {path}: {e}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            if self._dirty:
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.error(f"Saving trend series to {self.path} failed: {e}")
+
+    def flush(self):
+        """Write unsaved points now"""
+        if self.path and self._dirty:
+            self.save()
+
+
+class NullSeriesStore:
+    """Series store that keeps nothing (TIMESERIES_STORE=off)"""
+
+    def observe(self, endpoint, query, obj, now=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def anomalies(self, query=None, dma_code=None, points=26, only_anomalies=False, **thresholds):
+        return {'series': [], 'series_total': 0, 'anomalies': 0, 'thresholds': {}}
+
+    def __len__(self):
+        return 0
+
+
+def create_series_store(backend_name=TIMESERIES_STORE):
+    if backend_name == 'off':
+        return NullSeriesStore()
+    return SeriesStore(TIMESERIES_PATH if backend_name == 'disk' else None)
+
+
+_series_store = None
+_series_store_lock = threading.Lock()
+
+
+def get_series_store():
+    """Return the process-wide series store, loading saved series on first use"""
+    global _series_store
+
+    if _series_store is None:
+        with _series_store_lock:
+            if _series_store is None:
+                _series_store = create_series_store()
+    return _series_store
+
+
+def set_series_store(series_store):
+    """Swap the process-wide series store (e.g. for an in-memory one)"""
+    global _series_store
+    _series_store = series_store
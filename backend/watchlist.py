@@ -0,0 +1,143 @@
+"""
+Batch watchlist runner
+Runs a list of standing queries against the JSON search/trends pipelines with
+bounded concurrency and a shared token bucket, yielding one NDJSON-ready dict
+per query as each finishes - a slow or failing query never holds up the others
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+from cache import get_query_cache
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_MAX_QUERIES = int(os.environ.get('WATCHLIST_MAX_QUERIES', '200'))
+
+# Queries run at once per batch (default, and the most a request may ask for)
+WATCHLIST_CONCURRENCY = int(os.environ.get('WATCHLIST_CONCURRENCY', '8'))
+WATCHLIST_MAX_CONCURRENCY = int(os.environ.get('WATCHLIST_MAX_CONCURRENCY', '32'))
+
+# Upstream Gemini calls per second across all batches on this instance (0 = unlimited)
+WATCHLIST_RATE_PER_SECOND = float(os.environ.get('WATCHLIST_RATE_PER_SECOND', '5'))
+WATCHLIST_BURST = float(os.environ.get('WATCHLIST_BURST', '10'))
+
+# A query not finished this long after it started is reported as timed out
+WATCHLIST_QUERY_TIMEOUT_SECONDS = float(os.environ.get('WATCHLIST_QUERY_TIMEOUT_SECONDS', '90'))
+
+# Watchlist kinds -> cache endpoint of the pipeline that answers them
+KINDS = {
+    'search': 'search',
+    'trends': 'trends',
+}
+
+upstream_bucket = TokenBucket(WATCHLIST_RATE_PER_SECOND, WATCHLIST_BURST)
+
+
+def parse_items(items, default_kind='search'):
+    """
+    Normalize a request's queries - strings or {"query", "type"} objects - into
+    (query, kind) pairs, raising ValueError for anything unusable
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('Expected a non-empty "queries" list')
+    if len(items) > WATCHLIST_MAX_QUERIES:
+        raise ValueError(f"At most {WATCHLIST_MAX_QUERIES} queries per batch")
+
+    parsed = []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            item = {'query': item}
+        if not isinstance(item, dict) or not isinstance(item.get('query'), str) or not item['query'].strip():
+            raise ValueError(f"Query {i} needs a non-empty query string")
+        kind = item.get('type') or default_kind
+        if kind not in KINDS:
+            raise ValueError(f"Query {i} has unknown type {kind!r}; expected one of {', '.join(KINDS)}")
+        parsed.append((item['query'].strip(), kind))
+    return parsed
+
+
+def run_watchlist(items, fetchers, concurrency=WATCHLIST_CONCURRENCY, bucket=None,
+                  query_timeout=WATCHLIST_QUERY_TIMEOUT_SECONDS, cache_aware=True):
+    """
+    Run (query, kind) items with fetchers[kind](query) -> records, yielding a
+    status line per query in completion order and a final summary line.
+    Each query takes a token from bucket (the process-wide upstream_bucket unless
+    one is given) - except, when cache_aware, those a fresh cache entry will answer.
+    """
+    bucket = bucket or upstream_bucket
+    batch_start = time.perf_counter()
+    started = {}
+    started_lock = threading.Lock()
+
+    def run(index, query, kind):
+        cached_value, fresh = get_query_cache().lookup(KINDS[kind], query) if cache_aware else (None, False)
+        if cached_value is None or not fresh:
+            bucket.acquire()
+        with started_lock:
+            started[index] = time.perf_counter()
+        return fetchers[kind](query)
+
+    def line(index, status, **fields):
+        query, kind = items[index]
+        now = time.perf_counter()
+        began = started.get(index)
+        return {
+            'type': 'query',
+            'index': index,
+            'query': query,
+            'query_type': kind,
+            'status': status,
+            # Time spent waiting for a worker and a rate-limit token, then running
+            'wait_s': round((began if began is not None else now) - batch_start, 4),
+            'elapsed_s': round(now - began, 4) if began is not None else None,
+            **fields,
+        }
+
+    concurrency = max(1, min(int(concurrency), WATCHLIST_MAX_CONCURRENCY, len(items)))
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='watchlist')
+    statuses = {'ok': 0, 'empty': 0, 'error': 0, 'timeout': 0}
+    try:
+        pending = {executor.submit(run, i, query, kind): i for i, (query, kind) in enumerate(items)}
+        while pending:
+            # Wake for the next completion or the nearest deadline of a running query
+            deadlines = [started[i] + query_timeout for i in pending.values() if i in started]
+            timeout = min([1.0] + [d - time.perf_counter() for d in deadlines])
+            done, _ = concurrent.futures.wait(pending, timeout=max(0.01, timeout),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    records = future.result()
+                except Exception as e:
+                    logger.error(f"Watchlist query {index} failed: {e}")
+                    result = line(index, 'error', error=str(e))
+                else:
+                    records = records or []
+                    result = line(index, 'ok' if records else 'empty', count=len(records), results=records)
+                statuses[result['status']] += 1
+                yield result
+
+            # Stop waiting for queries past their deadline; their workers finish in the background
+            now = time.perf_counter()
+            for future, index in list(pending.items()):
+                began = started.get(index)
+                if began is not None and now - began > query_timeout:
+                    del pending[future]
+                    statuses['timeout'] += 1
+                    yield line(index, 'timeout', error=f"No answer after {query_timeout:g}s")
+    finally:
+        # Queued queries are dropped if the client goes away; running ones cannot be interrupted
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    yield {
+        'type': 'summary',
+        'total': len(items),
+        **statuses,
+        'concurrency': concurrency,
+        'elapsed_s': round(time.perf_counter() - batch_start, 4),
+    }